@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""""
+Created on 18.10.26
+Compiles output of morphological analyzer (ma -F -m -n) for given words into a binary lexicon, that can be used by
+namegen instead of the analyzer (see MA_LEXICON in namegen_config.ini).
+
+Arguments:
+    1. path to the morphological analyzer script (e.g. data/languages/cs/ma.sh or ma_mock/ma.py)
+    2. path to file with words (one word per line)
+    3. path where the lexicon will be saved
+        Example:
+            data/languages/cs/lexicon.bin
+:author:     Martin Dočekal
+"""
+import sys
+
+from namegenPack.morpho.MALexicon import MALexicon
+from namegenPack.morpho.MorphoAnalyzer import MACoprocess, MAOutputReader
+
+BATCH_SIZE = 10000
+
+with open(sys.argv[2], "r") as f:
+    words = sorted(set(w for w in (line.strip() for line in f) if len(w) > 0))
+
+ma = MACoprocess(sys.argv[1])
+records = []
+try:
+    for offset in range(0, len(words), BATCH_SIZE):
+        records.extend(MAOutputReader(ma.request(words[offset:offset + BATCH_SIZE])))
+        print(f"{min(offset + BATCH_SIZE, len(words))}/{len(words)}", file=sys.stderr)
+finally:
+    ma.close()
+
+MALexicon.write(sys.argv[3], records)
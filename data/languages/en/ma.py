@@ -0,0 +1,16 @@
+# -*- coding: UTF-8 -*-
+""""
+Created on 18.10.26
+Morfologický analyzátor pro MA_BACKEND=python. Zpřístupňuje ma_mock jako modul (viz ma.sh).
+
+:author:     Martin Dočekal
+"""
+import importlib.util
+import os
+
+_spec = importlib.util.spec_from_file_location(
+    "ma_mock", os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "..", "ma_mock", "ma.py"))
+_module = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_module)
+
+analyze = _module.analyze
@@ -1,3 +1,3 @@
 #!/bin/bash
 DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
-$DIR/../../../ma_mock/ma.py
\ No newline at end of file
+$DIR/../../../ma_mock/ma.py "$@"
\ No newline at end of file
@@ -7,7 +7,7 @@ Mockup of ma.
 """
 import os
 import sys
-from typing import Set
+from typing import Set, Dict, List, Optional, Tuple
 
 DICT_FOLDER = os.path.join(os.path.dirname(os.path.realpath(__file__)), "dictionaries")
 
@@ -24,59 +24,98 @@ def loadSet(pathTo: str) -> Set[str]:
         return set(x.strip().lower() for x in f)
 
 
-def main():
-    femaleNames = loadSet(os.path.join(DICT_FOLDER, "names_female.txt"))
-    maleNames = loadSet(os.path.join(DICT_FOLDER, "names_male.txt"))
-    determiners = loadSet(os.path.join(DICT_FOLDER, "determiners.txt"))
-    prepositions = loadSet(os.path.join(DICT_FOLDER, "prepositions.txt"))
-    conjunctions = loadSet(os.path.join(DICT_FOLDER, "conjunctions.txt"))
-    adjectives = loadSet(os.path.join(DICT_FOLDER, "adjectives.txt"))
+_dictionaries = None
+
+
+def dictionaries() -> Dict[str, Set[str]]:
+    """
+    Loads the dictionaries. They are loaded only once.
+
+    :return: name of dictionary -> its words
+    """
+    global _dictionaries
+
+    if _dictionaries is None:
+        _dictionaries = {name: loadSet(os.path.join(DICT_FOLDER, name + ".txt")) for name in
+                         ["names_female", "names_male", "determiners", "prepositions", "conjunctions", "adjectives"]}
+
+    return _dictionaries
+
+
+def analyze(word: str) -> Optional[List[Tuple[str, str, List[str], List[Tuple[str, str]]]]]:
+    """
+    Analyzes given word. This is the in-process interface of the mock (see MA_BACKEND=python in namegen_config.ini).
+
+    :param word: Word for analysis.
+    :return: Groups as (word, lemma, tags, forms), where forms are pairs (tag, form). None for unknown word.
+    """
+
+    word = word.strip()
+    if len(word) == 0:
+        return None
+
+    d = dictionaries()
+    wordLower = word.lower()
+    possibleG = {"M", "F"}
+    note = ""
+
+    if (wordLower in d["names_female"]) or (wordLower in d["names_male"]):
+
+        note = ";jG"
+
+        if (wordLower in d["names_female"]) != (wordLower in d["names_male"]):  # XOR
+            # 00
+            #   we know nothing about the gender let's put both of them
+            # 01
+            #   the word is male gender
+            # 10
+            #   the word is female gender
+            # 11
+            #   the word is G and M
+
+            if wordLower in d["names_female"]:
+                possibleG = {"F"}
 
-    for word in sys.stdin:
-        word = word.strip()
-        wordLower = word.lower()
-        if len(word) > 0:
-            possibleG = {"M", "F"}
-            note = ""
-
-            if (wordLower in femaleNames) or (wordLower in maleNames):
-
-                note = ";jG"
-
-                if (wordLower in femaleNames) != (wordLower in maleNames):  # XOR
-                    # 00
-                    #   we know nothing about the gender let's put both of them
-                    # 01
-                    #   the word is male gender
-                    # 10
-                    #   the word is female gender
-                    # 11
-                    #   the word is G and M
-
-                    if wordLower in femaleNames:
-                        possibleG = {"F"}
-
-                    else:
-                        possibleG = {"M"}
-
-            if wordLower in determiners:
-                k = "D"
-            elif wordLower in prepositions:
-                k = "7"
-            elif wordLower in conjunctions:
-                k = "8"
-            elif wordLower in adjectives:
-                k = "2"
             else:
-                k = "1"
+                possibleG = {"M"}
 
-            print("ma>", end="")
+    if wordLower in d["determiners"]:
+        k = "D"
+    elif wordLower in d["prepositions"]:
+        k = "7"
+    elif wordLower in d["conjunctions"]:
+        k = "8"
+    elif wordLower in d["adjectives"]:
+        k = "2"
+    else:
+        k = "1"
 
-            for g in possibleG:
-                print(f"<s> {word}")
-                print(f"  <l>{word}")
-                print(f"  <c>k{k}g{g}c1{note}")
-                print(f"  <f>[k{k}g{g}c1{note}] {word}")
+    groups = []
+    for g in possibleG:
+        tag = f"k{k}g{g}c1{note}"
+        groups.append((word, word, [tag], [(tag, word)]))
+
+    return groups
+
+
+def main():
+    printForms = "-F" in sys.argv[1:]  # as the ma, prints the forms only with -F
+
+    for word in sys.stdin:
+        groups = analyze(word)
+        if groups is None:
+            continue
+
+        print("ma>", end="")
+
+        for w, lemma, tags, forms in groups:
+            print(f"<s> {w}")
+            print(f"  <l>{lemma}")
+            for t in tags:
+                print(f"  <c>{t}")
+            if printForms:
+                for t, f in forms:
+                    print(f"  <f>[{t}] {f}")
 
 
 if __name__ == "__main__":
@@ -16,6 +16,7 @@ import time
 import traceback
 from argparse import ArgumentParser
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
 from typing import Any
 
@@ -25,7 +26,7 @@ import namegenPack.Grammar
 import namegenPack.morpho.MorphCategories
 import namegenPack.morpho.MorphoAnalyzer
 from namegenPack import Grammar
-from namegenPack.Filters import NamesFilter, NamesGrammarFilter
+from namegenPack.Filters import NamesFilter, NamesGrammarFilter, NameScriptFilter
 from namegenPack.Generators import GenerateAbbreFormOfPrep, GenerateNope
 from namegenPack.Language import Language
 from namegenPack.Name import *
@@ -104,6 +105,13 @@ class ConfigManager(object):
                 self.configParser[self.sectionDefault]["ALLOW_PRIORITY_FILTRATION"].lower() == "true"
         }
 
+        result["CACHE_SIZE"] = self.__transformCacheSize("CACHE_SIZE", None)
+
+        # velikosti jednotlivých cache, pokud nejsou uvedeny, přebírají hodnotu CACHE_SIZE
+        for cacheSizeKey in ("MATCH_CACHE_SIZE", "TABLE_CACHE_SIZE", "MATCH_BITS_CACHE_SIZE",
+                             "SCRIPT_FILTER_CACHE_SIZE"):
+            result[cacheSizeKey] = self.__transformCacheSize(cacheSizeKey, result["CACHE_SIZE"])
+
         # nastavení locale
         if self.configParser[self.sectionDefault]["LC_ALL"]:
             try:
@@ -115,6 +123,55 @@ class ConfigManager(object):
                     self.configParser[self.sectionDefault]["LC_ALL"])
         return result
 
+    def __transformCacheSize(self, key: str, default: Optional[int]) -> Optional[int]:
+        """
+        Převede a validuje velikost cache ze sekce DEFAULT.
+
+        :param key: Klíč hodnoty velikosti cache.
+        :type key: str
+        :param default: Velikost použitá v případě, že hodnota chybí nebo je prázdná.
+        :type default: Optional[int]
+        :return: Maximální počet položek cache. None -> neomezeno.
+        :rtype: Optional[int]
+        :raise ConfigManagerInvalidException: Pokud je hodnota nevalidní.
+        """
+        if not self.configParser[self.sectionDefault].get(key, ""):
+            return default
+
+        return self.__transformPositiveInt(self.sectionDefault, key)
+
+    def __transformPositiveInt(self, section: str, key: str, allowNone: bool = True) -> Optional[int]:
+        """
+        Převede a validuje hodnotu, která má být kladným celým číslem, nebo None.
+
+        :param section: Sekce konfigurace.
+        :type section: str
+        :param key: Klíč hodnoty.
+        :type key: str
+        :param allowNone: True -> hodnota None je povolena a převedena na None.
+        :type allowNone: bool
+        :return: Převedená hodnota.
+        :rtype: Optional[int]
+        :raise ConfigManagerInvalidException: Pokud je hodnota nevalidní.
+        """
+        value = self.configParser[section][key]
+
+        if allowNone and value.upper() == "NONE":
+            return None
+
+        try:
+            res = int(value)
+            if res <= 0:
+                raise ValueError
+        except ValueError:
+            # Nevalidní hodnota.
+
+            raise ConfigManagerInvalidException(
+                Errors.ErrorMessenger.CODE_INVALID_CONFIG,
+                "Nevalidní konfigurační soubor. " + section + "/" + key + ": " + value)
+
+        return res
+
     def __transformFilters(self):
         """
         Převede hodnoty pro FILTERS a validuje je.
@@ -190,8 +247,21 @@ class ConfigManager(object):
                                                  "PARSE_UNKNOWN_ANALYZE"].lower() == "true" else False,
             "PARSE_UNKNOWN_ANALYZE_TERMINAL_MATCH": set(),
             "TIMEOUT": None,
+            "PARSER": self.configParser[self.sectionGrammar]["PARSER"].lower(),
+            "MEMOIZE": self.configParser[self.sectionGrammar]["MEMOIZE"].lower() == "true",
+            "PRIORITY_PRUNING": self.configParser[self.sectionGrammar]["PRIORITY_PRUNING"].lower() == "true",
+            "MAX_DERIVATIONS": None,
+            "MAX_STEPS": None,
+            "PRECOMPUTE_MATCHES": self.configParser[self.sectionGrammar]["PRECOMPUTE_MATCHES"].lower() == "true",
+            "TIMEOUT_CHECK_STEPS": None,
         }
 
+        if result["PARSER"] not in namegenPack.Grammar.Grammar.PARSERS:
+            raise ConfigManagerInvalidException(
+                Errors.ErrorMessenger.CODE_INVALID_CONFIG,
+                "Nevalidní konfigurační soubor. " + self.sectionGrammar + "/PARSER: " +
+                self.configParser[self.sectionGrammar]["PARSER"])
+
         if result["PARSE_UNKNOWN_ANALYZE"]:
 
             for t in self.configParser[self.sectionGrammar]["PARSE_UNKNOWN_ANALYZE_TERMINAL_MATCH"].split():
@@ -216,6 +286,11 @@ class ConfigManager(object):
                 Errors.ErrorMessenger.CODE_INVALID_CONFIG,
                 "Nevalidní konfigurační soubor. " + self.sectionGrammar + "/TIMEOUT: " +
                 self.configParser[self.sectionGrammar]["TIMEOUT"])
+
+        result["MAX_DERIVATIONS"] = self.__transformPositiveInt(self.sectionGrammar, "MAX_DERIVATIONS")
+        result["MAX_STEPS"] = self.__transformPositiveInt(self.sectionGrammar, "MAX_STEPS")
+        result["TIMEOUT_CHECK_STEPS"] = self.__transformPositiveInt(self.sectionGrammar, "TIMEOUT_CHECK_STEPS",
+                                                                    allowNone=False)
         return result
 
     def __transformDataFiles(self):
@@ -234,9 +309,39 @@ class ConfigManager(object):
             "TITLES": self.configParser[self.sectionDataFiles]["TITLES"],
             "EQ_GEN": self.configParser[self.sectionDataFiles]["EQ_GEN"],
             "MA": self.configParser[self.sectionDataFiles]["MA"],
+            "MA_CACHE": None,
+            "GRAMMAR_CACHE": None,
+            "MA_WORKERS": 1,
+            "MA_ON_DEMAND": self.configParser[self.sectionDataFiles]["MA_ON_DEMAND"].lower() == "true",
+            "MA_LAZY_FORMS": self.configParser[self.sectionDataFiles]["MA_LAZY_FORMS"].lower() == "true",
+            "MA_PROJECTION": self.configParser[self.sectionDataFiles]["MA_PROJECTION"].lower() == "true",
+            "MA_BACKEND": self.configParser[self.sectionDataFiles]["MA_BACKEND"],
+            "MA_LEXICON": self.configParser[self.sectionDataFiles]["MA_LEXICON"] or None,
+            "MA_MODULE": self.configParser[self.sectionDataFiles]["MA_MODULE"] or None,
             "LANGUAGES_DIRECTORY": self.__makePath(self.configParser[self.sectionDataFiles]["LANGUAGES"])
         }
 
+        if self.configParser[self.sectionDataFiles]["MA_CACHE"]:
+            result["MA_CACHE"] = self.__makePath(self.configParser[self.sectionDataFiles]["MA_CACHE"])
+
+        if self.configParser[self.sectionDataFiles]["GRAMMAR_CACHE"]:
+            result["GRAMMAR_CACHE"] = self.__makePath(self.configParser[self.sectionDataFiles]["GRAMMAR_CACHE"])
+
+        try:
+            result["MA_WORKERS"] = int(self.configParser[self.sectionDataFiles]["MA_WORKERS"])
+            if result["MA_WORKERS"] <= 0:
+                raise ValueError
+        except ValueError:
+            raise ConfigManagerInvalidException(
+                Errors.ErrorMessenger.CODE_INVALID_CONFIG,
+                "Nevalidní konfigurační soubor. " + self.sectionDataFiles + "/MA_WORKERS: " +
+                self.configParser[self.sectionDataFiles]["MA_WORKERS"])
+
+        if result["MA_BACKEND"] not in Language.MA_BACKENDS:
+            raise ConfigManagerInvalidException(
+                Errors.ErrorMessenger.CODE_INVALID_CONFIG,
+                "Nevalidní konfigurační soubor. " + self.sectionDataFiles + "/MA_BACKEND: " + result["MA_BACKEND"])
+
         return result
 
     def __loadPathArguments(self, parConf, result):
@@ -599,7 +704,23 @@ def langLoad(configAll: Dict) -> Dict[str, Language]:
                                titles=configAll[ConfigManager.sectionDataFiles]["TITLES"],
                                eqGen=configAll[ConfigManager.sectionDataFiles]["EQ_GEN"],
                                ma=configAll[ConfigManager.sectionDataFiles]["MA"],
-                               gTimeout=configAll[ConfigManager.sectionGrammar]["TIMEOUT"])
+                               gTimeout=configAll[ConfigManager.sectionGrammar]["TIMEOUT"],
+                               maCache=configAll[ConfigManager.sectionDataFiles]["MA_CACHE"],
+                               maWorkers=configAll[ConfigManager.sectionDataFiles]["MA_WORKERS"],
+                               maOnDemand=configAll[ConfigManager.sectionDataFiles]["MA_ON_DEMAND"],
+                               maLazyForms=configAll[ConfigManager.sectionDataFiles]["MA_LAZY_FORMS"],
+                               maProjection=configAll[ConfigManager.sectionDataFiles]["MA_PROJECTION"],
+                               maBackend=configAll[ConfigManager.sectionDataFiles]["MA_BACKEND"],
+                               maLexicon=configAll[ConfigManager.sectionDataFiles]["MA_LEXICON"],
+                               maModule=configAll[ConfigManager.sectionDataFiles]["MA_MODULE"],
+                               grammarCache=configAll[ConfigManager.sectionDataFiles]["GRAMMAR_CACHE"],
+                               gParser=configAll[ConfigManager.sectionGrammar]["PARSER"],
+                               gMemoize=configAll[ConfigManager.sectionGrammar]["MEMOIZE"],
+                               gPriorityPruning=configAll[ConfigManager.sectionDefault]["ALLOW_PRIORITY_FILTRATION"]
+                               and configAll[ConfigManager.sectionGrammar]["PRIORITY_PRUNING"],
+                               gMaxDerivations=configAll[ConfigManager.sectionGrammar]["MAX_DERIVATIONS"],
+                               gMaxSteps=configAll[ConfigManager.sectionGrammar]["MAX_STEPS"],
+                               gTimeoutCheckSteps=configAll[ConfigManager.sectionGrammar]["TIMEOUT_CHECK_STEPS"])
 
                 languages[lng.code] = lng
             except Errors.ExceptionMessageCode as e:
@@ -628,8 +749,11 @@ def initMorphoAnalyzers(allWords: Set[Word], languages: Dict[str, Language], con
             # naznámý jazyk
             continue
 
-    for code, lang in languages.items():
-        lang.initMAnalyzer(langWords[code])
+    # analyzátory jednotlivých jazyků jsou na sobě nezávislé, tak je inicializujeme souběžně
+    with ThreadPoolExecutor(max_workers=max(len(languages), 1)) as executor:
+        futures = [executor.submit(lang.initMAnalyzer, langWords[code]) for code, lang in languages.items()]
+        for f in futures:
+            f.result()  # případně vyhodí výjimku
 
 
 def prepareNameDependantAnalysys(names: NameReader, languages: Dict[str, Language]):
@@ -655,10 +779,80 @@ def prepareNameDependantAnalysys(names: NameReader, languages: Dict[str, Languag
         lang.ma.prepareNameDependentAnalysis(langNames[code])
 
 
+def precomputeTerminalMatches(names: NameReader, languages: Dict[str, Language]):
+    """
+    Předem vypočte pro všechna slova jmen, kterým terminálům gramatik odpovídají.
+    Pro jména se známým druhem se používá pouze jejich gramatika, jinak všechny gramatiky jazyka.
+
+    :param names: všechna uvažovaná jména
+    :param languages: Všechny uvažované jazyky, které chceme použít.
+    """
+
+    for name in names:
+        if name.language is None or name.language.code not in languages:
+            # naznámý jazyk
+            continue
+
+        lang = name.language
+        tokens = lang.lex.getTokens(name)
+
+        try:
+            grammars = [name.grammar]
+        except Errors.ExceptionMessageCode:
+            # druh jména zatím neznáme
+            grammars = [lang.gFemale, lang.gMale, lang.gLocations, lang.gEvents]
+
+        for g in grammars:
+            g.precomputeMatches(tokens)
+
+
+def loadFormsForNames(names: NameReader, languages: Dict[str, Language], allWords: bool):
+    """
+    Při dvoufázové analýze (MA_LAZY_FORMS) dotáhne tvary slov pro všechna jména najednou, aby nebyl morfologický
+    analyzátor při generování tvarů dotazován zvlášť pro každé jméno.
+    Tvary jsou dotaženy pro slova, která se ohýbají v některé derivaci jména. U jmen osob se uvažují obě gramatiky
+    osob, protože druh jména může být ještě změněn (Name.guessType).
+
+    :param names: všechna uvažovaná jména
+    :param languages: Všechny uvažované jazyky, které chceme použít.
+    :param allWords: True -> tvary jsou dotaženy pro všechna slova derivací, nejen pro ta, která se ohýbají.
+    """
+
+    words = {code: set() for code in languages}
+
+    for name in names:
+        if name.language is None or name.language.code not in languages:
+            # naznámý jazyk
+            continue
+
+        lang = name.language
+        tokens = lang.lex.getTokens(name)
+
+        if name.type is None or name.type == Name.Type.MainType.PERSON:
+            grammars = [lang.gFemale, lang.gMale]
+        else:
+            grammars = [name.grammar]
+
+        for g in grammars:
+            try:
+                _, aTokens = g.analyse(tokens)
+            except Errors.ExceptionMessageCode:
+                # jméno není v jazyce gramatiky, došlo k timeoutu, ...
+                # chyba bude případně vypsána až při generování tvarů
+                continue
+
+            words[lang.code].update(str(t.token.word) for aT in aTokens for t in aT
+                                    if t.token.word is not None and (t.morph or allWords))
+
+    for code, lang in languages.items():
+        lang.ma.loadForms(words[code])
+
+
 def main():
     """
     Vstupní bod programu.
     """
+    languages = {}
     try:
         logging.basicConfig(stream=sys.stderr, format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
         # zpracování argumentů
@@ -668,6 +862,16 @@ def main():
         configManager = ConfigManager()
         configAll = configManager.read(os.path.dirname(os.path.realpath(__file__)) + '/namegen_config.ini')
 
+        # nastavení velikostí cache
+        # Velikosti se čtou při vytváření cache, proto musí být nastaveny před načtením jazyků a gramatik
+        # a před vytvořením filtrů.
+        Terminal.MATCH_CACHE_SIZE = configAll[configManager.sectionDefault]["MATCH_CACHE_SIZE"]
+        namegenPack.Grammar.Grammar.ParsingTableSymbolRow.CACHE_SIZE = configAll[configManager.sectionDefault][
+            "TABLE_CACHE_SIZE"]
+        namegenPack.Grammar.Grammar.MATCH_BITS_CACHE_SIZE = configAll[configManager.sectionDefault][
+            "MATCH_BITS_CACHE_SIZE"]
+        NameScriptFilter.CACHE_SIZE = configAll[configManager.sectionDefault]["SCRIPT_FILTER_CACHE_SIZE"]
+
         if configAll[configManager.sectionGrammar]["PARSE_UNKNOWN_ANALYZE"]:
             # nastavní druhů terminálů UNKNOWN_ANALYZE_TERMINAL_MATCH
             Terminal.UNKNOWN_ANALYZE_TERMINAL_MATCH = configAll[configManager.sectionGrammar][
@@ -751,6 +955,17 @@ def main():
 
         logging.info("\thotovo")
 
+        if configAll[configManager.sectionGrammar]["PRECOMPUTE_MATCHES"]:
+            logging.info("Předvýpočet shody slov s terminály gramatik")
+            precomputeTerminalMatches(namesR, languages)
+            logging.info("\thotovo")
+
+        if configAll[configManager.sectionDataFiles]["MA_LAZY_FORMS"]:
+            logging.info("Dotažení tvarů slov")
+            loadFormsForNames(namesR, languages, any(a is not None for a in (args.given_names, args.surnames,
+                                                                             args.locations)))
+            logging.info("\thotovo")
+
         logging.info("Řazení jmen")
 
         namesR.sortNames()
@@ -887,6 +1102,13 @@ def main():
                             del rules[r]
                             del aTokens[r]
 
+                    # Při dvoufázové analýze si necháme dotáhnout tvary, ale jen pro slova, která se budou ohýbat,
+                    # případně pro všechna, pokud chce uživatel vypsat slova některého druhu do souboru.
+                    # Tvary jsou již dotaženy pro všechna jména najednou (viz loadFormsForNames), zde se tedy
+                    # analyzátor dotazuje jen výjimečně (např. slova jména, u kterého při dotažení došlo k timeoutu).
+                    lang.ma.loadForms(str(t.token.word) for aT in aTokens for t in aT
+                                      if t.token.word is not None and (t.morph or len(wordRules) > 0))
+
                     alreadyGenerated = set()  # mnozina ntic analyzovanych terminalu, ktere byly jiz generovany
 
                     generatedNamesThatShouldBeInDuplicityCheckSet = set()
@@ -1098,6 +1320,13 @@ def main():
         print("\tPrůměrný čas strávený nad generováním tvarů jednoho jména/názvu: ",
               round((endOfGenMorp - startOfGenMorp) / len(namesR.names), 3) if len(namesR.names) > 0 else 0,
               file=sys.stderr)
+        print("\tCache", file=sys.stderr)
+        print("\t\tShoda tokenů s terminály:", Terminal.MATCH_CACHE_STATS, file=sys.stderr)
+        print("\t\tŘádky parsovací tabulky:", namegenPack.Grammar.Grammar.ParsingTableSymbolRow.CACHE_STATS,
+              file=sys.stderr)
+        print("\t\tBitové množiny shody tokenů s terminály:", namegenPack.Grammar.Grammar.MATCH_BITS_CACHE_STATS,
+              file=sys.stderr)
+        print("\t\tFiltr písma:", NameScriptFilter.CACHE_STATS, file=sys.stderr)
 
         for lngCode, lng in languages.items():
             grammarFemale = lng.gFemale
@@ -1133,6 +1362,10 @@ def main():
                   grammarEvents.grammarEllapsedTime / grammarEvents.grammarNumOfAnalyzes if grammarEvents.grammarNumOfAnalyzes > 0 else 0,
                   file=sys.stderr)
             print("\t\t\t\t Počet analýz:", grammarEvents.grammarNumOfAnalyzes, file=sys.stderr)
+            print("\t\tPočet nalezených/vypočtených zapamatovaných částí syntaktických analýz:",
+                  sum(g.grammarMemoHits for g in (grammarFemale, grammarMale, grammarLocations, grammarEvents)), "/",
+                  sum(g.grammarMemoMisses for g in (grammarFemale, grammarMale, grammarLocations, grammarEvents)),
+                  file=sys.stderr)
             print("\t\tNeznámý druh jména:", errorsUnknownNameType, file=sys.stderr)
             print("\t\tNepokryto gramatikou:", errorsGrammerCnt, file=sys.stderr)
             print("\t\tPočet jmen, u kterých došlo k timeoutu při syntaktické analýze:", errorsTimout, file=sys.stderr)
@@ -1179,6 +1412,10 @@ def main():
         print("--------------------", file=sys.stderr)
         Errors.ErrorMessenger.echoError(Errors.ErrorMessenger.getMessage(Errors.ErrorMessenger.CODE_UNKNOWN_ERROR),
                                         Errors.ErrorMessenger.CODE_UNKNOWN_ERROR)
+    finally:
+        # ukončíme běžící morfologické analyzátory
+        for lng in languages.values():
+            lng.closeMAnalyzer()
 
 
 if __name__ == "__main__":
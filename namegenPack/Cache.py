@@ -0,0 +1,92 @@
+# -*- coding: UTF-8 -*-
+""""
+Created on 18.10.26
+Modul obsahující cache s omezenou velikostí a čítače jejího použití.
+
+:author:     Martin Dočekal
+"""
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class CacheStats(object):
+    """
+    Čítače použití cache. Může být sdílen více cache stejného druhu, aby bylo možné vypsat souhrnné statistiky.
+    """
+
+    __slots__ = ("hits", "misses", "evictions")
+
+    def __init__(self):
+        self.hits = 0  # počet nalezených položek
+        self.misses = 0  # počet nenalezených položek
+        self.evictions = 0  # počet vyřazených položek
+
+    def reset(self):
+        """
+        Vynuluje čítače.
+        """
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __str__(self):
+        return f"nalezeno: {self.hits}, nenalezeno: {self.misses}, vyřazeno: {self.evictions}"
+
+
+class LRUCache(object):
+    """
+    Cache s omezenou velikostí. Při zaplnění vyřazuje nejdéle nepoužitou položku.
+    Stejně jako dict vyhazuje KeyError pro chybějící klíč, takže ji lze použít místo dict cache ve stylu:
+
+        try:
+            return cache[key]
+        except KeyError:
+            res = ...
+            cache[key] = res
+            return res
+    """
+
+    __slots__ = ("maxSize", "stats", "_items")
+
+    def __init__(self, maxSize: Optional[int] = None, stats: Optional[CacheStats] = None):
+        """
+        Vytvoření prázdné cache.
+
+        :param maxSize: Maximální počet položek. None -> neomezeno.
+        :type maxSize: Optional[int]
+        :param stats: Čítače použití, do kterých má cache přičítat. Pokud None, tak má cache vlastní.
+        :type stats: Optional[CacheStats]
+        """
+        self.maxSize = maxSize
+        self.stats = CacheStats() if stats is None else stats
+        self._items = OrderedDict()
+
+    def __getitem__(self, key: Hashable) -> Any:
+        try:
+            value = self._items[key]
+        except KeyError:
+            self.stats.misses += 1
+            raise
+
+        self.stats.hits += 1
+        if self.maxSize is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def __setitem__(self, key: Hashable, value: Any):
+        self._items[key] = value
+        if self.maxSize is not None and len(self._items) > self.maxSize:
+            self._items.popitem(last=False)
+            self.stats.evictions += 1
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def clear(self):
+        """
+        Odstraní všechny položky.
+        """
+        self._items.clear()
@@ -11,6 +11,8 @@ from typing import Any, Set, Pattern
 
 import unicodedata
 
+from namegenPack.Cache import CacheStats, LRUCache
+
 
 # noinspection PyUnusedLocal
 import namegenPack
@@ -149,6 +151,12 @@ class NameScriptFilter(Filter):
     Kontroluje výskyt poskytnutého řetězce ve výsledku unicodedata.name pro alpha znaky.
     """
 
+    CACHE_SIZE = None
+    """Maximální počet položek cache znaků. None -> neomezeno. Projeví se u filtrů vytvořených po nastavení."""
+
+    CACHE_STATS = CacheStats()
+    """Souhrnné čítače použití cache znaků."""
+
     def __init__(self, script: str):
         """
         Inicializace filtru.
@@ -159,7 +167,7 @@ class NameScriptFilter(Filter):
         """
 
         self._script = script
-        self._cache = {}
+        self._cache = LRUCache(self.CACHE_SIZE, self.CACHE_STATS)
 
     def __call__(self, o) -> bool:
         """
@@ -7,15 +7,22 @@ Modul pro práci s gramatikou (Bezkontextovou).
 :contact:    xdocek09@stud.fit.vubtr.cz
 """
 import copy
+import hashlib
+import inspect
 import itertools
+import logging
+import os
+import pickle
+import tempfile
 import time
 from builtins import isinstance
 from enum import Enum
-from typing import Set, Dict, List, Tuple, Optional
+from typing import Set, Dict, List, Tuple, Optional, Hashable
 
 import regex as re
 
 from namegenPack import Errors
+from namegenPack.Cache import CacheStats, LRUCache
 from namegenPack.Word import Word, WordTypeMark
 from namegenPack.morpho.MorphCategories import MorphCategory, Gender, Number, \
     MorphCategories, POS, Case, Note, Flag
@@ -180,6 +187,13 @@ class Terminal(object):
     # Množina druhů terminálů, kterým odpovídá token ANALYZE_UNKNOWN.
     UNKNOWN_ANALYZE_TERMINAL_MATCH = set()
 
+    # Maximální počet položek cache pro tokenMatch všech terminálů jedné gramatiky (viz Grammar.terminalMatch).
+    # None -> neomezeno.
+    MATCH_CACHE_SIZE = None
+
+    # Souhrnné čítače použití cache pro tokenMatch všech terminálů.
+    MATCH_CACHE_STATS = CacheStats()
+
     class Type(Enum):
         """
         Druh terminálu.
@@ -497,8 +511,9 @@ class Terminal(object):
 
         self._hasVoluntaryAttribut = len(self._fillteringAttrVal) != len(self._fillteringAttrValWithoutVoluntary)
 
-        # cache pro zrychlení tokenMatch
-        self._matchCache = {}
+        # části podpisu tokenu (viz Token.matchSignature), na kterých závisí tokenMatch
+        self._matchSignatureNeeds = (self.getAttribute(self.Attribute.Type.MATCH_REGEX) is not None,
+                                     self.getAttribute(self.Attribute.Type.NAME_TYPE) is not None)
 
     def getAttribute(self, t):
         """
@@ -538,6 +553,15 @@ class Terminal(object):
 
         return self._fillteringAttrVal
 
+    @property
+    def priority(self):
+        """
+        Priorita terminálu (atribut p, výchozí 0).
+
+        :rtype: int
+        """
+        return self.getAttribute(self.Attribute.Type.PRIORITY).value
+
     @property
     def hasVoluntaryAttr(self):
         """
@@ -558,22 +582,41 @@ class Terminal(object):
 
         return self._fillteringAttrValWithoutVoluntary
 
-    def tokenMatch(self, t):
+    @property
+    def matchSignatureNeeds(self):
+        """
+        Které volitelné části podpisu tokenu (viz Token.matchSignature) jsou potřeba pro tokenMatch.
+
+        :return: Dvojice příznaků pro samotné slovo (atribut r) a druh jména (atribut name_type).
+        :rtype: Tuple[bool, bool]
+        """
+        return self._matchSignatureNeeds
+
+    def tokenMatch(self, t, cache: Optional[LRUCache] = None):
         """
         Určuje zda daný token odpovídá tomuto terminálu.
+        Výsledek je uložen v cache pod terminálem a podpisem tokenu, takže je sdílen všemi tokeny se stejným
+        podpisem napříč jmény.
         
         :param t: Token pro kontrolu.
         :type t: Token
+        :param cache: Cache výsledků sdílená terminály gramatiky ((terminál, podpis tokenu) -> výsledek).
+            Pokud None, výsledek se neukládá.
+        :type cache: Optional[LRUCache]
         :return: Vrací True, pokud odpovídá. Jinak false.
         :rtype: bool
         """
 
+        if cache is None:
+            return self.tokenMatchWithoutCache(t)
+
+        key = (self, t.matchSignature(*self._matchSignatureNeeds))
         try:
-            return self._matchCache[t]
+            return cache[key]
         except KeyError:
             # zatím není v cache
             res = self.tokenMatchWithoutCache(t)
-            self._matchCache[t] = res
+            cache[key] = res
             return res
 
     def tokenMatchWithoutCache(self, t):
@@ -721,6 +764,8 @@ class Token(object):
         """
         self.word = word
         self._type = tokenType
+        self._matchSignature = None  # podpis bez volitelných částí (viz matchSignature)
+        self._matchSignatureNameType = None  # druh jména, pro který byl podpis vytvořen
 
     @property
     def type(self):
@@ -741,6 +786,45 @@ class Token(object):
         """
 
         self._type = t
+        self._matchSignature = None
+
+    def matchSignature(self, surface: bool = False, nameType: bool = False) -> Tuple:
+        """
+        Podpis tokenu pro porovnání s terminály (viz Terminal.tokenMatch). Tokeny se stejným podpisem odpovídají
+        stejným terminálům, takže výsledky porovnání mohou být sdíleny napříč jmény.
+
+        Podpis je tvořen druhem tokenu a u tokenů, které mohou využívat morfologickou analýzu, i klíčem analýzy slova
+        (viz Word.analysisKey). Podpis tedy analýzu nedrží v paměti a zůstává stejný i po jejím nahrazení
+        analýzou s tvary (MA_LAZY_FORMS), která má stejná značko pravidla.
+
+        :param surface: Přidá do podpisu i samotné slovo. Potřebují terminály s atributem r.
+        :type surface: bool
+        :param nameType: Přidá do podpisu i druh jména. Potřebují terminály s atributem name_type.
+        :type nameType: bool
+        :return: Podpis tokenu.
+        :rtype: Tuple
+        """
+        actNameType = None if self.word is None or self.word.name is None else self.word.name.type
+
+        # analýza může záviset na druhu jména, který se mění při jeho odhadu
+        if self._matchSignature is None or self._matchSignatureNameType != actNameType:
+            if self._type in Lex.TOKEN_TYPES_THAT_CAN_USE_MA:
+                try:
+                    analysisKey = self.word.analysisKey
+                except Word.WordCouldntGetInfoException:
+                    analysisKey = None
+                self._matchSignature = (self._type, analysisKey)
+            else:
+                self._matchSignature = (self._type,)
+            self._matchSignatureNameType = actNameType
+
+        signature = self._matchSignature
+        if surface:
+            signature += (str(self.word),)
+        if nameType:
+            signature += (None if self.word is None else str(actNameType),)
+
+        return signature
 
     def __str__(self):
         return str(self._type) + "(" + str(self.word) + ")"
@@ -779,6 +863,7 @@ class Lex(object):
         """
 
         self.__titles = titles
+        self.__titlesParts = None  # vytvoří se až při prvním použití v canBeTokenOfType
 
         # Přidáme i všechny prefixy, tak abysme později lépe detekovali získanou část titulu.
         # Příklady titulových prefixů pro titul  Ing.arch.:
@@ -874,6 +959,43 @@ class Lex(object):
 
         return tokens
 
+    def canBeTokenOfType(self, word: str, terminalType: Terminal.Type) -> bool:
+        """
+        Zjistí, zda může slovo (v nějakém jméně) tvořit token, který odpovídá terminálu daného druhu, jenž
+        nepoužívá morfologickou analýzu.
+        Jedná se o odhad bez znalosti jména, může tedy vrátit True i v případech, kdy ve skutečnosti slovo
+        takový token tvořit nebude.
+
+        :param word: Slovo pro kontrolu.
+        :type word: str
+        :param terminalType: Druh terminálu.
+        :type terminalType: Terminal.Type
+        :return: True pokud může slovo tvořit daný token. False jinak.
+        :rtype: bool
+        """
+
+        if terminalType == Terminal.Type.ANY:
+            return True
+        if terminalType == Terminal.Type.DEGREE_TITLE:
+            if self.__titlesParts is None:
+                # části titulů, které mohou být samostatnými slovy (viz isTitle)
+                self.__titlesParts = self.__titles | self.__titles_prefixes
+                for t in self.__titles:
+                    for p in self.__titles_prefixes:
+                        if t.startswith(p):
+                            self.__titlesParts.add(t[len(p):])
+            return word in self.__titlesParts
+        if terminalType == Terminal.Type.ROMAN_NUMBER:
+            return self.ROMAN_NUMBER_REGEX.match(word) is not None
+        if terminalType == Terminal.Type.NUMBER:
+            return self.NUMBER_REGEX.match(word) is not None
+        if terminalType == Terminal.Type.INITIAL_ABBREVIATION:
+            return word.isupper() and not str.isdigit(word[0]) and \
+                (len(word) == 1 or (len(word) == 2 and word[-1] == "."))
+
+        # EOF a X žádnému slovu neodpovídají
+        return False
+
     def isTitle(self, name, pos):
         """
         Zjistí zdali se na aktuální pozici vyskytuje titul.
@@ -1612,48 +1734,103 @@ class RuleTemplate(object):
         return False
 
 
-class Symbol(object):
+class DerivationRecord(object):
+    """
+    Záznam derivace vytvářený parserem. Derivace je uložena jako zřetězený seznam úseků (pravidla a analyzované
+    tokeny úseku), kde každý úsek odkazuje na zbytek derivace. Všechna pokračování konfliktu tak sdílí společný
+    úsek před konfliktem a stejné zbytky derivací (např. z memoizace) jsou sdíleny více derivacemi.
+    Záznamy jsou neměnné, ploché listy jsou vytvořeny až metodou materialize.
     """
-        Reprezentace symbolu na zásobníku
-        """
-
-    def __init__(self, s, isTerm=True, morph=True):
-        """
-            Vytvoření symbolu s typu t.
-            :param s: Symbol
-            :type s:
-            :param isTerm: Druh terminál(True)/neterminál(False).
-            :type isTerm: bool
-            :param morph: Příznak zda se má slovo odpovídající termínálu ohýbat.
-                V případě neterminálu tento příznak určuje zda se mají slova odpovídající všem
-                terminálů, které je možné vygenerovat z daného neterminálu ohýbat/neohýbat.
-                Alternativní definice:
-                Flag, který určuje zda-li se nacházíme v části stromu, kde se slova mají ohýbat, či ne.
-                Jedná se o zohlednění příznaku self.NON_GEN_MORPH_SIGN z gramatiky.
-            :type morph: bool
-            """
 
-        self._s = s
-        self._isTerm = isTerm
-        self._morph = morph
+    __slots__ = ("rules", "aTokens", "rest")
 
-    @property
-    def val(self):
-        return self._s
+    def __init__(self, rules, aTokens, rest=None):
+        """
+        Vytvoření úseku derivace.
 
-    @property
-    def isTerm(self):
+        :param rules: Pravidla úseku. (nesmí být již modifikován)
+        :type rules: List[Rule]
+        :param aTokens: Analyzované tokeny úseku. (nesmí být již modifikován)
+        :type aTokens: List[AnalyzedToken]
+        :param rest: Zbytek derivace. None pokud je úsek posledním.
+        :type rest: Optional[DerivationRecord]
         """
-            True jedná se o terminál. False jedná se neterminál.
-            """
-        return self._isTerm
+        self.rules = rules
+        self.aTokens = aTokens
+        self.rest = rest
 
-    @property
-    def isMorph(self):
+    def segments(self):
         """
-            True ohýbat. False jinak.
-            """
-        return self._morph
+        Postupně prochází úseky derivace od začátku.
+
+        :return: Generátor úseků derivace.
+        :rtype: Iterator[DerivationRecord]
+        """
+        record = self
+        while record is not None:
+            yield record
+            record = record.rest
+
+    def priorities(self):
+        """
+        Priority terminálů u jednotlivých analyzovaných tokenů derivace.
+
+        :return: Priority terminálů v pořadí tokenů.
+        :rtype: Tuple[int, ...]
+        """
+        return tuple(t.matchingTerminal.priority for s in self.segments() for t in s.aTokens)
+
+    def materialize(self):
+        """
+        Vytvoří ploché listy pravidel a analyzovaných tokenů derivace.
+
+        :return: Dvojici s listem pravidel derivace a listem analyzovaných tokenů.
+        :rtype: Tuple[List[Rule], List[AnalyzedToken]]
+        """
+        rules = []
+        aTokens = []
+        for s in self.segments():
+            rules.extend(s.rules)
+            aTokens.extend(s.aTokens)
+
+        return rules, aTokens
+
+
+class ParseForestNode(object):
+    """
+    Uzel sdíleného lesa derivací, který vytváří parser PARSER_FOREST.
+    Obsahuje pravidla a analyzované tokeny deterministického úseku analýzy (bez konfliktů v tabulce) a případně
+    alternativy pro konflikt, kterým úsek končí. Stejné podstromy (stejný obsah zásobníku a pozice ve vstupu)
+    jsou sdíleny.
+    """
+
+    __slots__ = ("rules", "aTokens", "alternatives", "priorities", "best")
+
+    def __init__(self):
+        self.rules = []  # type: List[Rule]
+        self.aTokens = []  # type: List[AnalyzedToken]
+        self.alternatives = None  # type: Optional[List[Tuple[Rule, ParseForestNode]]]
+        # priority terminálů derivací uzlu, pokud jsou alternativy prořezány na základě priorit
+        self.priorities = None  # type: Optional[Tuple[int, ...]]
+        # nejvýše maxDerivations nejlepších derivací uzlu, pokud je počet derivací omezen bez prořezávání
+        self.best = None  # type: Optional[List[DerivationRecord]]
+
+    def derivations(self):
+        """
+        Postupně vytváří všechny derivace, které uzel reprezentuje. Pořadí odpovídá pořadí, ve kterém je vrací
+        parser PARSER_BACKTRACKING.
+
+        :return: Generátor záznamů derivací.
+        :rtype: Iterator[DerivationRecord]
+        """
+        if self.alternatives is None:
+            yield DerivationRecord(self.rules, self.aTokens)
+            return
+
+        for r, child in self.alternatives:
+            rules = self.rules + [r]
+            for rest in child.derivations():
+                yield DerivationRecord(rules, self.aTokens, rest)
 
 
 class Grammar(object):
@@ -1672,6 +1849,31 @@ class Grammar(object):
     Separátor používány v auto. generovaných neterminálech pro oddělení původního jména s počítadlem.
     """
 
+    PARSER_BACKTRACKING = "backtracking"
+    """Parser, který při konfliktu v tabulce zkouší rekurzivně každou alternativu zvlášť."""
+
+    PARSER_FOREST = "forest"
+    """Parser, který při konfliktu sdílí společné podstromy analýzy v lese derivací (viz ParseForestNode)."""
+
+    PARSERS = {PARSER_BACKTRACKING, PARSER_FOREST}
+    """Dostupné parsery."""
+
+    MATCH_BITS_CACHE_SIZE = None
+    """Maximální počet bitových množin shody tokenů s terminály (viz matchBits) jedné gramatiky. None -> neomezeno.
+    Předem vypočtené množiny (viz precomputeMatches) se do něj nezapočítávají. Projeví se u gramatik vytvořených
+    po nastavení."""
+
+    MATCH_BITS_CACHE_STATS = CacheStats()
+    """Souhrnné čítače použití bitových množin shody tokenů s terminály všech gramatik."""
+
+    CACHE_VERSION = 1
+    """Verze formátu uložené zkompilované gramatiky. Při nekompatibilní změně formátu je nutné zvýšit."""
+
+    CACHED_ATTRIBUTES = ["_terminals", "_nonterminals", "_rules", "_startS", "_table", "_empty", "_first", "_follow",
+                         "_predict", "_symbols", "_nNonterminals", "_terminalBits", "_symbolBits", "_rulesById",
+                         "_rulePushes", "_compactTable", "_compactTableNeeds", "_startSymbol", "_eofSymbol"]
+    """Atributy zkompilované gramatiky (po zjednodušení a vytvoření tabulky), které se ukládají."""
+
     class NotInLanguage(Errors.ExceptionMessageCode):
         """
         Řetězec není v jazyce generovaným danou gramatikou.
@@ -1701,9 +1903,42 @@ class Grammar(object):
         
         """
 
+        CACHE_SIZE = None
+        """Maximální počet položek cache pravidel pro token všech řádků jedné gramatiky (viz Grammar._rulesFor).
+        None -> neomezeno."""
+
+        CACHE_STATS = CacheStats()
+        """Souhrnné čítače použití cache pravidel pro token všech gramatik."""
+
         def __init__(self, *arg, **kw):
             super().__init__(*arg, **kw)
-            self._cache = {}
+            self._matchSignatureNeeds = None  # části podpisu tokenu potřebné pro terminály v řádku
+            self._cache = None  # cache gramatiky (klíč řádku, podpis tokenu) -> pravidla
+            self._cacheKey = None  # klíč řádku v cache
+            self._matchCache = None  # cache gramatiky pro Terminal.tokenMatch
+
+        def useCaches(self, cache: LRUCache, cacheKey: Hashable, matchCache: LRUCache):
+            """
+            Nastaví cache gramatiky, které má řádek používat. Bez nich se výsledky neukládají.
+
+            :param cache: Cache pravidel pro token sdílená řádky gramatiky.
+            :type cache: LRUCache
+            :param cacheKey: Klíč řádku, kterým jsou v cache odlišeny jeho položky.
+            :type cacheKey: Hashable
+            :param matchCache: Cache pro Terminal.tokenMatch sdílená terminály gramatiky.
+            :type matchCache: LRUCache
+            """
+            self._cache = cache
+            self._cacheKey = cacheKey
+            self._matchCache = matchCache
+
+        def __getstate__(self):
+            # cache neukládáme, obsahují analýzy slov z aktuálního běhu a patří gramatice
+            state = self.__dict__.copy()
+            state["_cache"] = None
+            state["_cacheKey"] = None
+            state["_matchCache"] = None
+            return state
 
         def __getitem__(self, key):
             """
@@ -1716,55 +1951,202 @@ class Grammar(object):
             """
             if isinstance(key, Token):
                 # Nutné zjistit všechny terminály, které odpovídají danému tokenu.
-                try:
-                    # zkusíme použít cache
-                    return self._cache[str(key)]
-                except KeyError:
-                    # bohužel nelze použít cache
-                    res = set()
-                    for k in self.keys():
-                        if k.tokenMatch(key):
-                            # daný terminál odpovídá tokenu, přidejme pravidla
-                            res |= dict.__getitem__(self, k)
-
-                    self._cache[str(key)] = res
-                    return res
+                if self._matchSignatureNeeds is None:
+                    self._matchSignatureNeeds = (any(k.matchSignatureNeeds[0] for k in self.keys()),
+                                                 any(k.matchSignatureNeeds[1] for k in self.keys()))
+
+                cacheKey = (self._cacheKey, key.matchSignature(*self._matchSignatureNeeds))
+                if self._cache is not None:
+                    try:
+                        # zkusíme použít cache
+                        return self._cache[cacheKey]
+                    except KeyError:
+                        # bohužel nelze použít cache
+                        pass
+
+                res = set()
+                for k in self.keys():
+                    if k.tokenMatch(key, self._matchCache):
+                        # daný terminál odpovídá tokenu, přidejme pravidla
+                        res |= dict.__getitem__(self, k)
+
+                if self._cache is not None:
+                    self._cache[cacheKey] = res
+                return res
             else:
                 # běžný výběr
                 return dict.__getitem__(self, key)
 
-    def __init__(self, filePath, timeout=None):
+    def __init__(self, filePath, timeout=None, cachePath: Optional[str] = None, parser: str = PARSER_BACKTRACKING,
+                 memoize: bool = False, priorityPruning: bool = False, maxDerivations: Optional[int] = None,
+                 maxSteps: Optional[int] = None, timeoutCheckSteps: int = 1):
         """
         Inicializace grammatiky jejim načtením ze souboru.
         
         :param filePath: Cesta k souboru s gramatikou
         :type filePath: str
         :param timeout: TimeoutException pro syntaktickou analýzu. Po kolik max milisekundách má přestat.
-            TimeoutException je kontrolován vždy na začátku metody crawling.
+            Timeout je kontrolován každých timeoutCheckSteps kroků analýzy.
         :type timeout: None | int
+        :param cachePath: Volitelná cesta k souboru se zkompilovanou gramatikou. Pokud odpovídá otisku gramatiky
+            (viz fingerprint), je gramatika načtena z něj. Jinak je gramatika zkompilována a do souboru uložena.
+        :type cachePath: Optional[str]
+        :param parser: Parser pro syntaktickou analýzu (jeden z PARSERS).
+        :type parser: str
+        :param memoize: True -> parser PARSER_BACKTRACKING si v rámci jedné analýzy pamatuje výsledky pro již
+            analyzované stavy (obsah zásobníku a pozice ve vstupu), takže se opakovaně analyzované části vstupu
+            získají pouze vyhledáním.
+        :type memoize: bool
+        :param priorityPruning: True -> parser zahazuje již během analýzy derivace, které prohrají při filtrování
+            na základě priorit terminálů (viz priorityDerivationFilter v namegen.py).
+        :type priorityPruning: bool
+        :param maxDerivations: Maximální počet derivací vrácených jednou analýzou. Ponechány jsou derivace
+            s nejvyššími prioritami terminálů. None -> neomezeno.
+        :type maxDerivations: Optional[int]
+        :param maxSteps: Maximální počet kroků (výběrů symbolu ze zásobníku) jedné analýzy. Při jeho překročení
+            dojde k timeoutu nezávisle na rychlosti stroje. None -> neomezeno.
+        :type maxSteps: Optional[int]
+        :param timeoutCheckSteps: Po kolika krocích analýzy se kontroluje uplynulý čas (timeout).
+        :type timeoutCheckSteps: int
         :raise exception:
             Errors.ExceptionMessageCode pokud nemůže přečíst vstupní soubor.
             InvalidGrammarException pokud je problém se samotnou gramtikou.
         """
 
-        self._terminals = {Terminal(Terminal.Type.EOF)}  # implicitní terminál je konec souboru
-        self._nonterminals = set()
-        self._rules = set()
+        fingerprint = None if cachePath is None else self.fingerprint(filePath)
+
+        if fingerprint is None or not self._loadCompiled(cachePath, fingerprint):
+            self._terminals = {Terminal(Terminal.Type.EOF)}  # implicitní terminál je konec souboru
+            self._nonterminals = set()
+            self._rules = set()
+
+            self._load(filePath)
 
-        self._load(filePath)
+            self._simplify()
 
-        self._simplify()
+            # vytvoříme si tabulku pro parsování
+            self._makeTable()
+            self._makeCompactTable()
 
-        # vytvoříme si tabulku pro parsování
-        self._makeTable()
+            if fingerprint is not None:
+                self._saveCompiled(cachePath, fingerprint)
 
         self.timeout = timeout
+        self.parser = parser
+        self.memoize = memoize
+        self.priorityPruning = priorityPruning
+        self.maxDerivations = maxDerivations
+        self.maxSteps = maxSteps
+        self.timeoutCheckSteps = timeoutCheckSteps
         self.grammarEllapsedTime = 0
         self.grammarNumOfAnalyzes = 0
+        self.grammarMemoHits = 0  # kolikrát byl výsledek části analýzy nalezen mezi zapamatovanými
+        self.grammarMemoMisses = 0  # kolikrát musel být výsledek části analýzy vypočten
 
         self.filePath = filePath
 
+        # podpis tokenu -> bitová množina terminálů, kterým token odpovídá
+        self._matchBits = LRUCache(self.MATCH_BITS_CACHE_SIZE, self.MATCH_BITS_CACHE_STATS)
+        # podpis tokenu (druh tokenu a slovo) -> bitová množina terminálů předem vypočtená pomocí precomputeMatches
+        # (drží se mimo omezenou cache, aby nebyla vytlačena dříve, než bude použita, velikost je omezena slovníkem)
+        self._precomputedMatchBits = {}
+        # (neterminál, podpis tokenu) -> pravidla; jedna cache pro všechny řádky tabulky (viz _rulesFor)
+        self._tableCache = LRUCache(self.ParsingTableSymbolRow.CACHE_SIZE, self.ParsingTableSymbolRow.CACHE_STATS)
+        # (terminál, podpis tokenu) -> výsledek Terminal.tokenMatch; jedna cache pro všechny terminály gramatiky
+        self._terminalMatchCache = LRUCache(Terminal.MATCH_CACHE_SIZE, Terminal.MATCH_CACHE_STATS)
+        for n, row in self._table.items():
+            row.useCaches(self._tableCache, n, self._terminalMatchCache)
+
         self.analyzeStartTime = None
+        self._analyzeDeadline = None  # okamžik (time.monotonic) timeoutu aktuální analýzy
+        self._steps = 0  # počet kroků aktuální analýzy
+        self._nextStepsCheck = 0  # počet kroků, při kterém proběhne další kontrola timeoutu
+
+    @classmethod
+    def fingerprint(cls, filePath: str) -> str:
+        """
+        Vypočte otisk gramatiky, na kterém závisí její zkompilovaná podoba.
+        Otisk je tvořen obsahem souboru s gramatikou, druhy terminálů z UNKNOWN_ANALYZE_TERMINAL_MATCH a verzí
+        kódu (obsahem modulů s gramatikou a morfologickými kategoriemi).
+
+        :param filePath: Cesta k souboru s gramatikou.
+        :type filePath: str
+        :return: Otisk gramatiky.
+        :rtype: str
+        :raise exception:
+            Errors.ExceptionMessageCode pokud nemůže přečíst vstupní soubor.
+        """
+        h = hashlib.sha256(str(cls.CACHE_VERSION).encode())
+
+        for module in [__file__, inspect.getfile(MorphCategory)]:
+            with open(module, "rb") as f:
+                h.update(f.read())
+
+        h.update(" ".join(sorted(str(t.value) for t in Terminal.UNKNOWN_ANALYZE_TERMINAL_MATCH)).encode())
+
+        try:
+            with open(filePath, "rb") as f:
+                h.update(f.read())
+        except IOError:
+            raise Errors.ExceptionMessageCode(Errors.ErrorMessenger.CODE_COULDNT_READ_INPUT_FILE,
+                                              Errors.ErrorMessenger.getMessage(
+                                                  Errors.ErrorMessenger.CODE_COULDNT_READ_INPUT_FILE) + "\n\t" + filePath)
+
+        return h.hexdigest()
+
+    def _loadCompiled(self, cachePath: str, fingerprint: str) -> bool:
+        """
+        Načte zkompilovanou gramatiku.
+
+        :param cachePath: Cesta k souboru se zkompilovanou gramatikou.
+        :type cachePath: str
+        :param fingerprint: Otisk gramatiky, kterému musí uložená gramatika odpovídat.
+        :type fingerprint: str
+        :return: True -> načteno. False -> soubor neexistuje, nelze jej přečíst nebo neodpovídá otisk.
+        :rtype: bool
+        """
+        try:
+            with open(cachePath, "rb") as f:
+                storedFingerprint, attributes = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logging.info(f"\tNepodařilo se načíst zkompilovanou gramatiku z {cachePath}: {e}")
+            return False
+
+        if storedFingerprint != fingerprint:
+            return False
+
+        for a in self.CACHED_ATTRIBUTES:
+            setattr(self, a, attributes[a])
+
+        return True
+
+    def _saveCompiled(self, cachePath: str, fingerprint: str):
+        """
+        Uloží zkompilovanou gramatiku. Přepisuje předchozí obsah souboru.
+
+        :param cachePath: Cesta k souboru se zkompilovanou gramatikou.
+        :type cachePath: str
+        :param fingerprint: Otisk gramatiky.
+        :type fingerprint: str
+        """
+        directory = os.path.dirname(cachePath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # zapisujeme do dočasného souboru, aby nedošlo k poškození uložené gramatiky při přerušení zápisu
+        # dočasný soubor je jedinečný, aby si nepřepisovaly zápis souběžně běžící procesy se stejnou cache
+        fd, tmpPath = tempfile.mkstemp(dir=directory or ".", prefix=os.path.basename(cachePath) + ".",
+                                       suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((fingerprint, {a: getattr(self, a) for a in self.CACHED_ATTRIBUTES}), f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpPath, cachePath)
+        except BaseException:
+            os.remove(tmpPath)
+            raise
 
     @property
     def flexible(self) -> bool:
@@ -1774,6 +2156,13 @@ class Grammar(object):
         """
         return self._startS[0] != self.NON_GEN_MORPH_SIGN
 
+    @property
+    def terminals(self) -> Set[Terminal]:
+        """
+        Terminály gramatiky.
+        """
+        return self._terminals
+
     def _load(self, filePath):
         """
         Načtení gramatiky ze souboru.
@@ -1960,13 +2349,16 @@ class Grammar(object):
         """
         return line.split("#", 1)[0].strip()
 
-    def analyse(self, tokens):
+    def analyse(self, tokens, priorityPruning: Optional[bool] = None):
         """
         Provede syntaktickou analýzu pro dané tokeny.
         Poslední token předpokládá EOF. Pokud jej neobsahuje, tak jej sám přidá na konec tokens.
         
         :param tokens: Tokeny pro zpracování.
         :type tokens: list
+        :param priorityPruning: Umožňuje pro tuto analýzu změnit priorityPruning. None -> použije se nastavení
+            gramatiky.
+        :type priorityPruning: Optional[bool]
         :return: Dvojici s listem listu pravidel určujících všechny možné derivace a list listů analyzovaných tokenů.
             Pokud vrací None došlo k timeoutu.
         :rtype: (list(list(Rule)), list(list(AnalyzedToken))) | None
@@ -1974,23 +2366,224 @@ class Grammar(object):
         :raise TimeoutException: Při provádění syntaktické analýzy, nad daným řetězcem, došlo k timeoutu.
         """
 
+        if priorityPruning is not None and priorityPruning != self.priorityPruning:
+            origPriorityPruning = self.priorityPruning
+            self.priorityPruning = priorityPruning
+            try:
+                return self.analyse(tokens)
+            finally:
+                self.priorityPruning = origPriorityPruning
+
         # provedeme samotnou analýzu a vrátíme výsledek
         self.analyzeStartTime = time.time()
+        self._analyzeDeadline = None if self.timeout is None else time.monotonic() + self.timeout / 1000
+        self._steps = 0
+        self._nextStepsCheck = 0
         if tokens[-1].type != Token.Type.EOF:
             tokens.append(Token(None, Token.Type.EOF))
 
         # Přidáme na zásoník konec vstupu a počáteční symbol
-        stack = [Symbol(Terminal(Terminal.Type.EOF), True, True),
-                 Symbol(self._startS, False, self._startS[0] != self.NON_GEN_MORPH_SIGN)]
+        stack = (self._startSymbol, (self._eofSymbol, None))
         position = 0
 
-        res = self.crawling(stack, tokens, position)
+        if self.parser == self.PARSER_FOREST:
+            forest = self.forestCrawling(stack, tokens, position, {})
+            if forest is None:
+                raise self.NotInLanguage()
+
+            if self.maxDerivations is None:
+                derivations = forest.derivations()
+            elif self.priorityPruning:
+                # všechny derivace prořezaného lesa mají stejné priority, stačí tedy postupně vytvořit první z nich
+                derivations = itertools.islice(forest.derivations(), self.maxDerivations)
+            else:
+                # nejlepší derivace jsou vybírány již při vytváření lesa v každém uzlu (viz forestCrawling),
+                # takže se nikdy nevytváří všechny derivace
+                derivations = forest.best
+        else:
+            derivations = self.crawling(stack, tokens, position, {} if self.memoize else None)
+
+        # až zde vytvoříme z navzájem sdílených záznamů derivací samostatné listy
+        res = [], []
+        for d in derivations:
+            rules, aTokens = d.materialize()
+            res[0].append(rules)
+            res[1].append(aTokens)
 
         self.grammarEllapsedTime += time.time() - self.analyzeStartTime
         self.grammarNumOfAnalyzes += 1
         return res
 
-    def crawling(self, stack, tokens, position):
+    def _bestDerivations(self, derivations):
+        """
+        Vybere z derivací (jejich částí od stejné pozice ve vstupu do konce) ty nejlepší na základě priorit terminálů.
+        Derivace jsou porovnávány lexikograficky podle priorit terminálů u jednotlivých tokenů, což odpovídá
+        priorityDerivationFilter v namegen.py. Prořezávání (priorityPruning) ponechá pouze derivace s nejvyššími
+        prioritami a omezení (maxDerivations) ponechá nejvýše daný počet derivací s nejvyššími prioritami
+        (při shodě rozhoduje pořadí). Vybrané derivace zůstávají v původním pořadí.
+
+        :param derivations: Záznamy jednotlivých derivací.
+        :type derivations: List[DerivationRecord]
+        :return: Záznamy vybraných derivací.
+        :rtype: List[DerivationRecord]
+        """
+        if len(derivations) <= 1 or (not self.priorityPruning and
+                                     (self.maxDerivations is None or len(derivations) <= self.maxDerivations)):
+            return derivations
+
+        priorities = [d.priorities() for d in derivations]
+
+        if self.priorityPruning:
+            best = max(priorities)
+            selected = [i for i, p in enumerate(priorities) if p == best]
+        else:
+            selected = range(len(derivations))
+
+        if self.maxDerivations is not None and len(selected) > self.maxDerivations:
+            # řazení je stabilní, takže při shodě priorit zůstávají první derivace
+            selected = sorted(sorted(selected, key=lambda i: priorities[i], reverse=True)[:self.maxDerivations])
+
+        return [derivations[i] for i in selected]
+
+    def matchBits(self, token):
+        """
+        Získá bitovou množinu terminálů gramatiky (viz _terminalBits), kterým token odpovídá.
+        Množina je vypočtena jednou pro každý podpis tokenu (viz Token.matchSignature).
+
+        :param token: Token pro porovnání.
+        :type token: Token
+        :return: Bitová množina terminálů.
+        :rtype: int
+        """
+        signature = token.matchSignature()
+        try:
+            return self._precomputedMatchBits[signature]
+        except KeyError:
+            pass
+
+        try:
+            return self._matchBits[signature]
+        except KeyError:
+            bits = self._computeMatchBits(token)
+            self._matchBits[signature] = bits
+            return bits
+
+    def _computeMatchBits(self, token):
+        """
+        Vypočte bitovou množinu terminálů gramatiky (viz _terminalBits), kterým token odpovídá. Nepoužívá cache.
+
+        :param token: Token pro porovnání.
+        :type token: Token
+        :return: Bitová množina terminálů.
+        :rtype: int
+        """
+        bits = 0
+        for t, bit in self._terminalBits.items():
+            if t.tokenMatchWithoutCache(token):
+                bits |= bit
+        return bits
+
+    def precomputeMatches(self, tokens):
+        """
+        Předem vypočte bitové množiny terminálů (viz matchBits) pro dané tokeny, aby se během syntaktické analýzy
+        již pouze vyhledávaly.
+        Vypočtené množiny nejsou omezeny velikostí cache (MATCH_BITS_CACHE_SIZE), zůstávají uloženy po celou
+        dobu života gramatiky. Jsou uloženy pro každé slovo (a druh tokenu) jen jednou, jejich počet je tedy
+        omezen slovníkem. Tokeny s analýzou závislou na jméně se předem nepočítají, ty jsou ukládány pouze
+        do omezené cache.
+
+        :param tokens: Tokeny, pro které se mají bitové množiny vypočítat.
+        :type tokens: Iterable[Token]
+        """
+        for t in tokens:
+            signature = t.matchSignature()
+            if signature in self._precomputedMatchBits:
+                continue
+
+            if len(signature) > 1 and signature[1] is not None and len(signature[1]) > 1:
+                # analýza závislá na jméně (viz MorphoAnalyzer.analysisKey)
+                continue
+
+            self._precomputedMatchBits[signature] = self._computeMatchBits(t)
+
+    def terminalMatch(self, terminal, token):
+        """
+        Určuje zda daný token odpovídá terminálu gramatiky.
+
+        :param terminal: Terminál gramatiky.
+        :type terminal: Terminal
+        :param token: Token pro kontrolu.
+        :type token: Token
+        :return: Vrací True, pokud odpovídá. Jinak false.
+        :rtype: bool
+        """
+        bit = self._terminalBits.get(terminal)
+        if bit is None:
+            return terminal.tokenMatch(token, self._terminalMatchCache)
+
+        return self.matchBits(token) & bit != 0
+
+    def _rulesFor(self, nonterminal, token):
+        """
+        Vybere z kompaktní tabulky všechna pravidla, která je možné aplikovat pro daný token na vstupu a neterminál
+        na zásobníku. Stejně jako ParsingTableSymbolRow používá cache s podpisem tokenu jako klíčem.
+
+        :param nonterminal: Id neterminálu.
+        :type nonterminal: int
+        :param token: Token na vstupu.
+        :type token: Token
+        :return: Id použitelných pravidel (seřazená).
+        :rtype: Tuple[int, ...]
+        """
+
+        key = (nonterminal, token.matchSignature(*self._compactTableNeeds[nonterminal]))
+        try:
+            return self._tableCache[key]
+        except KeyError:
+            bits = self.matchBits(token)
+            res = set()
+            for terminal, bit, ruleIds in self._compactTable[nonterminal]:
+                if (bits & bit != 0) if bit else terminal.tokenMatch(token, self._terminalMatchCache):
+                    res.update(ruleIds)
+
+            res = tuple(sorted(res))
+            self._tableCache[key] = res
+            return res
+
+    def _checkTimeout(self):
+        """
+        Kontrola na timeout prováděná v průběhu analýzy. Volá se, když počet kroků analýzy dosáhne
+        _nextStepsCheck. Hodiny jsou kontrolovány pouze každých timeoutCheckSteps kroků, aby samotná kontrola
+        nezdržovala.
+
+        :raise TimeoutException: Byl překročen maximální počet kroků nebo doba analýzy.
+        """
+        if self.maxSteps is not None and self._steps > self.maxSteps:
+            raise self.TimeoutException()
+
+        if self._analyzeDeadline is not None and time.monotonic() >= self._analyzeDeadline:
+            raise self.TimeoutException()
+
+        self._nextStepsCheck = self._steps + self.timeoutCheckSteps
+        if self.maxSteps is not None and self._nextStepsCheck > self.maxSteps + 1:
+            self._nextStepsCheck = self.maxSteps + 1
+
+    @staticmethod
+    def _parsingState(stack, position):
+        """
+        Vytvoří neměnnou identifikaci stavu syntaktické analýzy, od kterého se odvíjí zbytek analýzy.
+
+        :param stack: Aktuální obsah zásobníku (viz putRuleOnStack).
+        :type stack: Optional[Tuple[int, Tuple]]
+        :param position: Index aktuálního tokenu.
+        :type position: integer
+        :return: Identifikace stavu.
+        :rtype: Tuple
+        """
+        # zásobník je neměnný, takže jej můžeme použít přímo
+        return stack, position
+
+    def crawling(self, stack, tokens, position, memo=None):
         """
         Provádí analýzu zda-li posloupnost daných tokenů patří do jazyka definovaného gramatikou. Vrací posloupnost
         použitých pravidel. Nezastaví se na první vhodné posloupnosti pravidel, ale hledá všechny možné.
@@ -1998,41 +2591,86 @@ class Grammar(object):
         Tato metoda slouží především pro možnost implementace zpětného navracení při selhání, či hledání další vhodné
         posloupnosti pravidel.
         
-        :param stack: Aktuální obsah zásobníku. (modifukuje jej)
-        :type stack: list(Symbol)
+        :param stack: Aktuální obsah zásobníku (viz putRuleOnStack).
+        :type stack: Optional[Tuple[int, Tuple]]
         :param tokens: posloupnost tokenů na vstupu
         :type tokens: list(Token)
         :param position: Index aktuálního tokenu. Definuje část vstupní posloupnosti tokenů, kterou budeme procházet.
             Od předaného indexu do konce.
         :type position: integer
-        :return: Dvojici s listem listu pravidel určujících všechny možné derivace a list listů analyzovaných tokenů.
-        :rtype: (list(list(Rule)), list(list(AnalyzedToken)))
+        :param memo: Zapamatované výsledky již analyzovaných stavů v rámci aktuální analýzy.
+            Stav (viz _parsingState) -> výsledek (None pokud stav nevede k žádné derivaci).
+            Pokud je None, tak se výsledky nepamatují.
+        :type memo: Optional[Dict[Tuple, Optional[List[DerivationRecord]]]]
+        :return: Záznamy všech možných derivací (zbytků od dané pozice).
+        :rtype: List[DerivationRecord]
         :raise NotInLanguage: Řetězec není v jazyce generovaným danou gramatikou.
         :raise TimeoutException: Při provádění syntaktické analýzy, nad daným řetězcem, došlo k timeoutu.
         """
-        if self.timeout is not None:
-            # kontrola na timeout
-            if (time.time() - self.analyzeStartTime) * 1000 >= self.timeout:
-                # překročen timeout -> končíme
-                raise self.TimeoutException()
+        if memo is None:
+            return self._crawling(stack, tokens, position, memo)
+
+        state = self._parsingState(stack, position)
+        try:
+            res = memo[state]
+            self.grammarMemoHits += 1
+        except KeyError:
+            self.grammarMemoMisses += 1
+            try:
+                res = self._crawling(stack, tokens, position, memo)
+            except self.NotInLanguage:
+                res = None
+            memo[state] = res
+
+        if res is None:
+            raise self.NotInLanguage()
+
+        # záznamy derivací jsou neměnné, takže je můžeme sdílet
+        return res
+
+    def _crawling(self, stack, tokens, position, memo):
+        """
+        Samotná analýza pro crawling bez pamatování výsledku pro daný stav.
 
+        :param stack: Aktuální obsah zásobníku (viz putRuleOnStack).
+        :type stack: Optional[Tuple[int, Tuple]]
+        :param tokens: posloupnost tokenů na vstupu
+        :type tokens: list(Token)
+        :param position: Index aktuálního tokenu.
+        :type position: integer
+        :param memo: Zapamatované výsledky již analyzovaných stavů. Předává se dalším voláním crawling.
+        :type memo: Optional[Dict]
+        :return: Záznamy všech možných derivací (zbytků od dané pozice).
+        :rtype: List[DerivationRecord]
+        :raise NotInLanguage: Řetězec není v jazyce generovaným danou gramatikou.
+        :raise TimeoutException: Při provádění syntaktické analýzy, nad daným řetězcem, došlo k timeoutu.
+        """
         aTokens = []  # analyzované tokeny
         rules = []  # použitá pravidla
 
-        while len(stack) > 0:
-            s = stack.pop()
+        while stack is not None:
+            self._steps += 1
+            if self._steps >= self._nextStepsCheck:
+                # kontrola na timeout
+                self._checkTimeout()
+
+            s, stack = stack
+            symbol = s >> 1
             token = tokens[position]
 
-            if s.isTerm:
+            if symbol >= self._nNonterminals:
                 # terminál na zásobníku
-                if s.val.tokenMatch(token):
+                terminal = self._symbols[symbol]
+                bit = self._symbolBits[symbol]
+                if (self.matchBits(token) & bit != 0) if bit else \
+                        terminal.tokenMatch(token, self._terminalMatchCache):
                     # stejný token můžeme se přesunout
                     # token odpovídá terminálu na zásobníku
                     position += 1
 
                     aTokens.append(AnalyzedToken(token,
                                                  False if token.type == Token.Type.ANALYZE_UNKNOWN else
-                                                 s.isMorph and s.val.morph, s.val))  # s je odpovídající terminál
+                                                 bool(s & 1) and terminal.morph, terminal))
 
                 else:
                     # chyba rozdílný terminál na vstupu a zásobníku
@@ -2042,9 +2680,7 @@ class Grammar(object):
 
                 # vybereme všechna možná pravidla pro daný token na vstupu a symbol na zásobníku
 
-                actRules = self._table[s.val][token]
-
-                # díky použité třídě ParsingTableSymbolRow si můžeme dovolit použít přímo token
+                actRules = self._rulesFor(symbol, token)
 
                 if not actRules:
                     # v gramatice neexistuje vhodné pravidlo
@@ -2052,72 +2688,178 @@ class Grammar(object):
 
                 if len(actRules) == 1:
                     # jedno možné pravidlo
-                    r = next(iter(actRules))
-                    self.putRuleOnStack(r, stack, s.isMorph)
-                    rules.append(r)
+                    r = actRules[0]
+                    stack = self.putRuleOnStack(r, stack, s & 1)
+                    rules.append(self._rulesById[r])
 
                 else:
                     # více možných pravidel
                     # pro každou možnou derivaci zavoláme rekurzivně tuto metodu
-                    newRules = []
-                    newATokens = []
+                    # zbytky derivací od aktuální pozice s pravidly úseku, kterým začínají
+                    continuations = []
 
                     for r in actRules:
                         try:
-                            # prvně aplikujeme pravidlo na nový stack
-                            newStack = stack.copy()
-                            self.putRuleOnStack(r, newStack, s.isMorph)
+                            # prvně aplikujeme pravidlo na zásobník, původní zásobník zůstává nezměněn
+                            newStack = self.putRuleOnStack(r, stack, s & 1)
 
                             # zkusíme zdali s tímto pravidlem uspějeme
-                            resRules, resATokens = self.crawling(newStack, tokens, position)
-
-                            if resRules and resATokens:
-                                # zaznamenáme aplikováná pravidla a analyzované tokeny
-                                # může obsahovat i více různých derivací
-                                for x in resRules:
-                                    # musíme předřadit aktuální pravidlo a pravidla předešlá
-                                    newRules.append(rules + [r] + x)
+                            res = self.crawling(newStack, tokens, position, memo)
 
-                                for x in resATokens:
-                                    # musíme předřadit předešlé analyzované tokeny
-                                    newATokens.append(aTokens + x)
+                            # zaznamenáme zbytky derivací, může obsahovat i více různých derivací
+                            # pravidla úseku jsou společná pro všechny zbytky
+                            segmentRules = rules + [self._rulesById[r]]
+                            continuations.extend((segmentRules, x) for x in res)
 
                         except self.NotInLanguage:
                             # tato větev nikam nevede, takže ji prostě přeskočíme
                             pass
 
-                    if len(newRules) == 0:
+                    if len(continuations) == 0:
                         # v gramatice neexistuje vhodné pravidlo
                         raise self.NotInLanguage()
 
-                    # jelikož jsme zbytek prošli rekurzivním voláním, tak můžeme již skončit
-                    return newRules, newATokens
+                    # Jelikož jsme zbytek prošli rekurzivním voláním, tak můžeme již skončit.
+                    # Předešlé analyzované tokeny jsou sdíleny všemi zbytky.
+                    # Všechny derivace mají stejný začátek, takže o výběru nejlepších rozhodují jen jejich zbytky.
+                    # Větve, které prohrály, tak nejsou dále kombinovány s ostatními.
+                    return self._bestDerivations([DerivationRecord(sR, aTokens, x) for sR, x in continuations])
 
         # Již jsme vyčerpali všechny možnosti. Příjmáme naši část vstupní pousloupnosti a končíme.
         # Zde se dostaneme pouze pokud jsme po cestě měli možnost aplikovat pouze jen přímo
         # terminály a nebo vždy právě jedno pravidlo.
-        return [rules], [aTokens]
+        return [DerivationRecord(rules, aTokens)]
+
+    def forestCrawling(self, stack, tokens, position, forests) -> Optional[ParseForestNode]:
+        """
+        Stejně jako crawling hledá všechny derivace, ale namísto jejich výčtu vytváří sdílený les derivací.
+        Výsledky pro jednotlivé stavy analýzy (obsah zásobníku a pozice ve vstupu) jsou ukládány do forests,
+        takže se každý stav analyzuje pouze jednou, i když k němu vede více alternativ.
+
+        :param stack: Aktuální obsah zásobníku (viz putRuleOnStack).
+        :type stack: Optional[Tuple[int, Tuple]]
+        :param tokens: posloupnost tokenů na vstupu
+        :type tokens: list(Token)
+        :param position: Index aktuálního tokenu.
+        :type position: integer
+        :param forests: Již analyzované stavy. Stav -> uzel lesa (None pokud ze stavu nevede žádná derivace).
+        :type forests: Dict[Tuple, Optional[ParseForestNode]]
+        :return: Uzel lesa derivací. None pokud ze stavu nevede žádná derivace.
+        :rtype: Optional[ParseForestNode]
+        :raise TimeoutException: Při provádění syntaktické analýzy, nad daným řetězcem, došlo k timeoutu.
+        """
+
+        state = self._parsingState(stack, position)
+        try:
+            return forests[state]
+        except KeyError:
+            pass
+
+        node = ParseForestNode()
+
+        try:
+            while stack is not None:
+                self._steps += 1
+                if self._steps >= self._nextStepsCheck:
+                    # kontrola na timeout
+                    self._checkTimeout()
+
+                s, stack = stack
+                symbol = s >> 1
+                token = tokens[position]
+
+                if symbol >= self._nNonterminals:
+                    # terminál na zásobníku
+                    terminal = self._symbols[symbol]
+                    bit = self._symbolBits[symbol]
+                    if not ((self.matchBits(token) & bit != 0) if bit else
+                            terminal.tokenMatch(token, self._terminalMatchCache)):
+                        # chyba rozdílný terminál na vstupu a zásobníku
+                        raise self.NotInLanguage()
+
+                    position += 1
+                    node.aTokens.append(AnalyzedToken(token,
+                                                      False if token.type == Token.Type.ANALYZE_UNKNOWN else
+                                                      bool(s & 1) and terminal.morph, terminal))
+                else:
+                    # neterminál na zásobníku
+                    actRules = self._rulesFor(symbol, token)
 
-    def putRuleOnStack(self, rule: Rule, stack, morph):
+                    if not actRules:
+                        # v gramatice neexistuje vhodné pravidlo
+                        raise self.NotInLanguage()
+
+                    if len(actRules) == 1:
+                        # jedno možné pravidlo
+                        r = actRules[0]
+                        stack = self.putRuleOnStack(r, stack, s & 1)
+                        node.rules.append(self._rulesById[r])
+                    else:
+                        # více možných pravidel, zbytek analýzy je v alternativách
+                        node.alternatives = []
+                        for r in actRules:
+                            newStack = self.putRuleOnStack(r, stack, s & 1)
+
+                            child = self.forestCrawling(newStack, tokens, position, forests)
+                            if child is not None:
+                                node.alternatives.append((self._rulesById[r], child))
+
+                        if len(node.alternatives) == 0:
+                            # v gramatice neexistuje vhodné pravidlo
+                            raise self.NotInLanguage()
+
+                        if self.priorityPruning:
+                            # ponecháme pouze alternativy s nejvyššími prioritami (alternativy jsou již prořezány)
+                            best = max(child.priorities for _, child in node.alternatives)
+                            node.alternatives = [(r, child) for r, child in node.alternatives
+                                                 if child.priorities == best]
+                            node.priorities = tuple(t.matchingTerminal.priority for t in node.aTokens) + best
+                        elif self.maxDerivations is not None:
+                            # Nejlepší derivace uzlu jsou mezi nejlepšími derivacemi alternativ, protože mají
+                            # všechny stejný začátek. Uzel si tak drží nejvýše maxDerivations derivací.
+                            node.best = []
+                            for r, child in node.alternatives:
+                                rules = node.rules + [r]
+                                node.best.extend(DerivationRecord(rules, node.aTokens, d) for d in child.best)
+                            node.best = self._bestDerivations(node.best)
+                        break
+            else:
+                # analýza došla až na konec bez konfliktu
+                if self.priorityPruning:
+                    node.priorities = tuple(t.matchingTerminal.priority for t in node.aTokens)
+                elif self.maxDerivations is not None:
+                    node.best = [DerivationRecord(node.rules, node.aTokens)]
+
+        except self.NotInLanguage:
+            node = None
+
+        forests[state] = node
+        return node
+
+    def putRuleOnStack(self, rule: int, stack, morph):
         """
         Vloží pravou stranu pravidla na zásobník.
-        
-        :param rule: Pravidlo pro vložení.
-        :type rule: Rule
-        :param stack: Zásobník pro manipulaci. Obsahuje výsledek.
-        :type stack:list
+        Zásobník je neměnný zřetězený seznam dvojic (symbol na vrcholu, zbytek zásobníku), prázdný zásobník je None.
+        Symboly jsou zakódované viz _makeCompactTable. Zásobníky vzniklé z jednoho zásobníku tak sdílejí jeho obsah
+        a při konfliktu jej není nutné kopírovat.
+        
+        :param rule: Id pravidla pro vložení.
+        :type rule: int
+        :param stack: Zásobník, na který se vkládá. (nemodifikuje jej)
+        :type stack: Optional[Tuple[int, Tuple]]
         :param morph: Příznak ohýbání slov.
-        :type morph: bool
+        :type morph: bool | int
+        :return: Nový zásobník s pravou stranou pravidla na vrcholu.
+        :rtype: Optional[Tuple[int, Tuple]]
         """
 
-        for rulePart in reversed(rule.rightSide):
-            if rulePart != self.EMPTY_STR:  # prázdný symbol nemá smysl dávat na zásobník
-                isTerminal = rulePart in self._terminals or rulePart == self.EMPTY_STR
-                # aby se jednalo o ohebnou část jména musíme se nacházet v ohebné částistromu (morph=true)
-                # a navíc pokud máme neterminál, tak musím zkontrolovat zda-li se nedostáváme do neohebné části
-                # rulePart.val[0]!=self.NON_GEN_MORPH_SIGN
-                shouldMorph = morph and (True if isTerminal else rulePart[0] != self.NON_GEN_MORPH_SIGN)
-                stack.append(Symbol(rulePart, isTerminal, shouldMorph))
+        # aby se jednalo o ohebnou část jména musíme se nacházet v ohebné části stromu (morph=true)
+        # a navíc pokud máme neterminál, tak musím zkontrolovat zda-li se nedostáváme do neohebné části,
+        # obojí je již předpočítáno v _rulePushes
+        for s in self._rulePushes[rule][morph]:
+            stack = (s, stack)
+
+        return stack
 
     @classmethod
     def getMorphMask(cls, rules, morph=True):
@@ -2463,6 +3205,87 @@ class Grammar(object):
 
         # Jen pro testovani self.printParsingTable()
 
+    def _makeCompactTable(self):
+        """
+        Převede gramatiku s parsovací tabulkou do kompaktní podoby s celočíselnými id, se kterou pracuje
+        syntaktická analýza.
+
+        Symboly mají id dle pozice v _symbols, nejprve neterminály (id < _nNonterminals) a poté terminály.
+        Terminály, které se liší pouze příznakem ohýbání (není součástí rovnosti), mají různá id.
+        Na zásobníku je symbol zakódován jako (id << 1) | příznak ohýbání.
+
+        Pravidla mají id dle pozice v _rulesById. Pro každé pravidlo je v _rulePushes dvojice posloupností
+        zakódovaných symbolů, které se vkládají na zásobník (pravá strana v obráceném pořadí bez prázdného řetězce)
+        pro neohebnou (index 0) a ohebnou (index 1) část stromu.
+
+        Řádek kompaktní tabulky (index je id neterminálu) obsahuje pro každý terminál s neprázdnou buňkou
+        trojici: terminál, jeho bit v bitových množinách shody (viz matchBits, 0 pokud jej nemá) a id pravidel.
+        """
+
+        # bit terminálu v bitových množinách shody tokenů s terminály (viz matchBits), obsahuje pouze terminály,
+        # které nepotřebují volitelné části podpisu tokenu, ostatní používají Terminal.tokenMatch
+        self._terminalBits = {t: 1 << i for i, t in
+                              enumerate(t for t in sorted(self._terminals, key=str)
+                                        if not any(t.matchSignatureNeeds))}
+
+        self._symbols = sorted(self._nonterminals)
+        self._nNonterminals = len(self._symbols)
+        symbolIds = {n: i for i, n in enumerate(self._symbols)}
+
+        # terminál -> id, musíme rozlišit i příznak ohýbání, který se do rovnosti terminálů nepočítá
+        terminalIds = {}
+
+        def terminalId(t):
+            try:
+                return terminalIds[(t, t.morph)]
+            except KeyError:
+                terminalIds[(t, t.morph)] = len(self._symbols)
+                self._symbols.append(t)
+                return terminalIds[(t, t.morph)]
+
+        self._rulesById = sorted(self._rules, key=str)
+        self._rulePushes = []
+
+        for r in self._rulesById:
+            pushes = ([], [])
+            for rulePart in reversed(r.rightSide):
+                if rulePart == self.EMPTY_STR:
+                    # prázdný symbol nemá smysl dávat na zásobník
+                    continue
+
+                if isinstance(rulePart, Terminal):
+                    symbol = terminalId(rulePart)
+                    # terminál v ohebné části stromu je ohebný
+                    shouldMorph = True
+                else:
+                    symbol = symbolIds[rulePart]
+                    # neterminál může začínat neohebnou část stromu
+                    shouldMorph = rulePart[0] != self.NON_GEN_MORPH_SIGN
+
+                pushes[0].append(symbol << 1)
+                pushes[1].append(symbol << 1 | shouldMorph)
+
+            self._rulePushes.append((tuple(pushes[0]), tuple(pushes[1])))
+
+        ruleIds = {r: i for i, r in enumerate(self._rulesById)}
+
+        self._compactTable = []
+        self._compactTableNeeds = []
+        for n in self._symbols[:self._nNonterminals]:
+            row = tuple((t, self._terminalBits.get(t, 0), tuple(sorted(ruleIds[r] for r in cell)))
+                        for t, cell in self._table[n].items() if cell)
+            self._compactTable.append(row)
+            self._compactTableNeeds.append((any(t.matchSignatureNeeds[0] for t, _, _ in row),
+                                            any(t.matchSignatureNeeds[1] for t, _, _ in row)))
+
+        # konec vstupu a počáteční symbol, které se vkládají na zásobník na začátku analýzy
+        self._eofSymbol = terminalId(Terminal(Terminal.Type.EOF)) << 1 | True
+        self._startSymbol = symbolIds[self._startS] << 1 | (self._startS[0] != self.NON_GEN_MORPH_SIGN)
+
+        # bit terminálu v bitových množinách shody pro id symbolu (0 pro neterminály a terminály bez bitu)
+        self._symbolBits = [0] * self._nNonterminals + [self._terminalBits.get(t, 0)
+                                                        for t in self._symbols[self._nNonterminals:]]
+
     '''
     Jen pro testovani
     Potřebuje importovat pandas.
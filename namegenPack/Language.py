@@ -6,12 +6,17 @@ Modul pro práci s jazykem.
 :author:     Martin Dočekal
 """
 import ast
+import hashlib
+import importlib.util
+import logging
 import os
 from typing import Optional, Set
 
 from namegenPack.Errors import ExceptionMessageCode, ErrorMessenger
-from namegenPack.Grammar import Grammar, Lex, InvalidGrammarException
-from namegenPack.morpho.MorphoAnalyzer import MorphoAnalyzerLibma
+from namegenPack.Grammar import Grammar, Lex, InvalidGrammarException, Terminal
+from namegenPack.morpho.MACache import MACache
+from namegenPack.morpho.MALexicon import MALexicon, MorphoAnalyzerLexicon
+from namegenPack.morpho.MorphoAnalyzer import MorphoAnalyzerLibma, MACoprocess, MAProjection, MorphoAnalyzerPython
 
 
 class Language(object):
@@ -43,7 +48,12 @@ class Language(object):
 
     def __init__(self, langFolder: str, gFemale: str, gMale: str, gLocations: str, gEvents: str, titles: str, eqGen: str,
                  ma: str,
-                 gTimeout: Optional[int]):
+                 gTimeout: Optional[int], maCache: Optional[str] = None, maWorkers: int = 1,
+                 maOnDemand: bool = False, maLazyForms: bool = False, maProjection: bool = False,
+                 maBackend: str = "libma", maLexicon: Optional[str] = None, maModule: Optional[str] = None,
+                 grammarCache: Optional[str] = None, gParser: str = Grammar.PARSER_BACKTRACKING,
+                 gMemoize: bool = False, gPriorityPruning: bool = False, gMaxDerivations: Optional[int] = None,
+                 gMaxSteps: Optional[int] = None, gTimeoutCheckSteps: int = 1):
         """
         Načte jazyk z jeho složky.
 
@@ -68,6 +78,44 @@ class Language(object):
         :type ma: str
         :param gTimeout: Timeout pro gramatiky.
         :type gTimeout: Optional[int]
+        :param maCache: Cesta ke složce s perzistentními úložišti analýz z morfologického analyzátoru.
+            Každý jazyk má v ní svůj soubor. None vypíná použití úložiště.
+        :type maCache: Optional[str]
+        :param maWorkers: Počet souběžně běžících procesů morfologického analyzátoru.
+        :type maWorkers: int
+        :param maOnDemand: True -> morfologický analyzátor zůstane spuštěný a je dotazován i na slova, která nebyla
+            předána při inicializaci.
+        :type maOnDemand: bool
+        :param maLazyForms: True -> dvoufázová analýza. Počáteční analýza získá pouze značky slov a tvary jsou
+            dotazovány až u běžícího analyzátoru pro slova, která je potřebují.
+        :type maLazyForms: bool
+        :param maProjection: True -> z analýz jsou již při načítání zahozena pravidla a tvary, které nemohou být
+            použity žádným terminálem gramatik jazyka.
+        :type maProjection: bool
+        :param maBackend: Název způsobu získávání analýz (klíč z MA_BACKENDS).
+        :type maBackend: str
+        :param maLexicon: Název souboru s předem zkompilovaným lexikonem analýz (viz compile_lexicon.py).
+            Používá se pouze se způsobem lexicon.
+        :type maLexicon: Optional[str]
+        :param maModule: Název python souboru s morfologickým analyzátorem, který běží přímo v procesu.
+            Používá se pouze se způsobem python.
+        :type maModule: Optional[str]
+        :param grammarCache: Cesta ke složce se zkompilovanými gramatikami. None vypíná jejich ukládání.
+        :type grammarCache: Optional[str]
+        :param gParser: Parser pro syntaktickou analýzu gramatikami (jeden z Grammar.PARSERS).
+        :type gParser: str
+        :param gMemoize: True -> gramatiky si v rámci jedné syntaktické analýzy pamatují výsledky již analyzovaných
+            stavů.
+        :type gMemoize: bool
+        :param gPriorityPruning: True -> gramatiky zahazují již během syntaktické analýzy derivace, které prohrají
+            při filtrování na základě priorit terminálů.
+        :type gPriorityPruning: bool
+        :param gMaxDerivations: Maximální počet derivací jedné syntaktické analýzy. None -> neomezeno.
+        :type gMaxDerivations: Optional[int]
+        :param gMaxSteps: Maximální počet kroků jedné syntaktické analýzy. None -> neomezeno.
+        :type gMaxSteps: Optional[int]
+        :param gTimeoutCheckSteps: Po kolika krocích syntaktické analýzy se kontroluje timeout.
+        :type gTimeoutCheckSteps: int
         """
 
         self.code = os.path.split(langFolder)[-1]
@@ -75,15 +123,27 @@ class Language(object):
 
         grammarsPath = os.path.join(langFolder, "grammars")
 
+        def cachePath(g):
+            return None if grammarCache is None else \
+                os.path.join(grammarCache, self.code + "_" + os.path.splitext(g)[0] + ".pickle")
+
         grammar = "female"  # just to mark which grammar is problematic
         try:
-            self.gFemale = Grammar(os.path.join(grammarsPath, gFemale), gTimeout)
+            self.gFemale = Grammar(os.path.join(grammarsPath, gFemale), gTimeout, cachePath(gFemale),
+                                   gParser, gMemoize, gPriorityPruning, gMaxDerivations, gMaxSteps,
+                                   gTimeoutCheckSteps)
             grammar = "male"
-            self.gMale = Grammar(os.path.join(grammarsPath, gMale), gTimeout)
+            self.gMale = Grammar(os.path.join(grammarsPath, gMale), gTimeout, cachePath(gMale),
+                                 gParser, gMemoize, gPriorityPruning, gMaxDerivations, gMaxSteps,
+                                 gTimeoutCheckSteps)
             grammar = "locations"
-            self.gLocations = Grammar(os.path.join(grammarsPath, gLocations), gTimeout)
+            self.gLocations = Grammar(os.path.join(grammarsPath, gLocations), gTimeout, cachePath(gLocations),
+                                      gParser, gMemoize, gPriorityPruning, gMaxDerivations, gMaxSteps,
+                                      gTimeoutCheckSteps)
             grammar = "events"
-            self.gEvents = Grammar(os.path.join(grammarsPath, gEvents), gTimeout)
+            self.gEvents = Grammar(os.path.join(grammarsPath, gEvents), gTimeout, cachePath(gEvents),
+                                   gParser, gMemoize, gPriorityPruning, gMaxDerivations, gMaxSteps,
+                                   gTimeoutCheckSteps)
 
         except InvalidGrammarException as e:
             e.message = "\n" + grammar + "\n" + e.message
@@ -98,6 +158,21 @@ class Language(object):
 
         self.lex = Lex(self.titles)
         self._maPath = os.path.join(langFolder, ma)
+        # analýzy bez tvarů (dvoufázová analýza) ukládáme odděleně od úplných
+        self._maCachePath = None if maCache is None else \
+            os.path.join(maCache, self.code + (".tags.pickle" if maLazyForms else ".pickle"))
+        self._maWorkers = maWorkers
+        self._maOnDemand = maOnDemand
+        self._maLazyForms = maLazyForms
+        self._maProjection = maProjection
+        self._maBackend = maBackend
+        # Jazyky, které lexikon či modul nemají, používají morfologický analyzátor.
+        self._maLexiconPath = None
+        if maLexicon and os.path.isfile(os.path.join(langFolder, maLexicon)):
+            self._maLexiconPath = os.path.join(langFolder, maLexicon)
+        self._maModulePath = None
+        if maModule and os.path.isfile(os.path.join(langFolder, maModule)):
+            self._maModulePath = os.path.join(langFolder, maModule)
 
         self._ma = None
 
@@ -121,7 +196,129 @@ class Language(object):
         :param words: Slova pro inicializaci
         """
 
-        self._ma = MorphoAnalyzerLibma(self._maPath, words)
+        projection = self.createMAProjection() if self._maProjection else None
+        self._ma = self.MA_BACKENDS[self._maBackend](self, words, projection)
+
+    def closeMAnalyzer(self):
+        """
+        Uvolní prostředky morfologického analyzátoru (běžící procesy ma, lexikon).
+        Pokud analyzátor nebyl inicializován, nic nedělá.
+        """
+        if self._ma is not None:
+            self._ma.close()
+
+    def _initMALibma(self, words: Set[str], projection: Optional[MAProjection]) -> MorphoAnalyzerLibma:
+        """
+        Vytvoří morfologický analyzátor, který spouští ma.
+
+        :param words: Slova pro inicializaci
+        :type words: Set[str]
+        :param projection: Projekce analýz.
+        :type projection: Optional[MAProjection]
+        :return: Morfologický analyzátor.
+        :rtype: MorphoAnalyzerLibma
+        """
+
+        # analýzy s projekcí se liší dle projekce, musí se tedy promítnout i do otisku úložiště
+        cache = None if self._maCachePath is None else \
+            MACache(self._maCachePath, self._maPath, "" if projection is None else projection.key)
+        coprocess = MACoprocess(self._maPath) if self._maOnDemand or self._maLazyForms else None
+        return MorphoAnalyzerLibma(self._maPath, words, cache=cache, workers=self._maWorkers,
+                                   coprocess=coprocess if self._maOnDemand else None,
+                                   formsCoprocess=coprocess if self._maLazyForms else None,
+                                   projection=projection)
+
+    def _initMALexicon(self, words: Set[str], projection: Optional[MAProjection]) -> MorphoAnalyzerLibma:
+        """
+        Vytvoří morfologický analyzátor, který čte analýzy z předem zkompilovaného lexikonu.
+
+        :param words: Slova pro inicializaci
+        :type words: Set[str]
+        :param projection: Projekce analýz.
+        :type projection: Optional[MAProjection]
+        :return: Morfologický analyzátor.
+        :rtype: MorphoAnalyzerLibma
+        """
+
+        if self._maLexiconPath is None:
+            logging.info("\t" + self.code + ": lexikon analýz nenalezen, bude použit morfologický analyzátor.")
+            return self._initMALibma(words, projection)
+
+        return MorphoAnalyzerLexicon(MALexicon(self._maLexiconPath), words, projection=projection)
+
+    def _initMAPython(self, words: Set[str], projection: Optional[MAProjection]) -> MorphoAnalyzerLibma:
+        """
+        Vytvoří morfologický analyzátor, který běží jako python modul přímo v procesu.
+
+        :param words: Slova pro inicializaci
+        :type words: Set[str]
+        :param projection: Projekce analýz.
+        :type projection: Optional[MAProjection]
+        :return: Morfologický analyzátor.
+        :rtype: MorphoAnalyzerLibma
+        """
+
+        if self._maModulePath is None:
+            logging.info("\t" + self.code + ": modul analyzátoru nenalezen, bude použit morfologický analyzátor.")
+            return self._initMALibma(words, projection)
+
+        spec = importlib.util.spec_from_file_location("namegen_ma_" + self.code, self._maModulePath)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        return MorphoAnalyzerPython(module, words, projection=projection)
+
+    MA_BACKENDS = {
+        "libma": _initMALibma,
+        "lexicon": _initMALexicon,
+        "python": _initMAPython
+    }
+    """Způsoby získávání analýz slov. Název -> metoda, která vytvoří morfologický analyzátor."""
+
+    def createMAProjection(self) -> MAProjection:
+        """
+        Vytvoří projekci analýz na pravidla, která mohou být použita nějakým terminálem gramatik tohoto jazyka.
+
+        Terminál odpovídající slovnímu druhu použije pravidlo, které má jeho slovní druh a hodnoty filtrovacích
+        atributů (s volitelnými atributy, nebo bez nich). Ostatní terminály analýzu nepoužívají, ale slovo, které
+        jim odpovídá, se může ohýbat. Jejich filtry (pouze hodnoty atributů) tedy platí pro slova, která mohou
+        tvořit odpovídající token.
+
+        :return: Projekce analýz.
+        :rtype: MAProjection
+        """
+
+        filters = set()
+        wordFilters = {}
+        titlesHash = hashlib.sha256("\n".join(sorted(self.titles)).encode()).hexdigest()
+
+        for g in [self.gFemale, self.gMale, self.gLocations, self.gEvents]:
+            for t in g.terminals:
+                variants = {frozenset(t.fillteringAttrValues), frozenset(t.fillteringAttrValuesWithoutVoluntary)}
+
+                if t.type.isPOSType:
+                    filters |= {v | {t.type.toPOS()} for v in variants}
+                    continue
+
+                regex = t.getAttribute(Terminal.Attribute.Type.MATCH_REGEX)
+                regex = None if regex is None else regex.value
+
+                description = str(t.type.value)
+                if t.type == Terminal.Type.DEGREE_TITLE:
+                    description += "/" + titlesHash
+                if regex is not None:
+                    description += "/" + regex.pattern
+
+                if description not in wordFilters:
+                    def cond(word, terminalType=t.type, regex=regex):
+                        return self.lex.canBeTokenOfType(word, terminalType) and \
+                               (regex is None or regex.match(word) is not None)
+
+                    wordFilters[description] = (cond, set())
+
+                wordFilters[description][1].update(variants)
+
+        return MAProjection(filters, wordFilters)
 
     @staticmethod
     def _readTitles(pathT) -> Set[str]:
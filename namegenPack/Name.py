@@ -416,7 +416,9 @@ class Name(object):
             if changeTo is None and grammars:
                 for t, g in grammars.items():
                     try:
-                        rules, aTokens = g.analyse(tokens)
+                        # Odhad (např. u češtiny couldNotChange níže) závisí na všech derivacích, nesmí tedy být
+                        # prořezány již během analýzy.
+                        rules, aTokens = g.analyse(tokens, priorityPruning=False)
 
                         if changeTo is None:
                             # zatím odpovídá jedna gramatika
@@ -696,13 +698,13 @@ class Name(object):
                 groupFlags = aToken.matchingTerminal.getAttribute(Terminal.Attribute.Type.FLAGS)
                 groupFlags = set() if groupFlags is None else groupFlags.value
 
-                genMorphsForWords.append(word.morphs(cateMorph, cateWord, groupFlags))
+                genMorphsForWords.append(word.morphsByCase(cateMorph, cateWord, groupFlags))
 
             else:
                 genMorphsForWords.append(None)
 
         # z tvarů slov poskládáme tvary jména
-        # Set[Tuple[MARule,str]]
+        # Dict[Case, FrozenSet[Tuple[str, MARule]]]
         morphs = []
 
         if self.grammar.flexible:
@@ -717,32 +719,11 @@ class Name(object):
             wordsWithRules=[]
             for i, (word, aToken) in enumerate(zip(self._words, analyzedTokens)):
 
-                if aToken.morph and isinstance(genMorphsForWords[i], set):
+                if aToken.morph and isinstance(genMorphsForWords[i], dict):
                     # ohýbáme
 
-                    morphsThatWeAlreadyHaves = set()
-
-                    morphsWithRules=set()
-
-                    for maRule, wordMorph in genMorphsForWords[i]:
-                        # najdeme tvar slova pro daný pád
-                        try:
-                            if maRule[MorphCategories.MorphCategories.CASE] == c:
-                                actMorph = wordMorph + "[" + maRule.lntrfWithoutNote + "]"
-
-                                if actMorph in morphsThatWeAlreadyHaves:
-                                    # Díky tomu, že nezohledňujeme poznámku při výpisu,
-                                    # tak můžeme dostávat tvary, které vypadají totožně a není
-                                    # nutné je tedy vypisovat.
-                                    continue
-
-                                morphsThatWeAlreadyHaves.add(actMorph)
-                                morphsWithRules.add((wordMorph, maRule))
-
-
-                        except KeyError:
-                            # pravděpodobně nemá pád vůbec
-                            pass
+                    # najdeme tvary slova pro daný pád
+                    morphsWithRules = genMorphsForWords[i].get(c, frozenset())
 
                     if len(morphsWithRules)==0:
                         # nepovedlo se získat aktuální pád pro aktuální slovo
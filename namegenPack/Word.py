@@ -7,9 +7,9 @@ Modul pro práci se slovem.
 """
 from enum import Enum
 from namegenPack import Errors
-from namegenPack.morpho.MorphoAnalyzer import MorphoAnalyzer, MorphoAnalyze, MorphCategory
-from namegenPack.morpho.MorphCategories import StylisticFlag, Flag
-from typing import Set
+from namegenPack.morpho.MorphoAnalyzer import MorphoAnalyzer, MorphoAnalyze, MorphCategory, MARule
+from namegenPack.morpho.MorphCategories import StylisticFlag, Flag, Case
+from typing import Set, Dict, Optional, FrozenSet, Tuple, Hashable
 
 
 class WordTypeMark(Enum):
@@ -132,6 +132,25 @@ class Word(object):
 
         return a
 
+    @property
+    def analysisKey(self) -> Hashable:
+        """
+        Klíč morfologické analýzy slova (viz MorphoAnalyzer.analysisKey). Na rozdíl od samotné analýzy jej lze
+        dlouhodobě uchovávat v cache, aniž by analýza zůstávala v paměti.
+
+        :returns: Klíč analýzy slova.
+        :rtype: Hashable
+        :raise WordCouldntGetInfoException: Problém při analýze slova.
+        """
+
+        key = self.name.language.ma.analysisKey(self._w, self.name, self.wordPos)
+        if key is None:
+            raise self.WordCouldntGetInfoException(self, Errors.ErrorMessenger.CODE_WORD_ANALYZE,
+                                                   Errors.ErrorMessenger.getMessage(
+                                                       Errors.ErrorMessenger.CODE_WORD_ANALYZE) + "\t" + self._w)
+
+        return key
+
     def morphs(self, categories: Set[MorphCategory], wordFilter: Set[MorphCategory] = None,
                groupFlags: Set[Flag] = None):
         """
@@ -170,6 +189,30 @@ class Word(object):
                                                  Errors.ErrorMessenger.CODE_WORD_NO_MORPHS_GENERATED) + "\t" + self._w)
         return tmp
 
+    def morphsByCase(self, categories: Set[MorphCategory], wordFilter: Set[MorphCategory] = None,
+                     groupFlags: Set[Flag] = None) -> Dict[Optional[Case], FrozenSet[Tuple[str, MARule]]]:
+        """
+        Stejné jako :func:`~Word.morphs`, ale tvary vrací rozdělené dle pádu a bez tvarů, které se v rámci pádu liší
+        pouze poznámkou.
+
+        :param categories: Kategorie, které musí mít generované tvary.
+        :type categories: Set[MorphCategory]
+        :param wordFilter: Podmínky na původní slovo. Viz :func:`~Word.morphs`.
+        :type wordFilter: Set[MorphCategory]
+        :param groupFlags: Flagy, které musí mít daná skupina vázající se na slovo.
+        :type groupFlags: Set[Flag]
+        :return: Pád -> množina dvojic (tvar, pravidlo). Tvary bez pádu jsou pod klíčem None.
+        :rtype: Dict[Optional[Case], FrozenSet[Tuple[str, MARule]]]
+        :raise WordNoMorphsException: pokud se nepodaří získat tvary.
+        """
+
+        tmp = self.info.getMorphsByCase(categories, {StylisticFlag.COLLOQUIALLY}, wordFilter, groupFlags)
+        if tmp is None or len(tmp) < 1:
+            raise self.WordNoMorphsException(self, Errors.ErrorMessenger.CODE_WORD_NO_MORPHS_GENERATED,
+                                             Errors.ErrorMessenger.getMessage(
+                                                 Errors.ErrorMessenger.CODE_WORD_NO_MORPHS_GENERATED) + "\t" + self._w)
+        return tmp
+
     def __repr__(self):
         return self._w + ("" if self.name is None else (" -> " + str(self.name))) + \
                ("[" + str(self.wordPos)+"]")
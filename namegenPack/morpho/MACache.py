@@ -0,0 +1,175 @@
+# -*- coding: UTF-8 -*-
+""""
+Created on 18.10.26
+Modul obsahující perzistentní úložiště analýz z morfologického analyzátoru.
+
+:author:     Martin Dočekal
+"""
+import hashlib
+import logging
+import os
+import pickle
+import re
+import tempfile
+from typing import Dict, Optional, Any
+
+
+class MACache(object):
+    """
+    Perzistentní (na disku uložená) databáze analýz slov z morfologického analyzátoru pro jeden jazyk.
+
+    Klíčem je slovo a hodnotou jeho analýza (None pro slova, která analyzátor nezná).
+    Databáze je svázána s otiskem (fingerprint) skriptu morfologického analyzátoru a souborů, na které se
+    skript přímo či nepřímo odkazuje (binárka, konfigurace, slovníky). Pokud se otisk změní, je uložená databáze
+    zahozena.
+    """
+
+    VERSION = 1
+    """Verze formátu uložené databáze. Při nekompatibilní změně formátu je nutné zvýšit."""
+
+    PATH_IN_SCRIPT_REGEX = re.compile(r"[^\s\"'=:;|<>]+")
+    """Regulární výraz pro vyhledání potenciálních cest k souborům ve skriptu analyzátoru."""
+
+    MAX_SEARCHED_FILE_SIZE = 1024 * 1024
+    """Maximální velikost souboru v bajtech, který je prohledáván na odkazy na další soubory."""
+
+    def __init__(self, cachePath: str, pathToMa: str, variant: str = ""):
+        """
+        Inicializace úložiště.
+
+        :param cachePath: Cesta k souboru s uloženými analýzami.
+        :type cachePath: str
+        :param pathToMa: Cesta ke skriptu morfologického analyzátoru. Slouží pro výpočet otisku.
+        :type pathToMa: str
+        :param variant: Dodatečná identifikace způsobu zpracování analýz (např. použitá projekce), která se
+            promítá do otisku.
+        :type variant: str
+        """
+        self.cachePath = cachePath
+        self.fingerprint = self.maFingerprint(pathToMa, variant)
+
+    @classmethod
+    def maFingerprint(cls, pathToMa: str, variant: str = "") -> str:
+        """
+        Vypočte otisk morfologického analyzátoru.
+        Otisk je tvořen obsahem skriptu a velikostí s časem poslední modifikace všech existujících souborů,
+        na které se skript odkazuje. Odkazy jsou sledovány i dále (viz _referencedFiles), takže otisk pokrývá
+        i slovníky načítané přes konfigurační soubor analyzátoru (např. czech_dict.conf) nebo složky se slovníky.
+
+        :param pathToMa: Cesta ke skriptu morfologického analyzátoru.
+        :type pathToMa: str
+        :param variant: Dodatečná identifikace způsobu zpracování analýz.
+        :type variant: str
+        :return: Otisk analyzátoru.
+        :rtype: str
+        """
+        h = hashlib.sha256(str(cls.VERSION).encode())
+        h.update(variant.encode())
+
+        with open(pathToMa, "rb") as f:
+            h.update(f.read())
+
+        for p in sorted(cls._referencedFiles(os.path.realpath(pathToMa))):
+            s = os.stat(p)
+            h.update(f"{p}\t{s.st_size}\t{s.st_mtime_ns}\n".encode())
+
+        return h.hexdigest()
+
+    @classmethod
+    def _referencedFiles(cls, path: str):
+        """
+        Vyhledá všechny soubory, na které se daný soubor (přímo i nepřímo) odkazuje.
+        Textové soubory (skripty, konfigurace) jsou prohledávány na cesty k dalším souborům, odkazované složky
+        jsou zahrnuty celé. Relativní cesty jsou brány vůči složce odkazujícího souboru.
+
+        :param path: Cesta k souboru, od kterého se začíná.
+        :type path: str
+        :return: Absolutní cesty k odkazovaným souborům (bez výchozího souboru).
+        :rtype: Set[str]
+        """
+        files = set()
+        visited = {path}
+        toSearch = [path]
+
+        while toSearch:
+            actPath = toSearch.pop()
+            try:
+                if os.path.getsize(actPath) > cls.MAX_SEARCHED_FILE_SIZE:
+                    continue
+                with open(actPath, "rb") as f:
+                    content = f.read().decode()
+            except (OSError, UnicodeDecodeError):
+                # binární soubor (slovník, binárka analyzátoru) již dále neprohledáváme
+                continue
+
+            if "\0" in content:
+                # binární soubor
+                continue
+
+            actDir = os.path.dirname(actPath)
+            content = content.replace("${DIR}", actDir).replace("$DIR", actDir)
+
+            for token in set(cls.PATH_IN_SCRIPT_REGEX.findall(content)):
+                p = os.path.realpath(token if os.path.isabs(token) else os.path.join(actDir, token))
+                if p in visited:
+                    continue
+                visited.add(p)
+
+                if os.path.isfile(p):
+                    files.add(p)
+                    toSearch.append(p)
+                elif os.path.isdir(p) and p != actDir and not actDir.startswith(p + os.sep):
+                    # složka (např. se slovníky), nadřazené složky nezahrnujeme
+                    for root, _, names in os.walk(p):
+                        for n in names:
+                            files.add(os.path.join(root, n))
+
+        return files
+
+    def load(self) -> Dict[str, Optional[Any]]:
+        """
+        Načte uložené analýzy.
+        Pokud úložiště neexistuje, nelze jej přečíst nebo neodpovídá otisk analyzátoru, vrací prázdnou databázi.
+
+        :return: Slovo -> analýza (None pro neznámé slovo).
+        :rtype: Dict[str, Optional[MorphoAnalyze]]
+        """
+
+        try:
+            with open(self.cachePath, "rb") as f:
+                fingerprint, analyses = pickle.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logging.info(f"\tNepodařilo se načíst uložené analýzy z {self.cachePath}: {e}")
+            return {}
+
+        if fingerprint != self.fingerprint:
+            logging.info(f"\tUložené analýzy v {self.cachePath} neodpovídají morfologickému analyzátoru, "
+                         f"budou vytvořeny znovu.")
+            return {}
+
+        return analyses
+
+    def save(self, analyses: Dict[str, Optional[Any]]):
+        """
+        Uloží analýzy. Přepisuje předchozí obsah úložiště.
+
+        :param analyses: Slovo -> analýza (None pro neznámé slovo).
+        :type analyses: Dict[str, Optional[MorphoAnalyze]]
+        """
+        directory = os.path.dirname(self.cachePath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # zapisujeme do dočasného souboru, aby nedošlo k poškození úložiště při přerušení zápisu
+        # dočasný soubor je jedinečný, aby si nepřepisovaly zápis souběžně běžící procesy se stejným úložištěm
+        fd, tmpPath = tempfile.mkstemp(dir=directory or ".", prefix=os.path.basename(self.cachePath) + ".",
+                                       suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((self.fingerprint, analyses), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpPath, self.cachePath)
+        except BaseException:
+            os.remove(tmpPath)
+            raise
@@ -0,0 +1,299 @@
+# -*- coding: UTF-8 -*-
+""""
+Created on 18.10.26
+Modul obsahující předem zkompilovaný lexikon s analýzami z morfologického analyzátoru a nad ním postavený
+morfologický analyzátor.
+
+:author:     Martin Dočekal
+"""
+import mmap
+import os
+import struct
+import tempfile
+from typing import Dict, Iterable, List, Optional
+
+from namegenPack.morpho.MorphoAnalyzer import MorphoAnalyzerInProcess, MAGroupRecord, MAProjection, \
+    MorphoAnalyzerException
+from ..Errors import ErrorMessenger
+
+
+class MALexicon(object):
+    """
+    Binární lexikon s nezpracovanými analýzami (výstupem ma -F -m -n) pro velký slovník slov.
+    Soubor je namapován do paměti (mmap), takže jej mohou sdílet všechny procesy a ze souboru se čtou pouze
+    analýzy slov, na která se dotazujeme.
+
+    Formát souboru (little endian):
+        hlavička (HEADER)
+        tabulka značko pravidel: pro každé pravidlo délka (H) a pravidlo v utf-8
+        slova: zřetězená slova v utf-8 seřazená dle bajtů
+        index: nWords + 1 dvojic (INDEX_ENTRY) offset slova, offset záznamu (poslední dvojice označuje konce)
+        záznamy: pro každé slovo počet skupin (H) a pro každou skupinu
+            příznaky (B), počet pravidel (H), id pravidel (I), počet tvarů (I), pro každý tvar id pravidla (I),
+            délka tvaru (H) a tvar v utf-8
+
+    Offsety slov a záznamů v indexu jsou relativní vůči začátku jejich části souboru.
+    """
+
+    MAGIC = b"NGMALEX\0"
+    """Identifikace souboru s lexikonem."""
+
+    VERSION = 1
+    """Verze formátu lexikonu. Při nekompatibilní změně formátu je nutné zvýšit."""
+
+    HEADER = struct.Struct("<8sIII4xQQQQ")
+    """Magic, verze, počet pravidel, počet slov, offsety tabulky pravidel, slov, indexu a záznamů."""
+
+    INDEX_ENTRY = struct.Struct("<QQ")
+    """Offset slova a offset jeho záznamu."""
+
+    FLAG_GENERAL_WORD = 1
+    """Příznak skupiny: lemma začíná malým písmenem."""
+
+    _U16 = struct.Struct("<H")
+    _U32 = struct.Struct("<I")
+
+    def __init__(self, path: str):
+        """
+        Otevře lexikon.
+
+        :param path: Cesta k souboru s lexikonem.
+        :type path: str
+        :raise MorphoAnalyzerException: Nevalidní soubor s lexikonem.
+        """
+        self.path = path
+
+        with open(path, "rb") as f:
+            try:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # prázdný soubor
+                self._invalid()
+
+        try:
+            magic, version, nTags, self._nWords, tagsOffset, self._wordsOffset, self._indexOffset, \
+                self._recordsOffset = self.HEADER.unpack_from(self._mm, 0)
+        except struct.error:
+            self._invalid()
+
+        if magic != self.MAGIC or version != self.VERSION:
+            self._invalid()
+
+        # tabulku pravidel načteme celou, je malá a pravidla chceme mít jako jedny a tytéž řetězce
+        self._tags = []
+        offset = tagsOffset
+        for _ in range(nTags):
+            length, = self._U16.unpack_from(self._mm, offset)
+            offset += self._U16.size
+            self._tags.append(self._mm[offset:offset + length].decode("utf-8"))
+            offset += length
+
+    def _invalid(self):
+        """
+        Vyhodí vyjímku pro nevalidní soubor s lexikonem.
+
+        :raise MorphoAnalyzerException: Vždy.
+        """
+        raise MorphoAnalyzerException(ErrorMessenger.CODE_MA_INVALID_LEXICON,
+                                      ErrorMessenger.getMessage(ErrorMessenger.CODE_MA_INVALID_LEXICON)
+                                      .format(self.path))
+
+    def __len__(self):
+        return self._nWords
+
+    def __contains__(self, word: str):
+        return self._find(word) is not None
+
+    def _entry(self, i: int):
+        """
+        Získá položku indexu.
+
+        :param i: Pořadí slova v indexu.
+        :type i: int
+        :return: Offset slova a offset jeho záznamu.
+        :rtype: Tuple[int, int]
+        """
+        return self.INDEX_ENTRY.unpack_from(self._mm, self._indexOffset + i * self.INDEX_ENTRY.size)
+
+    def _find(self, word: str) -> Optional[int]:
+        """
+        Vyhledá slovo v indexu (binárním vyhledáváním).
+
+        :param word: Hledané slovo.
+        :type word: str
+        :return: Offset záznamu slova v části se záznamy. None pokud slovo v lexikonu není.
+        :rtype: Optional[int]
+        """
+        word = word.encode("utf-8")
+
+        low, high = 0, self._nWords
+        while low < high:
+            middle = (low + high) // 2
+            wordOffset, recordOffset = self._entry(middle)
+            nextWordOffset, _ = self._entry(middle + 1)
+            actWord = self._mm[self._wordsOffset + wordOffset:self._wordsOffset + nextWordOffset]
+
+            if actWord < word:
+                low = middle + 1
+            elif actWord > word:
+                high = middle
+            else:
+                return recordOffset
+
+        return None
+
+    def get(self, word: str) -> Optional[List[MAGroupRecord]]:
+        """
+        Získá analýzu slova.
+
+        :param word: Slovo pro analýzu.
+        :type word: str
+        :return: Nezpracované skupiny analýzy slova. None pokud slovo v lexikonu není.
+        :rtype: Optional[List[MAGroupRecord]]
+        """
+        recordOffset = self._find(word)
+        if recordOffset is None:
+            return None
+
+        mm = self._mm
+        offset = self._recordsOffset + recordOffset
+
+        nGroups, = self._U16.unpack_from(mm, offset)
+        offset += self._U16.size
+
+        groups = []
+        for _ in range(nGroups):
+            flags, nTags = struct.unpack_from("<BH", mm, offset)
+            offset += 3
+
+            tags = [self._tags[t] for t in struct.unpack_from("<" + str(nTags) + "I", mm, offset)]
+            offset += nTags * self._U32.size
+
+            nForms, = self._U32.unpack_from(mm, offset)
+            offset += self._U32.size
+
+            forms = []
+            for _ in range(nForms):
+                tagId, length = struct.unpack_from("<IH", mm, offset)
+                offset += 6
+                forms.append((self._tags[tagId], mm[offset:offset + length].decode("utf-8")))
+                offset += length
+
+            groups.append(MAGroupRecord(word, bool(flags & self.FLAG_GENERAL_WORD), tags, forms))
+
+        return groups
+
+    def close(self):
+        """
+        Uzavře lexikon.
+        """
+        self._mm.close()
+
+    @classmethod
+    def write(cls, path: str, records: Iterable[MAGroupRecord]):
+        """
+        Vytvoří soubor s lexikonem. Přepisuje předchozí obsah souboru.
+
+        :param path: Cesta k souboru s lexikonem.
+        :type path: str
+        :param records: Nezpracované skupiny z výstupu ma. Skupiny jednoho slova zůstávají v daném pořadí.
+        :type records: Iterable[MAGroupRecord]
+        """
+
+        byWord = {}  # type: Dict[bytes, List[MAGroupRecord]]
+        tagIds = {}  # type: Dict[str, int]
+
+        for r in records:
+            try:
+                byWord[r.word.encode("utf-8")].append(r)
+            except KeyError:
+                byWord[r.word.encode("utf-8")] = [r]
+
+            for t in r.tags:
+                tagIds.setdefault(t, len(tagIds))
+            for t, _ in r.forms:
+                tagIds.setdefault(t, len(tagIds))
+
+        tagsPart = bytearray()
+        for t in tagIds:
+            t = t.encode("utf-8")
+            tagsPart += cls._U16.pack(len(t)) + t
+
+        wordsPart = bytearray()
+        indexPart = bytearray()
+        recordsPart = bytearray()
+
+        for word in sorted(byWord):
+            indexPart += cls.INDEX_ENTRY.pack(len(wordsPart), len(recordsPart))
+            wordsPart += word
+
+            groups = byWord[word]
+            recordsPart += cls._U16.pack(len(groups))
+            for g in groups:
+                recordsPart += struct.pack("<BH", cls.FLAG_GENERAL_WORD if g.generalWord else 0, len(g.tags))
+                recordsPart += struct.pack("<" + str(len(g.tags)) + "I", *(tagIds[t] for t in g.tags))
+                recordsPart += cls._U32.pack(len(g.forms))
+                for t, form in g.forms:
+                    form = form.encode("utf-8")
+                    recordsPart += struct.pack("<IH", tagIds[t], len(form)) + form
+
+        indexPart += cls.INDEX_ENTRY.pack(len(wordsPart), len(recordsPart))
+
+        tagsOffset = cls.HEADER.size
+        wordsOffset = tagsOffset + len(tagsPart)
+        indexOffset = wordsOffset + len(wordsPart)
+        recordsOffset = indexOffset + len(indexPart)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # zapisujeme do dočasného souboru, aby nedošlo k poškození lexikonu, který může být právě používán
+        # dočasný soubor je jedinečný, aby si nepřepisovaly zápis souběžně běžící kompilace
+        fd, tmpPath = tempfile.mkstemp(dir=directory or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(tagIds), len(byWord), tagsOffset, wordsOffset,
+                                        indexOffset, recordsOffset))
+                f.write(tagsPart)
+                f.write(wordsPart)
+                f.write(indexPart)
+                f.write(recordsPart)
+            os.replace(tmpPath, path)
+        except BaseException:
+            os.remove(tmpPath)
+            raise
+
+
+class MorphoAnalyzerLexicon(MorphoAnalyzerInProcess):
+    """
+    Morfologický analyzátor, který čte analýzy z předem zkompilovaného lexikonu (viz MALexicon) namísto
+    spouštění ma.
+    """
+
+    def __init__(self, lexicon: MALexicon, words, hint=None, projection: Optional[MAProjection] = None):
+        """
+        Provede vytvoření objektu Morfologického analyzátoru a načte z lexikonu analýzy daných slov.
+
+        :param lexicon: Lexikon s analýzami.
+        :type lexicon: MALexicon
+        :param words: Slova, jejichž analýzy mají být načteny hned.
+        :type words: set(str)
+        :param hint: Nápověda k hodnotě morfologické kategorie slova.
+            Viz :func:`~MorphoAnalyzerLibma.__init__`.
+        :type hint: :Set[MorphCategory] | Dict[MorphCategory]
+        :param projection: Volitelná projekce analýz.
+        :type projection: Optional[MAProjection]
+        """
+        self._lexicon = lexicon
+        super().__init__(words, hint=hint, projection=projection)
+
+    def _records(self, word: str) -> Optional[List[MAGroupRecord]]:
+        return self._lexicon.get(word)
+
+    def close(self):
+        """
+        Uzavře lexikon.
+        """
+        super().close()
+        self._lexicon.close()
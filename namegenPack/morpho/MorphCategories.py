@@ -82,6 +82,28 @@ class MorphCategory(Enum):
         """
         return self._mappingLntrf[self]
 
+    @property
+    def mask(self) -> int:
+        """
+        Bitová maska hodnoty. Každá hodnota každé morfologické kategorie má přidělen vlastní bit.
+        """
+        return self._masks[self]
+
+    @staticmethod
+    def masksOf(values) -> int:
+        """
+        Bitová maska pro množinu hodnot morfologických kategorií.
+
+        :param values: Hodnoty morfologických kategorií.
+        :type values: Iterable[MorphCategory]
+        :return: Sjednocení masek jednotlivých hodnot.
+        :rtype: int
+        """
+        mask = 0
+        for v in values:
+            mask |= v.mask
+        return mask
+
     def __str__(self):
         return self.lntrfValue
 
@@ -149,6 +171,20 @@ class MorphCategories(Enum):
         """
         return self._lntrfMap[self]
 
+    @property
+    def mask(self) -> int:
+        """
+        Bitová maska všech hodnot této morfologické kategorie.
+        """
+        return self._masks[self]
+
+    @property
+    def multiValued(self) -> bool:
+        """
+        True -> Kategorie může mít v pravidle více hodnot najednou (frozenset).
+        """
+        return self == MorphCategories.NOTE
+
     @classmethod
     def fromLntrf(cls, val):
         """
@@ -526,3 +562,28 @@ MorphCategories._lntrfCatMap = {
     MorphCategories.NOTE: Note.fromLntrf
 }
 """Zobrazení pro lntrf konverzi. Pro tvorbu MorphCategory z lntrf hodnoty s ohledem na aktuální použitou hodnotu z MorphCategories."""
+
+MorphCategories._valuesEnums = {
+    MorphCategories.POS: POS,
+    MorphCategories.GENDER: Gender,
+    MorphCategories.NUMBER: Number,
+    MorphCategories.CASE: Case,
+    MorphCategories.NEGATION: Negation,
+    MorphCategories.DEGREE_OF_COMPARISON: DegreeOfComparison,
+    MorphCategories.PERSON: Person,
+    MorphCategories.STYLISTIC_FLAG: StylisticFlag,
+    MorphCategories.NOTE: Note
+}
+"""Zobrazení morfologické kategorie na výčet jejích hodnot."""
+
+MorphCategory._masks = {}
+"""Bitové masky hodnot morfologických kategorií."""
+MorphCategories._masks = {}
+"""Bitové masky morfologických kategorií (sjednocení masek všech jejich hodnot)."""
+
+for _category, _values in MorphCategories._valuesEnums.items():
+    MorphCategories._masks[_category] = 0
+    for _v in _values:
+        MorphCategory._masks[_v] = 1 << len(MorphCategory._masks)
+        MorphCategories._masks[_category] |= MorphCategory._masks[_v]
+del _category, _values, _v
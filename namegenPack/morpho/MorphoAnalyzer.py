@@ -8,14 +8,21 @@ Tento modul obsahuje třídy pro morfologickou analýzu.
 """
 
 import collections
+import io
 import logging
 import math
+import os
+import shutil
 import string
+import threading
 from abc import ABC, abstractmethod
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from copy import copy
 from subprocess import Popen, PIPE
-from typing import Set, Dict, Tuple, Optional
+from typing import Set, Dict, Tuple, Optional, List, FrozenSet, Iterable, Callable, Hashable
 
+from namegenPack.morpho.MACache import MACache
 from namegenPack.morpho.MorphCategories import *
 from ..Errors import ExceptionMessageCode, ErrorMessenger
 
@@ -24,11 +31,34 @@ class MARule(collections.Mapping):
     """
     Reprezentace pravidla tvaru z morfologické analýzy.
     Pravidlo reprezentuje mluvnické kategorie, které ma dané slovo.
+
+    Pravidlo je neměnné, proto si může hash a podobu ve formátu lntrf spočítat pouze jednou.
     """
 
     def __init__(self, *args, **kwargs):
         self._d = dict(*args, **kwargs)
         self._hash = None
+        self._lntrf = None
+        self._lntrfWithoutNote = None
+        self._computeMasks()
+
+    def _computeMasks(self):
+        """
+        Spočítá bitové masky pravidla.
+            _mask   sjednocení masek všech hodnot pravidla
+            _singleValuedMask   sjednocení masek jednohodnotových kategorií, které pravidlo obsahuje
+            _multiValued   dvojice (kategorie, maska kategorie) vícehodnotových kategorií, které pravidlo obsahuje
+        """
+        self._mask = 0
+        self._singleValuedMask = 0
+        self._multiValued = []
+        for morphCat, morphCatVal in self._d.items():
+            if isinstance(morphCatVal, frozenset):
+                self._mask |= MorphCategory.masksOf(morphCatVal)
+                self._multiValued.append((morphCat, morphCat.mask))
+            else:
+                self._mask |= morphCatVal.mask
+                self._singleValuedMask |= morphCat.mask
 
     def __iter__(self):
         return iter(self._d)
@@ -46,6 +76,24 @@ class MARule(collections.Mapping):
                 self._hash ^= hash(pair)
         return self._hash
 
+    def __getstate__(self):
+        # hash neukládáme, protože hash řetězců (a tedy i kategorií) se mezi běhy interpretu liší
+        return self._d
+
+    def __setstate__(self, state):
+        self._d = state
+        self._hash = None
+        self._lntrf = None
+        self._lntrfWithoutNote = None
+        self._computeMasks()
+
+    @property
+    def mask(self) -> int:
+        """
+        Bitová maska pravidla. Sjednocení masek všech hodnot morfologických kategorií pravidla.
+        """
+        return self._mask
+
     def __str__(self):
         return str(self._d)
 
@@ -64,29 +112,24 @@ class MARule(collections.Mapping):
         :param exceptCat: Kategorie, které nejsou zohledňovány při kontrole na shodu.
         :type exceptCat: Set[MorphCategories]
         """
-        if exceptCat is None:
-            exceptCat = set()
-
-        try:
-            for morphCat, morphCatVal in self.items():
-                if morphCat not in exceptCat:
-                    # kontrolujeme jen ty kategorie, které chceme
-
-                    if isinstance(other[morphCat], frozenset) and isinstance(morphCatVal, frozenset):
-                        # více hodnotové atributy
-                        if (len(morphCatVal) > 0 or len(other[morphCat]) > 0) and len(
-                                morphCatVal & other[morphCat]) == 0:
-                            # Kategorie mají prázdný průnik a nejsou obě prázdné.
-                            return False
-                    else:
-
-                        if other[morphCat] != morphCatVal:
-                            # nemá stejnou hodnotu pro morphcat
-                            return False
-        except KeyError:
-            # asi nemá morphCat vůbec
+        exceptMask = 0
+        if exceptCat is not None:
+            for c in exceptCat:
+                exceptMask |= c.mask
+
+        # Jednohodnotové kategorie mají v pravidle nastaven právě jeden bit, stačí tedy porovnat
+        # bity kategorií, které obsahuje toto pravidlo.
+        checkMask = self._singleValuedMask & ~exceptMask
+        if self._mask & checkMask != other._mask & checkMask:
             return False
 
+        # u vícehodnotových požadujeme neprázdný průnik nebo obě prázdné
+        for morphCat, catMask in self._multiValued:
+            if catMask & exceptMask or self._mask & other._mask & catMask:
+                continue
+            if morphCat not in other._d or self._mask & catMask or other._mask & catMask:
+                return False
+
         return True
 
     def fitsToFilters(self, valFilter: Set[MorphCategory] = None,
@@ -106,74 +149,59 @@ class MARule(collections.Mapping):
         :return: Vrácí True pokud pravidlo projde přes dané filtry.
         :rtype: bool
         """
-        if valFilter is None:
-            valFilter = set()
-        if notValFilter is None:
-            notValFilter = set()
-
-        if valFilterUsedCategories is None:
-            valFilterUsedCategories = {f.category() for f in valFilter}
-
-        try:
-            # Kategorie pravidla může obsahovat přímo hodnotu nebo množinu hodnot.
-            # Musíme se tedy rozhodnout zdali budeme danou kategorii pravidla zpracovávat jako množinu nebo hodnotu,
-
-            if all(self._categoryValFilter(c, valFilter) for c in valFilterUsedCategories):
-                # Máme splněny všechny valFilter podmínky.
-
-                # Ted se mrkneme na notValFilter podmínky.
-                for forbidden in notValFilter:
-                    if forbidden.category() in self:
-                        if isinstance(self[forbidden.category()], frozenset):
-                            if forbidden in self[forbidden.category()]:
-                                return False
-                        else:
-                            if self[forbidden.category()] == forbidden:
-                                return False
-
-                # vše ok
-                return True
-
-        except KeyError:
-            pass
 
-        return False
+        return self.fitsToMaskFilter(MARuleMaskFilter.compile(valFilter, notValFilter, valFilterUsedCategories))
 
-    def _categoryValFilter(self, category: MorphCategories, valFilter: Set[MorphCategory]):
+    def fitsToMaskFilter(self, maskFilter: "MARuleMaskFilter"):
         """
-        Zjistí zdali daná kategorie v pravidle obsahuje pouze hodnoty z valFilter.
+        Detekce zdali pravidlo padne na poskytnutý filtr převedený do bitových masek.
 
-        :param category: Morfologická kategorie pravidla, kterou chceme prozkoumat.
-        :type category: MorphCategories
-        :param valFilter: Hodnoty, které jsou povoleny.
-        (Může obsahovat klidně i další hodnoty z jiných kategorii.)
-        :type valFilter: Set[MorphCategory]
-        :return: True pokud je filter splněn. Flase jinak.
-        :rtype bool
+        :param maskFilter: Filtr převedený do bitových masek.
+        :type maskFilter: MARuleMaskFilter
+        :return: Vrácí True pokud pravidlo projde přes daný filtr.
+        :rtype: bool
         """
 
-        if isinstance(self[category], frozenset):
-            return any(v in valFilter for v in self[category])
-        else:
-            return self[category] in valFilter
+        if self._mask & maskFilter.notValMask:
+            # obsahuje zakázanou hodnotu
+            return False
+
+        # pro každou kategorii z valFilter musí pravidlo obsahovat alespoň jednu z povolených hodnot
+        for valMask in maskFilter.valMasks:
+            if not self._mask & valMask:
+                return False
+
+        return True
 
     @property
     def lntrf(self):
         """
         Ve formátu lntrf. Včetně poznámky
         """
-        res = self.lntrfWithoutNote
-        try:
-            return res + "".join(note.lntrf for note in self[MorphCategories.NOTE])
-        except KeyError:
-            pass
-        return res
+        if self._lntrf is None:
+            self._lntrf = self.lntrfWithoutNote
+            try:
+                self._lntrf += "".join(note.lntrf for note in self[MorphCategories.NOTE])
+            except KeyError:
+                pass
+        return self._lntrf
 
     @property
     def lntrfWithoutNote(self):
         """
         Ve formátu lntrf. Bez poznámky
         """
+        if self._lntrfWithoutNote is None:
+            self._lntrfWithoutNote = self._makeLntrfWithoutNote()
+        return self._lntrfWithoutNote
+
+    def _makeLntrfWithoutNote(self):
+        """
+        Vytvoří podobu pravidla ve formátu lntrf. Bez poznámky
+
+        :return: Pravidlo ve formátu lntrf.
+        :rtype: str
+        """
 
         try:
             pos = self[MorphCategories.POS].lntrf
@@ -257,6 +285,192 @@ class MARule(collections.Mapping):
             return res
 
 
+class MARuleMaskFilter(object):
+    """
+    Filtr pro pravidla (viz :func:`~MARule.fitsToFilters`) převedený do bitových masek.
+    """
+
+    __slots__ = ("valMasks", "notValMask")
+
+    _cache = {}
+    """Již převedené filtry."""
+
+    def __init__(self, valMasks: Tuple[int, ...], notValMask: int):
+        """
+        Inicializace filtru.
+
+        :param valMasks: Pro každou kategorii z valFilter maska povolených hodnot.
+        :type valMasks: Tuple[int, ...]
+        :param notValMask: Maska zakázaných hodnot.
+        :type notValMask: int
+        """
+        self.valMasks = valMasks
+        self.notValMask = notValMask
+
+    @classmethod
+    def compile(cls, valFilter: Set[MorphCategory] = None, notValFilter: Set[MorphCategory] = None,
+                valFilterUsedCategories: Set[MorphCategories] = None) -> "MARuleMaskFilter":
+        """
+        Převede filtry do bitových masek.
+
+        :param valFilter: Hodnoty, které musí mít pravidlo. Viz :func:`~MARule.fitsToFilters`.
+        :type valFilter: Set[MorphCategory]
+        :param notValFilter: Hodnoty, které nesmí pravidlo obsahovat.
+        :type notValFilter: Set[MorphCategory]
+        :param valFilterUsedCategories: Kategorie z valFilter. Pokud není uvedeno, získají se z valFilter.
+        :type valFilterUsedCategories: Set[MorphCategories]
+        :return: Převedený filtr.
+        :rtype: MARuleMaskFilter
+        """
+
+        key = (frozenset(valFilter) if valFilter else frozenset(),
+               frozenset(notValFilter) if notValFilter else frozenset(),
+               None if valFilterUsedCategories is None else frozenset(valFilterUsedCategories))
+
+        try:
+            return cls._cache[key]
+        except KeyError:
+            pass
+
+        valMask = MorphCategory.masksOf(key[0])
+        if valFilterUsedCategories is None:
+            valFilterUsedCategories = {f.category() for f in key[0]}
+
+        res = cls(tuple(c.mask & valMask for c in valFilterUsedCategories), MorphCategory.masksOf(key[1]))
+        cls._cache[key] = res
+        return res
+
+
+class MAProjection(object):
+    """
+    Projekce analýz na pravidla, která mohou být vůbec použita (například nějakým terminálem gramatiky).
+    Pravidlo je použitelné, pokud projde alespoň jedním z filtrů (viz :func:`~MARule.fitsToFilters`).
+
+    Pro pravidla tvarů se z filtrů vynechává pád, jelikož se generují tvary ve všech pádech.
+    """
+
+    def __init__(self, filters: Iterable[FrozenSet[MorphCategory]],
+                 wordFilters: Dict[str, Tuple[Callable[[str], bool], Iterable[FrozenSet[MorphCategory]]]] = None,
+                 tagFilters: Iterable[FrozenSet[MorphCategory]] = ()):
+        """
+        Inicializace projekce.
+
+        :param filters: Filtry platné pro všechna slova.
+        :type filters: Iterable[FrozenSet[MorphCategory]]
+        :param wordFilters: Filtry platné jen pro některá slova.
+            Popis (slouží pro identifikaci projekce, viz key) -> (podmínka na slovo, filtry)
+        :type wordFilters: Dict[str, Tuple[Callable[[str], bool], Iterable[FrozenSet[MorphCategory]]]]
+        :param tagFilters: Filtry platné pro všechna slova, které se uplatňují pouze na značko pravidla slova
+            (nikoliv na pravidla tvarů).
+        :type tagFilters: Iterable[FrozenSet[MorphCategory]]
+        """
+        self._filters = frozenset(frozenset(f) for f in filters)
+        self._wordFilters = {} if wordFilters is None else \
+            {d: (cond, frozenset(frozenset(f) for f in fs)) for d, (cond, fs) in wordFilters.items()}
+        self._tagFilters = frozenset(frozenset(f) for f in tagFilters)
+
+        self._rulesProjections = {}  # popisy filtrů slova -> MARuleProjection
+
+    def withTagFilters(self, tagFilters: Iterable[FrozenSet[MorphCategory]]) -> "MAProjection":
+        """
+        Vytvoří projekci rozšířenou o další filtry pro značko pravidla.
+
+        :param tagFilters: Filtry pro značko pravidla, které se přidají.
+        :type tagFilters: Iterable[FrozenSet[MorphCategory]]
+        :return: Nová projekce.
+        :rtype: MAProjection
+        """
+        return MAProjection(self._filters, self._wordFilters, self._tagFilters | frozenset(tagFilters))
+
+    @property
+    def key(self) -> str:
+        """
+        Identifikace projekce. Dvě projekce se stejnou identifikací jsou stejné.
+        """
+        filtersKey = lambda filters: sorted(sorted(str(v) for v in f) for f in filters)
+        return repr((filtersKey(self._filters), filtersKey(self._tagFilters),
+                     sorted((d, filtersKey(fs)) for d, (_, fs) in self._wordFilters.items())))
+
+    def forWord(self, word: str) -> Optional["MARuleProjection"]:
+        """
+        Projekce pravidel pro dané slovo.
+
+        :param word: Slovo, jehož pravidla chceme promítat.
+        :type word: str
+        :return: Projekce pravidel. None pokud jsou pro slovo použitelná všechna pravidla.
+        :rtype: Optional[MARuleProjection]
+        """
+        descriptions = tuple(d for d, (cond, _) in self._wordFilters.items() if cond(word))
+
+        try:
+            return self._rulesProjections[descriptions]
+        except KeyError:
+            pass
+
+        filters = self._filters.union(*(self._wordFilters[d][1] for d in descriptions))
+        if any(len(f) == 0 for f in filters):
+            # prázdný filtr propustí vše
+            res = None
+        else:
+            res = MARuleProjection(filters | self._tagFilters,
+                                   {frozenset(v for v in f if v.category() != MorphCategories.CASE) for f in filters})
+
+        self._rulesProjections[descriptions] = res
+        return res
+
+
+class MARuleProjection(object):
+    """
+    Projekce pravidel pro konkrétní slovo (viz :class:`~MAProjection`).
+    """
+
+    def __init__(self, tagFilters: Iterable[FrozenSet[MorphCategory]], formFilters: Iterable[FrozenSet[MorphCategory]]):
+        """
+        Inicializace projekce.
+
+        :param tagFilters: Filtry pro značko pravidla slova.
+        :type tagFilters: Iterable[FrozenSet[MorphCategory]]
+        :param formFilters: Filtry pro pravidla tvarů.
+        :type formFilters: Iterable[FrozenSet[MorphCategory]]
+        """
+        self._tagFilters = tuple(MARuleMaskFilter.compile(f) for f in tagFilters)
+        self._formFilters = tuple(MARuleMaskFilter.compile(f) for f in formFilters)
+        self._tagCache = {}  # MARule -> bool
+        self._formCache = {}  # MARule -> bool
+
+    def tagRuleFits(self, rule: MARule) -> bool:
+        """
+        Zjistí, zda je značko pravidlo použitelné.
+
+        :param rule: Značko pravidlo slova.
+        :type rule: MARule
+        :return: True pokud projde alespoň jedním filtrem.
+        :rtype: bool
+        """
+        try:
+            return self._tagCache[rule]
+        except KeyError:
+            res = any(rule.fitsToMaskFilter(f) for f in self._tagFilters)
+            self._tagCache[rule] = res
+            return res
+
+    def formRuleFits(self, rule: MARule) -> bool:
+        """
+        Zjistí, zda je pravidlo tvaru použitelné.
+
+        :param rule: Pravidlo tvaru.
+        :type rule: MARule
+        :return: True pokud projde alespoň jedním filtrem.
+        :rtype: bool
+        """
+        try:
+            return self._formCache[rule]
+        except KeyError:
+            res = any(rule.fitsToMaskFilter(f) for f in self._formFilters)
+            self._formCache[rule] = res
+            return res
+
+
 class MorphoAnalyze(ABC):
     """
     Interface pro výsledky morfologické analýzy slova.
@@ -337,6 +551,38 @@ class MorphoAnalyze(ABC):
         """
         pass
 
+    def getMorphsByCase(self, valFilter: Set[MorphCategory] = None, notValFilter: Set[MorphCategory] = None,
+                        wordFilter: Set[MorphCategory] = None, groupFlags: Set[Flag] = None) \
+            -> Dict[Optional[Case], FrozenSet[Tuple[str, MARule]]]:
+        """
+        Získání tvarů rozdělených dle pádu.
+        V rámci jednoho pádu jsou odstraněny tvary, které se liší pouze poznámkou, protože ta se nevypisuje.
+
+        Parametry jsou stejné jako u :func:`~MorphoAnalyze.getMorphs`.
+
+        :return: Pád -> množina dvojic (tvar, pravidlo). Tvary bez pádu jsou pod klíčem None.
+        :rtype: Dict[Optional[Case], FrozenSet[Tuple[str, MARule]]]
+        """
+
+        byCase = {}
+        alreadyHave = set()
+        for maRule, wordMorph in self.getMorphs(valFilter, notValFilter, wordFilter, groupFlags):
+            c = maRule.get(MorphCategories.CASE)
+            key = (c, wordMorph, maRule.lntrfWithoutNote)
+            if key in alreadyHave:
+                # Díky tomu, že nezohledňujeme poznámku při výpisu,
+                # tak můžeme dostávat tvary, které vypadají totožně a není
+                # nutné je tedy vypisovat.
+                continue
+            alreadyHave.add(key)
+
+            try:
+                byCase[c].add((wordMorph, maRule))
+            except KeyError:
+                byCase[c] = {(wordMorph, maRule)}
+
+        return {c: frozenset(morphs) for c, morphs in byCase.items()}
+
 
 class MorphoAnalyzer(ABC):
     """
@@ -374,6 +620,43 @@ class MorphoAnalyzer(ABC):
         """
         pass
 
+    @abstractmethod
+    def analysisKey(self, word: str, name=None, wordPos: Optional[int] = None) -> Optional[Hashable]:
+        """
+        Získání klíče analýzy slova. Stejný klíč mají slova se stejnou analýzou (viz analyze), a to i po jejím
+        nahrazení úplnější analýzou (viz loadForms). Klíč nedrží samotnou analýzu.
+        Klíč analýzy nezávislé na jméně je (slovo,), klíč analýzy závislé na jméně je delší n-tice začínající
+        slovem.
+
+        :param word: slovo pro analýzu
+        :type word: str
+        :param name: Pokud je tento parametr neprázdný pak vrací klíč analýzy slova závislé na předaném jménu.
+        :type name: Name
+        :param wordPos: Pozice slova ve jméně.
+        :type wordPos: Optional[int]
+        :return: Klíč analýzy slova. None pokud slovo nemá analýzu.
+        :rtype: Optional[Hashable]
+        """
+        pass
+
+    def loadForms(self, words: Iterable[str]):
+        """
+        Zajistí, že analýzy daných slov obsahují i tvary slov.
+        Analyzátor, který tvary získává vždy spolu s analýzou, nic nedělá.
+
+        :param words: Slova, pro která budou potřeba tvary.
+        :type words: Iterable[str]
+        """
+        pass
+
+    def close(self):
+        """
+        Uvolní prostředky analyzátoru (např. běžící procesy). Po uzavření již analyzátor nemusí znát slova,
+        která nemá v databázi.
+        Analyzátor, který žádné prostředky nedrží, nic nedělá.
+        """
+        pass
+
 
 class EQRelationForPrepAndItsAbbre(object):
     """
@@ -427,7 +710,10 @@ class EQRelationForPrepAndItsAbbre(object):
     def __hash__(self):
         # hashujeme 1. a poslední slovo ve jménu, protože ta se musí shodovat přesně.
         # Stejně, tak hashujeme společně s nimi délku jména, která musí být taktéž shodná.
-        return hash((str(self.name[0]) + str(self.name[-1]), str(len(self.name))))
+        # Navíc i první písmena prostředních slov, která se také musí shodovat, jinak by jména jako X nad Y
+        # skončila všechna v jednom kbelíku a jejich porovnávání by bylo kvadratické.
+        return hash((str(self.name[0]) + str(self.name[-1]), str(len(self.name)),
+                     "".join(self.name[wI][0] for wI in range(1, len(self.name) - 1))))
 
 
 class MorphoAnalyzerException(ExceptionMessageCode):
@@ -437,123 +723,469 @@ class MorphoAnalyzerException(ExceptionMessageCode):
     pass
 
 
-class MorphoAnalyzerLibma(MorphoAnalyzer):
+class MACoprocess(object):
     """
-    Obálka pro Morfologický analyzátor postavený na knihovně libma
-    .. _ma: http://knot.fit.vutbr.cz/wiki/index.php/Morfologický_slovník_a_morfologický_analyzátor_pro_češtinu
+    Obálka pro dlouhodobě běžící proces morfologického analyzátoru ma (spuštěný s parametry -F -m -n).
+    Umožňuje se dotazovat na slova postupně v dávkách bez nutnosti znovu spouštět analyzátor.
 
+    Konec každé dávky je označen zarážkou (slovem SENTINEL). Výstup ma začíná pro každé vstupní slovo
+    právě jedním ma> (ma><s> ... nebo ma>--not found), takže víme přesně, kdy je dávka zpracována,
+    a to bez ohledu na to, zda ma zarážku zná. Zbytek výstupu k zarážce je přeskočen na začátku další dávky.
     """
 
-    class MAWordGroup(object):
-        """
-        Třída reprezentující skupinu slov k nějakému slovu.
-        Obsahuje lemma a vzor daného slova. Také značko-pravidla pro dané slovo
-        a různé tvary společně s jejich značko pravidly.
+    SENTINEL = "xqnamegenxqsentinelxq"
+    """Slovo označující konec dávky."""
 
-        Libma dělí analýzu slova na více skupin. Tato třída reprezentuje jednu ze skupin.
-        Zkrácený příklad pro slovo Velké (skupina začíná <s>):
-        ma><s> Velké (Sedláčková_nF)
-          <l>Velká
-          <c>k1gFnPc1
-          <c>k1gFnPc4
-          ...
-          <f>[k1gFnSc7] Velkou
-          <f>[k1gFnSc4] Velkou
-          <f>[k1gFnSc5] Velká
-          <f>[k1gFnSc1] Velká
-          <f>[k1gFnSc6] Velké
-          <f>[k1gFnSc3] Velké
-          ...
-        <s> Velké (Široký_nM)
-          <l>Velký
-          <c>k1gMnPc4
-          <f>[k1gMnPc5] Velcí
-          <f>[k1gMnPc1] Velcí
-          <f>[k1gMnPc4] Velké
-          ...
-        <s> Velké (velký)
-          <l>velký
-          <c>k2eAgFnPc1d1
-          <c>k2eAgFnPc4d1
-          <c>k2eAgFnPc5d1
-          ...
-          <f>[k2eNgNnPc4d3wH] nejnevětši
-          ...
+    def __init__(self, pathToMa: str):
+        """
+        Spustí proces analyzátoru.
 
+        :param pathToMa: Cesta/ příkaz pro spuštění morfologického analyzátoru.
+        :type pathToMa: str
         """
 
-        def __init__(self, word):
-            """
-            Vytvoření skupiny pro slovo.
+        cmd = [pathToMa, "-F", "-m", "-n"]
+        if shutil.which("stdbuf") is not None:
+            # ma musí odpovídat průběžně, jinak bychom čekali na výstup, který zůstal v jeho bufferu
+            cmd = ["stdbuf", "-oL"] + cmd
 
-            :param word: Slovo pro nějž je tato skupina vytvořena.
-            :type word: str
-            """
-            self._word = word
-            self._flags = {Flag.NOT_GENERAL_WORD}  # implicitně se nejedná o obecné slovo
-            self._tagRules = []  # značko pravidla pro slovo
-            self._morphs = []  # tvary k danému slovu ve formátu dvojic (tagRule, tvar)
+        self._process = Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=None,
+                              env=dict(os.environ, PYTHONUNBUFFERED="1"))
+        self._stdout = io.TextIOWrapper(self._process.stdout, encoding="utf-8")
+        self._lock = threading.Lock()
+        self._afterSentinel = False  # True -> na výstupu může být zbytek odpovědi na zarážku
 
-        @property
-        def flags(self):
-            """
-            Flagy skupiny.
-            """
-            return self._flags
+    def request(self, words: List[str]) -> List[str]:
+        """
+        Pošle dávku slov analyzátoru a získá jeho výstup.
 
-        def addFlag(self, flag: Flag):
-            """
-            Přidání flagu ke skupině.
-            Stará se o odstraňování flagů, které jsou opakem práve přidaného flagu.
-            Příklad:
-                Přidávám: Flag.GENERAL_WORD
-                Pokud má flag Flag.NOT_GENERAL_WORD, tak bude Flag.NOT_GENERAL_WORD odstraněn.
+        :param words: Slova pro analýzu. Prázdná slova jsou vynechána.
+        :type words: List[str]
+        :return: Řádky výstupu analyzátoru (bez znaku konce řádku) pro danou dávku.
+        :rtype: List[str]
+        :raise MorphoAnalyzerException: Chyba analyzátoru.
+        """
 
-            :param flag: Nový flag.
-            :type flag: Flag
-            """
-            if flag == Flag.GENERAL_WORD and Flag.NOT_GENERAL_WORD in self._flags:
-                self._flags.remove(Flag.NOT_GENERAL_WORD)
-            elif flag == Flag.NOT_GENERAL_WORD and Flag.GENERAL_WORD in self._flags:
-                self._flags.remove(Flag.GENERAL_WORD)
+        words = [w for w in words if len(w) > 0]
 
-            self._flags.add(flag)
+        with self._lock:
+            feeder = threading.Thread(target=self._write, args=(words,), daemon=True)
+            feeder.start()
 
-        def removeFlag(self, flag: Flag):
-            """
-            Odstranění flagu ze skupině.
+            lines = []
+            answered = 0  # počet ma> na výstupu
+            while answered <= len(words):
+                line = self._stdout.readline()
+                if line == "":
+                    raise MorphoAnalyzerException(ErrorMessenger.CODE_MA_FAILURE)
 
-            :param flag: Flag pro odstranění.
-            :type flag: Flag
-            """
-            self._flags.remove(flag)
+                line = line.rstrip("\r\n")
+                if line.startswith("ma>"):
+                    self._afterSentinel = False
+                    answered += 1
 
-        @property
-        def word(self):
-            """
-            Slovo pro nějž je tato skupina vytvořena.
-            """
-            return self._word
+                if answered == 0 and self._afterSentinel:
+                    # zbytek odpovědi na zarážku z minulé dávky
+                    continue
 
-        @word.setter
-        def word(self, value):
-            """
-            Nastavení slova pro nějž je tato skupina vytvořena.
+                if answered <= len(words):
+                    lines.append(line)
 
-            :param value: Slovo pro nějž je tato skupina vytvořena.
-            :type value: str
-            """
-            self._word = value
+            self._afterSentinel = True
+            feeder.join()
 
-        def addMorph(self, tagRule, morph, relevant=False):
-            """
-            Přidání tvaru.
-            !!!NA ZÁKLADĚ POKYNŮ NEJSOU PŘÍJMÁNY VŠECHNY HOVOROVÉ TVARY
+        return lines
 
-            :param tagRule: Značko pravidlo pro tvar (příklad k1gFnSc7)
-            :type tagRule: str
-            :param morph: Tvar slova.
-            :type morph: str
+    def _write(self, words: List[str]):
+        """
+        Zapíše dávku slov, zakončenou zarážkou, na vstup analyzátoru.
+
+        :param words: Slova pro analýzu.
+        :type words: List[str]
+        """
+        try:
+            self._process.stdin.write(str.encode("\n".join(words + [self.SENTINEL]) + "\n"))
+            self._process.stdin.flush()
+        except BrokenPipeError:
+            # analyzátor skončil, chybu zjistí čtení výstupu
+            pass
+
+    def close(self):
+        """
+        Ukončí proces analyzátoru.
+        """
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self._process.wait()
+
+
+class MAGroupRecord(object):
+    """
+    Nezpracovaná skupina z výstupu ma (jedno ma><s> ... a k němu příslušné řádky).
+
+    :ivar word: Slovo, ke kterému skupina patří.
+    :vartype word: str
+    :ivar generalWord: True -> lemma začíná malým písmenem.
+    :vartype generalWord: bool
+    :ivar tags: Značko pravidla (řádky <c>) v pořadí, v jakém je vypsal analyzátor.
+    :vartype tags: List[str]
+    :ivar forms: Tvary (řádky <f>) jako dvojice značko pravidlo a tvar.
+    :vartype forms: List[Tuple[str, str]]
+    """
+
+    __slots__ = ("word", "generalWord", "tags", "forms")
+
+    def __init__(self, word: str, generalWord: bool = False, tags: Optional[List[str]] = None,
+                 forms: Optional[List[Tuple[str, str]]] = None):
+        """
+        Vytvoření záznamu skupiny.
+
+        :param word: Slovo, ke kterému skupina patří.
+        :type word: str
+        :param generalWord: True -> lemma začíná malým písmenem.
+        :type generalWord: bool
+        :param tags: Značko pravidla skupiny.
+        :type tags: Optional[List[str]]
+        :param forms: Tvary skupiny jako dvojice značko pravidlo a tvar.
+        :type forms: Optional[List[Tuple[str, str]]]
+        """
+        self.word = word
+        self.generalWord = generalWord
+        self.tags = [] if tags is None else tags
+        self.forms = [] if forms is None else forms
+
+
+class MAOutputReader(object):
+    """
+    Čtení výstupu ma po jednotlivých skupinách.
+
+    Příklad použití:
+        reader = MAOutputReader(output)
+        for record in reader:
+            ...
+        print(reader.answered)
+    """
+
+    def __init__(self, output):
+        """
+        Inicializace čtení.
+
+        :param output: Výstup z analyzátoru. Buď celý jako řetězec, nebo jako iterovatelný objekt s jednotlivými
+            řádky (bez znaku konce řádku), který je zpracováván průběžně.
+        :type output: str | Iterable[str]
+        """
+        self._output = output.splitlines() if isinstance(output, str) else output
+        self.answered = 0
+        """Počet slov, na která ma odpověděl (i nezpracovaných ma>--not found). Známý až po přečtení celého výstupu."""
+
+    def __iter__(self):
+        """
+        Postupně čte skupiny z výstupu.
+
+        :return: Generátor skupin.
+        :rtype: Iterable[MAGroupRecord]
+        :raise MorphoAnalyzerException: Pokud se nepodaří analyzovat výstup.
+        """
+        record = None
+
+        for lineNumber, line in enumerate(self._output):
+            try:
+                if line.startswith("ma>"):
+                    # odpověď na další slovo
+                    self.answered += 1
+
+                if line == "ma>--not found":
+                    # máme další slovo, ale nezpracované
+                    continue
+
+                # rozdělení řádku
+                parts = line.strip().split()
+                if parts[0][-3:] == "<s>":
+                    # začínáme číst novou skupinu slova
+                    # <s> vstupní slovo (vzor 1)
+                    if record is not None:
+                        yield record
+                    record = MAGroupRecord(parts[1])
+
+                elif parts[0][:3] == "<c>":
+                    # značko pravidlo, které sedí pro dané slovo
+                    record.tags.append(parts[0][3:])
+
+                elif parts[0][:3] == "<l>":
+                    # lemma slova
+                    if parts[0][3:][0].islower():
+                        # malé první písmeno u lematu
+                        record.generalWord = True
+
+                elif parts[0][:3] == "<f>":
+                    # tvar slova
+                    record.forms.append(((parts[0][3:])[1:-1], parts[1]))
+
+            except IndexError:
+                raise MorphoAnalyzerException(ErrorMessenger.CODE_MA_CAN_NOT_READ_OUTPUT,
+                                              ErrorMessenger.getMessage(ErrorMessenger.CODE_MA_CAN_NOT_READ_OUTPUT)
+                                              .format(lineNumber) + "\n\t" + line)
+
+        if record is not None:
+            yield record
+
+
+class MorphoAnalyzerLibma(MorphoAnalyzer):
+    """
+    Obálka pro Morfologický analyzátor postavený na knihovně libma
+    .. _ma: http://knot.fit.vutbr.cz/wiki/index.php/Morfologický_slovník_a_morfologický_analyzátor_pro_češtinu
+
+    """
+
+    class MorphsPool(object):
+        """
+        Tabulky pravidel a tvarů sdílené skupinami (MAWordGroup) jednoho analyzátoru. Skupiny si u tvarů ukládají
+        pouze indexy do těchto tabulek. Tabulky jsou uvolněny společně s analyzátorem a jeho skupinami.
+        """
+
+        def __init__(self):
+            self.rules = []  # index -> MARule
+            self.rulesIds = {}  # MARule -> index
+            self.forms = []  # index -> tvar
+            self.formsIds = {}  # tvar -> index
+            self._lock = threading.Lock()
+
+        def _index(self, pool, poolIds, item):
+            """
+            Získání indexu položky v tabulce. Pokud v ní položka není, tak ji přidá.
+
+            :param pool: Tabulka (index -> položka).
+            :type pool: List[Any]
+            :param poolIds: Indexy položek tabulky (položka -> index).
+            :type poolIds: Dict[Any, int]
+            :param item: Položka, jejíž index chceme.
+            :type item: Any
+            :return: Index položky.
+            :rtype: int
+            """
+            try:
+                return poolIds[item]
+            except KeyError:
+                with self._lock:
+                    # mohla být mezitím přidána jiným vláknem
+                    if item not in poolIds:
+                        poolIds[item] = len(pool)
+                        pool.append(item)
+                    return poolIds[item]
+
+        def ruleIndex(self, rule: MARule) -> int:
+            """
+            Získání indexu pravidla v tabulce pravidel. Pokud v ní pravidlo není, tak ho přidá.
+
+            :param rule: Pravidlo, jehož index chceme.
+            :type rule: MARule
+            :return: Index pravidla.
+            :rtype: int
+            """
+            return self._index(self.rules, self.rulesIds, rule)
+
+        def formIndex(self, form: str) -> int:
+            """
+            Získání indexu tvaru v tabulce tvarů. Pokud v ní tvar není, tak ho přidá.
+
+            :param form: Tvar, jehož index chceme.
+            :type form: str
+            :return: Index tvaru.
+            :rtype: int
+            """
+            return self._index(self.forms, self.formsIds, form)
+
+    class MAWordGroup(object):
+        """
+        Třída reprezentující skupinu slov k nějakému slovu.
+        Obsahuje lemma a vzor daného slova. Také značko-pravidla pro dané slovo
+        a různé tvary společně s jejich značko pravidly.
+
+        Libma dělí analýzu slova na více skupin. Tato třída reprezentuje jednu ze skupin.
+        Zkrácený příklad pro slovo Velké (skupina začíná <s>):
+        ma><s> Velké (Sedláčková_nF)
+          <l>Velká
+          <c>k1gFnPc1
+          <c>k1gFnPc4
+          ...
+          <f>[k1gFnSc7] Velkou
+          <f>[k1gFnSc4] Velkou
+          <f>[k1gFnSc5] Velká
+          <f>[k1gFnSc1] Velká
+          <f>[k1gFnSc6] Velké
+          <f>[k1gFnSc3] Velké
+          ...
+        <s> Velké (Široký_nM)
+          <l>Velký
+          <c>k1gMnPc4
+          <f>[k1gMnPc5] Velcí
+          <f>[k1gMnPc1] Velcí
+          <f>[k1gMnPc4] Velké
+          ...
+        <s> Velké (velký)
+          <l>velký
+          <c>k2eAgFnPc1d1
+          <c>k2eAgFnPc4d1
+          <c>k2eAgFnPc5d1
+          ...
+          <f>[k2eNgNnPc4d3wH] nejnevětši
+          ...
+
+        """
+
+        tagRulesCache = {}
+        """Již převedená značko pravidla. Značko pravidlo (str) -> MARule"""
+
+        internedRules = {}
+        """Sdílené objekty pravidel dle jejich obsahu (MARule -> MARule). Viz internRule."""
+
+        def __init__(self, word, pool: "MorphoAnalyzerLibma.MorphsPool"):
+            """
+            Vytvoření skupiny pro slovo.
+
+            :param word: Slovo pro nějž je tato skupina vytvořena.
+            :type word: str
+            :param pool: Tabulky pravidel a tvarů analyzátoru, do nichž skupina ukládá tvary.
+            :type pool: MorphoAnalyzerLibma.MorphsPool
+            """
+            self._word = word
+            self._flags = {Flag.NOT_GENERAL_WORD}  # implicitně se nejedná o obecné slovo
+            self._tagRules = []  # značko pravidla pro slovo
+            # tvary k danému slovu ve formátu dvojic (tagRule, tvar)
+            # uloženo jako dvě pole indexů do tabulek pool
+            self._pool = pool
+            self._morphsRules = array("I")
+            self._morphsForms = array("I")
+            self._morphs = None  # tvary načtené skupiny, která zatím nemá tabulky (viz setPool)
+
+        def _appendMorph(self, rule: MARule, morph: str):
+            """
+            Uloží tvar.
+
+            :param rule: Pravidlo tvaru.
+            :type rule: MARule
+            :param morph: Tvar slova.
+            :type morph: str
+            """
+            if self._pool is None:
+                self._morphs.append((rule, morph))
+                return
+
+            self._morphsRules.append(self._pool.ruleIndex(rule))
+            self._morphsForms.append(self._pool.formIndex(morph))
+
+        @property
+        def morphs(self):
+            """
+            Všechny tvary skupiny ve formátu dvojic (pravidlo, tvar).
+
+            :rtype: Iterator[Tuple[MARule, str]]
+            """
+            if self._pool is None:
+                return iter(self._morphs)
+
+            rules = self._pool.rules
+            forms = self._pool.forms
+            return ((rules[r], forms[f]) for r, f in zip(self._morphsRules, self._morphsForms))
+
+        def setPool(self, pool: "MorphoAnalyzerLibma.MorphsPool"):
+            """
+            Přiřadí načtené skupině (viz __setstate__) tabulky pravidel a tvarů analyzátoru a přesune do nich
+            její tvary. Skupina, která již tabulky má, se nemění.
+
+            :param pool: Tabulky pravidel a tvarů analyzátoru.
+            :type pool: MorphoAnalyzerLibma.MorphsPool
+            """
+            if self._pool is not None:
+                return
+
+            morphs = self._morphs
+            self._pool = pool
+            self._morphs = None
+            for rule, morph in morphs:
+                self._appendMorph(rule, morph)
+
+        def __getstate__(self):
+            # indexy do tabulek jsou platné pouze v rámci jednoho analyzátoru, proto ukládáme přímo tvary
+            state = self.__dict__.copy()
+            del state["_pool"]
+            del state["_morphsRules"]
+            del state["_morphsForms"]
+            state["_morphs"] = list(self.morphs)
+            return state
+
+        def __setstate__(self, state):
+            self.__dict__.update(state)
+            # načtená pravidla jsou nové objekty, nahradíme je sdílenými
+            self._tagRules = [self.internRule(r) for r in self._tagRules]
+            # tabulky přiřadí až analyzátor, který skupinu použije (viz setPool)
+            self._pool = None
+            self._morphsRules = array("I")
+            self._morphsForms = array("I")
+            self._morphs = [(self.internRule(rule), morph) for rule, morph in self._morphs]
+
+        @property
+        def flags(self):
+            """
+            Flagy skupiny.
+            """
+            return self._flags
+
+        def addFlag(self, flag: Flag):
+            """
+            Přidání flagu ke skupině.
+            Stará se o odstraňování flagů, které jsou opakem práve přidaného flagu.
+            Příklad:
+                Přidávám: Flag.GENERAL_WORD
+                Pokud má flag Flag.NOT_GENERAL_WORD, tak bude Flag.NOT_GENERAL_WORD odstraněn.
+
+            :param flag: Nový flag.
+            :type flag: Flag
+            """
+            if flag == Flag.GENERAL_WORD and Flag.NOT_GENERAL_WORD in self._flags:
+                self._flags.remove(Flag.NOT_GENERAL_WORD)
+            elif flag == Flag.NOT_GENERAL_WORD and Flag.GENERAL_WORD in self._flags:
+                self._flags.remove(Flag.GENERAL_WORD)
+
+            self._flags.add(flag)
+
+        def removeFlag(self, flag: Flag):
+            """
+            Odstranění flagu ze skupině.
+
+            :param flag: Flag pro odstranění.
+            :type flag: Flag
+            """
+            self._flags.remove(flag)
+
+        @property
+        def word(self):
+            """
+            Slovo pro nějž je tato skupina vytvořena.
+            """
+            return self._word
+
+        @word.setter
+        def word(self, value):
+            """
+            Nastavení slova pro nějž je tato skupina vytvořena.
+
+            :param value: Slovo pro nějž je tato skupina vytvořena.
+            :type value: str
+            """
+            self._word = value
+
+        def addMorph(self, tagRule, morph, relevant=False):
+            """
+            Přidání tvaru.
+            !!!NA ZÁKLADĚ POKYNŮ NEJSOU PŘÍJMÁNY VŠECHNY HOVOROVÉ TVARY
+
+            :param tagRule: Značko pravidlo pro tvar (příklad k1gFnSc7)
+            :type tagRule: str
+            :param morph: Tvar slova.
+            :type morph: str
             :param relevant: Pokud je true, tak nepřídá daný tvar, který nevyhovuje přidaným pravidlům.
                 Tvar nevyhovuje přidaným pravidlům ve skupině, máli jiné hodnoty morfologických kategorií až na
                 CASE (pád), pokud máme vícehodnotvé moroflogické kategorie, pak musí mít mezi sebou neprázdný průnik.
@@ -575,9 +1207,9 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
                     for r in self._tagRules:
                         if r.sameExcept(rule, {MorphCategories.CASE, MorphCategories.STYLISTIC_FLAG}):
                             # je stejné jako alespoň jedno pravidlo
-                            self._morphs.append((rule, morph))
+                            self._appendMorph(rule, morph)
                 else:
-                    self._morphs.append((rule, morph))
+                    self._appendMorph(rule, morph)
 
         def getMorphs(self, valFilter: Set[MorphCategory] = None, notValFilter: Set[MorphCategory] = None) \
                 -> Set[Tuple[MARule, str]]:
@@ -604,12 +1236,12 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
                 notValFilter = set()
 
             morphs = set()
-            valFilterCategories = set(f.category() for f in valFilter)
+            maskFilter = MARuleMaskFilter.compile(valFilter, notValFilter)
 
-            for r, m in self._morphs:
+            for r, m in self.morphs:
                 try:
                     # zkontrolujeme zdali platí filtry
-                    if r.fitsToFilters(valFilter, notValFilter, valFilterCategories):
+                    if r.fitsToMaskFilter(maskFilter):
                         # úprava velikosti počátečního písmene tvaru na základě původního slova
                         if self._word[0].isupper():
                             newM = m[0].upper() + m[1:]
@@ -628,11 +1260,18 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
             """
             Převod značko pravidla ze str do MARule
 
+            Pro stejná značko pravidla vrací vždy stejný objekt MARule.
+
             :param tagRule: Značko pravidlo (příklad k1gFnPc1)
             :type tagRule: str
             :return: Převedené pravidlo z morfologické analýzy.
             :rtype: MARule
             """
+            try:
+                return MorphoAnalyzerLibma.MAWordGroup.tagRulesCache[tagRule]
+            except KeyError:
+                pass
+
             # Příklad převodu: k1gFnPc1;jL
             #
             #    {"k":"1","g":"F","n":"P","c":"1","note":"jL"}
@@ -677,7 +1316,24 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
                 if len(tmpVals) > 0:  # Jen neprázdné.
                     res[mCategory] = frozenset(tmpVals)
 
-            return MARule(res)
+            # Pravidlo mohlo být mezitím převedeno jiným vláknem (MA_WORKERS), vracíme vždy uložený objekt.
+            # setdefault je atomické, takže pro jedno značko pravidlo existuje stále jen jeden objekt.
+            return MorphoAnalyzerLibma.MAWordGroup.tagRulesCache.setdefault(
+                tagRule, MorphoAnalyzerLibma.MAWordGroup.internRule(MARule(res)))
+
+        @staticmethod
+        def internRule(rule: MARule) -> MARule:
+            """
+            Získá sdílený objekt pravidla se stejným obsahem. Používá se pro převedená značko pravidla
+            a pro pravidla načtená z perzistentního úložiště analýz (viz __setstate__), aby i po jejich načtení
+            byla stejná pravidla jedním a tím samým objektem.
+
+            :param rule: Pravidlo.
+            :type rule: MARule
+            :return: Sdílený objekt pravidla.
+            :rtype: MARule
+            """
+            return MorphoAnalyzerLibma.MAWordGroup.internedRules.setdefault(rule, rule)
 
         def addTagRuleConv(self, tagRule: MARule):
             """
@@ -699,6 +1355,15 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
 
             self._tagRules.append(tagRule)
 
+        def retainTagRules(self, predicate: Callable[[MARule], bool]):
+            """
+            Ponechá pouze značko pravidla splňující danou podmínku.
+
+            :param predicate: Podmínka na značko pravidlo.
+            :type predicate: Callable[[MARule], bool]
+            """
+            self._tagRules = [r for r in self._tagRules if predicate(r)]
+
         def addTagRule(self, tagRule):
             """
             Přidání značko pravidla.
@@ -736,11 +1401,11 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
                 notValFilter = set()
             values = {}
 
-            valFilterCategories = set(f.category() for f in valFilter)
+            maskFilter = MARuleMaskFilter.compile(valFilter, notValFilter)
             for r in self._tagRules:
                 try:
                     # zkontrolujeme zdali platí filtry
-                    if r.fitsToFilters(valFilter, notValFilter, valFilterCategories):
+                    if r.fitsToMaskFilter(maskFilter):
                         for morphCat, morphCatVal in r.items():
                             try:
                                 if isinstance(r[morphCat], frozenset):
@@ -789,12 +1454,12 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
                 notValFilter = set()
 
             values = set()
-            valFilterCategories = set(f.category() for f in valFilter)
+            maskFilter = MARuleMaskFilter.compile(valFilter, notValFilter)
 
             for r in self._tagRules:
                 try:
                     # zkontrolujeme zdali platí filtry
-                    if r.fitsToFilters(valFilter, notValFilter, valFilterCategories):
+                    if r.fitsToMaskFilter(maskFilter):
                         # Jednotlivé kategorie mohou obsahovat jednu hodnotu nebo množinu hodnot.
                         if isinstance(r[morphCategory], frozenset):
                             # máme množinu hodnot
@@ -822,7 +1487,7 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
             for f in self._flags:
                 s += "\t" + str(f) + "\n"
             s += "Morphs:\n"
-            for m in self._morphs:
+            for m in self.morphs:
                 s += "\t" + str(m[0]) + "\t" + str(m[1]) + "\n"
 
             return s
@@ -838,6 +1503,19 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
 
             """
             self._groups = []
+            self._morphsByCase = {}  # index tvarů dle pádu pro jednotlivé filtry (viz getMorphsByCase)
+
+        def __copy__(self):
+            """
+            Mělká kopie analýzy. Skupiny jsou sdíleny, ale jejich seznam ne, aby přidání skupiny do kopie
+            neměnilo původní analýzu.
+
+            :return: Kopie analýzy.
+            :rtype: MorphoAnalyzerLibma.MAWord
+            """
+            c = self.__class__()
+            c._groups = list(self._groups)
+            return c
 
         def addGroup(self, group):
             """
@@ -847,6 +1525,7 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
             :type group: MorphoAnalyzerLibma.MAWordGroup
             """
             self._groups.append(group)
+            self._morphsByCase.clear()
 
         def delGroup(self, group):
             """
@@ -857,6 +1536,7 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
             """
 
             self._groups.remove(group)
+            self._morphsByCase.clear()
 
         def getAll(self, valFilter: Set[MorphCategory] = None, notValFilter: Set[MorphCategory] = None,
                    groupFlags: Set[Flag] = None) -> Dict[MorphCategories, Set[MorphCategory]]:
@@ -983,6 +1663,41 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
 
             return morphs
 
+        def getMorphsByCase(self, valFilter: Set[MorphCategory] = None, notValFilter: Set[MorphCategory] = None,
+                            wordFilter: Set[MorphCategory] = None, groupFlags: Set[Flag] = None) \
+                -> Dict[Optional[Case], FrozenSet[Tuple[str, MARule]]]:
+            """
+            Získání tvarů rozdělených dle pádu.
+            Výsledek je pro dané filtry spočítán pouze jednou.
+
+            Parametry jsou stejné jako u :func:`~MorphoAnalyze.getMorphs`.
+
+            :return: Pád -> množina dvojic (tvar, pravidlo). Tvary bez pádu jsou pod klíčem None.
+            :rtype: Dict[Optional[Case], FrozenSet[Tuple[str, MARule]]]
+            """
+
+            key = (frozenset(valFilter) if valFilter else frozenset(),
+                   frozenset(notValFilter) if notValFilter else frozenset(),
+                   frozenset(wordFilter) if wordFilter else frozenset(),
+                   frozenset(groupFlags) if groupFlags else frozenset())
+
+            try:
+                return self._morphsByCase[key]
+            except KeyError:
+                res = super().getMorphsByCase(valFilter, notValFilter, wordFilter, groupFlags)
+                self._morphsByCase[key] = res
+                return res
+
+        def __getstate__(self):
+            # index je možné kdykoliv znovu vytvořit
+            state = self.__dict__.copy()
+            state["_morphsByCase"] = {}
+            return state
+
+        def __setstate__(self, state):
+            state.setdefault("_morphsByCase", {})
+            self.__dict__.update(state)
+
         @property
         def groups(self):
             """
@@ -1031,11 +1746,81 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
         # odfiltrujeme všechny třídy s méně jak 2 položkami
         self._prepAbberEqClasses = {eqR: names for eqR, names in self._prepAbberEqClasses.items() if len(names) > 1}
 
-    def __init__(self, pathToMa, words, hint=None):
+        # Index jméno -> pořadí třídy, aby nebylo nutné třídu hledat při každém dotazu na slovo.
+        self._prepAbberClassIds = {id(members): i for i, members in enumerate(self._prepAbberEqClasses.values())}
+        self._prepAbberClasses = list(self._prepAbberEqClasses.values())
+        # slova jména -> pořadí třídy
+        # Klíčem nemůže být samotné jméno, protože jeho hash zahrnuje druh jména, který se může změnit
+        # (Name.guessType). Relace ekvivalence přitom závisí pouze na slovech jména.
+        self._prepAbberClassOfName = {}
+        # (pořadí třídy, pozice slova) -> je na dané pozici v některém jménu třídy předložka
+        self._prepAbberPrepAtPos = {}
+        # slovo -> (pořadí třídy, pozice slova) -> na jméně závislá analýza
+        self._nameDependentAnalyses = {}
+
+        for n in names:
+            self._prepAbberClassOf(n)
+
+    def _prepAbberClassOf(self, name) -> Optional[int]:
+        """
+        Najde třídu ekvivalence (viz EQRelationForPrepAndItsAbbre), do které jméno patří.
+
+        :param name: Jméno pro vyhledání.
+        :type name: Name
+        :return: Pořadí třídy. None pokud jméno do žádné třídy nepatří.
+        :rtype: Optional[int]
+        """
+        key = tuple(str(w) for w in name)
+        try:
+            return self._prepAbberClassOfName[key]
+        except KeyError:
+            members = self._prepAbberEqClasses.get(EQRelationForPrepAndItsAbbre(name))
+            classId = None if members is None else self._prepAbberClassIds[id(members)]
+            self._prepAbberClassOfName[key] = classId
+            return classId
+
+    def _prepAbberPrepositionAt(self, classId: int, wordPos: int) -> bool:
+        """
+        Zjistí, zdali má některé jméno z třídy ekvivalence na dané pozici předložku.
+
+        :param classId: Pořadí třídy.
+        :type classId: int
+        :param wordPos: Pozice slova ve jméně.
+        :type wordPos: int
+        :return: True -> na pozici je předložka.
+        :rtype: bool
+        """
+        try:
+            return self._prepAbberPrepAtPos[(classId, wordPos)]
+        except KeyError:
+            res = any((POS.PREPOSITION in self._wordDatabase[str(n[wordPos])].getAllForCategory(MorphCategories.POS))
+                      for n in self._prepAbberClasses[classId])
+            self._prepAbberPrepAtPos[(classId, wordPos)] = res
+            return res
+
+    BATCH_OUTPUT_SIZE = 256 * 1024 * 1024
+    """Cílová velikost výstupu ma (ve znacích) pro jednu dávku."""
+
+    PREPOSITIONS_M = ["dalla", "de", "der", "da", "del", "di", "dos", "el", "la", "le", "van", "von", "und", "ben",
+                      "bin", "y", "zu"]
+    """Slova, která jsou navíc analyzována jako předložky, za nimiž se slova ohýbají."""
+
+    PROJECTION_TAG_FILTERS = [frozenset({POS.ABBREVIATION}), frozenset({POS.PREPOSITION}),
+                              frozenset({POS.CONJUNCTION}), frozenset({POS.NOUN, Case.NOMINATIVE}),
+                              frozenset({POS.ADJECTIVE, Case.NOMINATIVE})]
+    """
+    Značko pravidla, která jsou při použití projekce zachována vždy. Zkratky a předložky jsou potřeba pro analýzu
+    závislou na jménu, spojky pro úpravu analýzy slova a a podstatná a přídavná jména v 1. pádě pro odhad druhu
+    jména (Name.guessType).
+    """
+
+    def __init__(self, pathToMa, words, hint=None, cache: Optional[MACache] = None, workers: int = 1,
+                 coprocess: Optional[MACoprocess] = None, formsCoprocess: Optional[MACoprocess] = None,
+                 projection: Optional[MAProjection] = None):
         """
         Provede vytvoření objektu Morfologického analyzátoru.
         Spustí nad všemy slovy z words morfologický analyzátor s parametry:
-            -F vrací všechny možné tvary.
+            -F vrací všechny možné tvary. (Vynechán při dvoufázové analýze, viz formsCoprocess.)
             -m Na výstup se vypíše flektivní analýza zadaného slova.
             -n Přidá poznámku.
         Výsledek si poté načte a bude sloužit jako databáze, která bude použita pro získávání informací
@@ -1051,30 +1836,141 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
             Pokud je předán set, platí nápověda pro všechny slova stejná. Pokud je předán Dict, tak pro každé slovo je jiná (klíč udává slovo pro nějž nápověda platí).
             Pozor pokud se daná morfologická kategorie vůbec v analýze slova nevyskytuj, pak je nápověda ignorována.
         :type hint: :Set[MorphCategory] | Dict[MorphCategory]
+        :param cache: Volitelné perzistentní úložiště analýz. Analyzátoru jsou předložena pouze slova, která v něm
+            nejsou, a jejich analýzy jsou do něj poté uloženy.
+            Při použití nápovědy (hint) se úložiště nepoužívá, jelikož nápověda mění výsledek analýzy.
+        :type cache: Optional[MACache]
+        :param workers: Počet souběžně běžících procesů ma, mezi které se rozdělí slova pro analýzu.
+        :type workers: int
+        :param coprocess: Volitelný běžící analyzátor, kterého se analyzátor dotazuje na slova, jenž nebyla předána
+            v parametru words.
+        :type coprocess: Optional[MACoprocess]
+        :param formsCoprocess: Pokud je uveden, provádí se dvoufázová analýza. Počáteční analýza získá pouze
+            značky slov (bez tvarů) a tvary jsou dotazovány až pomocí tohoto běžícího analyzátoru pro slova, která
+            je potřebují (viz :func:`~MorphoAnalyzerLibma.loadForms`).
+        :type formsCoprocess: Optional[MACoprocess]
+        :param projection: Volitelná projekce analýz. Značko pravidla a tvary, které neprojdou projekcí, jsou
+            zahozeny již při načítání výstupu analyzátoru. Pravidla z PROJECTION_TAG_FILTERS jsou zachována vždy.
+        :type projection: Optional[MAProjection]
         :raise MorphoAnalyzerException: Chyba analyzátoru.
         """
         self._hint = hint
+        self._projection = None if projection is None else projection.withTagFilters(self.PROJECTION_TAG_FILTERS)
+        self._workers = workers
+        self._formsCoprocess = formsCoprocess
+        self._maArgs = ["-m", "-n"] if formsCoprocess is not None else ["-F", "-m", "-n"]
         # vytvoříme novou prázdnou databázi slov
         self._wordDatabase = {}
+        # tabulky pravidel a tvarů sdílené skupinami tohoto analyzátoru
+        self._morphsPool = self.MorphsPool()
 
         self._pathToMa = pathToMa
 
         # získání informací o slovech
         words = list(words)
-        self.__commWithMA(words)
+
+        self._loadAnalyses(words, cache)
+
+        # slova, jejichž analýza z ma zatím neobsahuje tvary
+        self._withoutForms = set(self._wordDatabase) if formsCoprocess is not None else set()
 
         # Rozklad na třídy ekvivalence.
         # Ve formě dict.
         # Ekvivalence je typu: Bernstadt auf dem Eigen <->  Bernstadt a. d. Eigen
         # Tedy je ekvivalentní ke svým zkraceným formám.
         self._prepAbberEqClasses = {}
+        self._prepAbberClassIds = {}
+        self._prepAbberClasses = []
+        self._prepAbberClassOfName = {}
+        self._prepAbberPrepAtPos = {}
+        self._nameDependentAnalyses = {}
+
+        self._addPrepositions()
+        self._adjustAnalyses(words)
+
+        self._coprocess = coprocess
+        # slova, o kterých již víme, že je analyzátor nezná
+        self._notFound = set(w for w in words if w not in self._wordDatabase) if coprocess is not None else set()
+
+    def _loadAnalyses(self, words: List[str], cache: Optional[MACache]):
+        """
+        Získá analýzy počátečních slov a uloží je do databáze.
+
+        :param words: Slova pro analýzu.
+        :type words: List[str]
+        :param cache: Volitelné perzistentní úložiště analýz.
+        :type cache: Optional[MACache]
+        :raise MorphoAnalyzerException: Chyba analyzátoru.
+        """
+
+        if cache is not None and self._hint is None:
+            cachedAnalyses = cache.load()
+            unseenWords = []
+            for w in words:
+                try:
+                    if cachedAnalyses[w] is not None:
+                        for g in cachedAnalyses[w].groups:
+                            g.setPool(self._morphsPool)
+                        self._wordDatabase[w] = cachedAnalyses[w]
+                except KeyError:
+                    unseenWords.append(w)
+
+            logging.info("\tPočet slov s uloženou analýzou: " + str(len(words) - len(unseenWords)) +
+                         ", počet slov pro analyzátor: " + str(len(unseenWords)))
+
+            if len(unseenWords) > 0:
+                self.__analyzeWords(unseenWords)
+
+                # Uložíme ještě před dalšími úpravami databáze, které jsou prováděny až níže,
+                # aby úložiště obsahovalo pouze čistý výstup z analyzátoru.
+                for w in unseenWords:
+                    cachedAnalyses[w] = self._wordDatabase.get(w)
+                cache.save(cachedAnalyses)
+        else:
+            self.__analyzeWords(words)
+
+    def _addPrepositions(self, words: Optional[Set[str]] = None):
+        """
+        Přidá ke slovům z PREPOSITIONS_M (von, da, de, ...) analýzu, že se jedná o předložky, za nimiž se slova
+        ohýbají.
+
+        :param words: Pokud je uvedeno, přidá analýzu jen těm z nich, která jsou v této množině.
+        :type words: Optional[Set[str]]
+        """
+        for prep in self.PREPOSITIONS_M:
+            for w in [prep, prep.capitalize()]:  # generujeme variantu s velkým a malým písmenem na začátku
+                if words is not None and w not in words:
+                    continue
+                g = self.MAWordGroup(w, self._morphsPool)
+                g.lemma = w
+
+                g.addTagRule(POS.PREPOSITION_M.lntrf)
+                g.addMorph(POS.PREPOSITION_M.lntrf, w)
+                try:
+                    self._wordDatabase[w].addGroup(g)
+                except KeyError:
+                    # slovo zatím není v databázi
+                    self._wordDatabase[w] = self.MAWord()
+                    self._wordDatabase[w].addGroup(g)
+
+    def _adjustAnalyses(self, words):
+        """
+        Upraví analýzy daných slov z ma pro potřeby namegenu.
+            Přidá možnost zkratky ke slovům, která jí mohou být.
+            Slovo a ponechá pouze jako spojku.
+            Odstraní analýzy písmen jako podstatných jmen.
+
+        :param words: Slova jejichž analýzy se mají upravit.
+        :type words: Iterable[str]
+        """
+        words = set(words)
 
         for w in words:
             if len(w) >= 2 and w.isupper() or len(w) == 2 and w[-1] == ".":
                 # Určíme všechna slova obsahující pouze velká písmena, která jsou dlouhá alespoň dva znaky jako zkratku.
                 # a
                 # Všechna jednopísmenná slova zakončená tečku označíme za možnou zkratku.
-                g = self.MAWordGroup(w)
+                g = self.MAWordGroup(w, self._morphsPool)
                 g.lemma = w
 
                 g.addTagRule(POS.ABBREVIATION.lntrf)
@@ -1089,37 +1985,23 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
                     self._wordDatabase[w] = self.MAWord()
                     self._wordDatabase[w].addGroup(g)
 
-        # přidáme ke slovům von, da a de
-        # analýzu, že se jedná o předložky za nimiž se slova ohýbají
-        for prep in ["dalla", "de", "der", "da", "del", "di", "dos", "el", "la", "le", "van", "von", "und", "ben",
-                     "bin", "y", "zu"]:
-            for w in [prep, prep.capitalize()]:  # generujeme variantu s velkým a malým písmenem na začátku
-                g = self.MAWordGroup(w)
-                g.lemma = w
-
-                g.addTagRule(POS.PREPOSITION_M.lntrf)
-                g.addMorph(POS.PREPOSITION_M.lntrf, w)
-                try:
-                    self._wordDatabase[w].addGroup(g)
-                except KeyError:
-                    # slovo zatím není v databázi
-                    self._wordDatabase[w] = self.MAWord()
-                    self._wordDatabase[w].addGroup(g)
-
         # pro nás je a pouze spojka
-        try:
-            ma = self._wordDatabase["a"]
+        if "a" in words:
+            try:
+                ma = self._wordDatabase["a"]
 
-            delGroups = [group for group in ma.groups if group.rules[0][MorphCategories.POS] != POS.CONJUNCTION]
+                delGroups = [group for group in ma.groups if group.rules[0][MorphCategories.POS] != POS.CONJUNCTION]
 
-            for g in delGroups:
-                ma.delGroup(g)
+                for g in delGroups:
+                    ma.delGroup(g)
 
-        except KeyError:
-            pass
+            except KeyError:
+                pass
 
         # vynecháváme, protože v našem případě nemůžou být písmena podstatným jménem
         for c in string.ascii_letters:
+            if c not in words:
+                continue
             try:
                 ma = self._wordDatabase[c]
 
@@ -1130,130 +2012,252 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
             except KeyError:
                 pass
 
-    def __commWithMA(self, words):
+    def __analyzeWords(self, words):
+        """
+        Získá analýzy slov z ma a uloží je do databáze.
+        Slova rozdělí na části, které jsou analyzovány souběžně běžícími procesy ma
+        (jejich počet je dán parametrem workers). Výsledky jsou poté sloučeny do jedné databáze.
+
+        :param words: Slova pro analýzu
+        :type words: List[str]
+        :raise MorphoAnalyzerException: Chyba analyzátoru.
+        """
+
+        if self._workers <= 1 or len(words) < 2:
+            invocations, retriedWords = self.__commWithMA(words, self._wordDatabase)
+            logging.info("\tPočet spuštění ma: " + str(invocations) + ", počet znovu odeslaných slov: " +
+                         str(retriedWords))
+            return
+
+        partSize = math.ceil(len(words) / self._workers)
+        shards = [words[offset:offset + partSize] for offset in range(0, len(words), partSize)]
+        databases = [{} for _ in shards]
+
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            stats = list(executor.map(self.__commWithMA, shards, databases))
+
+        logging.info("\tPočet spuštění ma: " + str(sum(i for i, _ in stats)) + ", počet znovu odeslaných slov: " +
+                     str(sum(r for _, r in stats)))
+
+        for database in databases:
+            for word, wordAnalyze in database.items():
+                try:
+                    act = self._wordDatabase[word]
+                    for g in wordAnalyze.groups:
+                        act.addGroup(g)
+                except KeyError:
+                    self._wordDatabase[word] = wordAnalyze
+
+    def __commWithMA(self, words, database):
         """
         Pošle ma slova, která mají být analyzována.
 
+        Výstup ma je zpracováván průběžně, takže první dávka obsahuje všechna slova a ma je ve většině případů
+        spuštěn jen jednou. Následující dávky (pouze pokud ma na některá slova neodpoví) mají velikost odvozenou
+        od pozorované velikosti výstupu na jedno slovo tak, aby výstup jedné dávky odpovídal přibližně
+        BATCH_OUTPUT_SIZE znakům.
+        Pro každé slovo vypíše ma právě jedno ma>, takže víme přesně, na která slova odpověděl. Pokud ma na některá
+        slova neodpoví, jsou znovu poslána pouze tato slova a velikost dávky se zmenší. Slovo, na které ma neodpoví
+        ani samostatně, je vynecháno.
+
+        :param words: Slova pro analýzu
+        :type words:List[str]
+        :param database: Databáze, do které se mají ukládat analýzy.
+        :type database: Dict[str, MorphoAnalyzerLibma.MAWord]
+        :return: Počet spuštění ma a počet znovu odeslaných slov.
+        :rtype: Tuple[int, int]
+        :raise MorphoAnalyzerException: Chyba analyzátoru.
+        """
+
+        invocations = 0
+        retriedWords = 0
+
+        answeredTotal = 0  # počet slov, na která ma odpověděl
+        outputSizeTotal = 0  # velikost výstupu pro tato slova
+        maxBatchSize = len(words)
+
+        offset = 0
+        while offset < len(words):
+            batchSize = maxBatchSize if answeredTotal == 0 \
+                else max(1, int(self.BATCH_OUTPUT_SIZE * answeredTotal / outputSizeTotal))
+            batch = words[offset:offset + min(batchSize, maxBatchSize)]
+
+            answered, outputSize = self.__runMA(batch, database)
+            invocations += 1
+
+            if answered > len(batch):
+                # Více odpovědí než odeslaných slov, nevíme tedy, které analýzy patří ke kterým slovům.
+                logging.info("\tMa vrátil více odpovědí, než bylo odesláno slov (odesláno: " + str(len(batch)) +
+                             ", přijato: " + str(answered) + ").")
+                raise MorphoAnalyzerException(ErrorMessenger.CODE_MA_FAILURE)
+
+            answeredTotal += answered
+            outputSizeTotal += outputSize
+
+            if answered < len(batch):
+                # nemáme všechna slova
+                if len(batch) == 1:
+                    # Níž nelze. Vynecháme toto slovo. Není pravděpodobné, že by jedno slovo mělo tak příliš velký
+                    # výstup zřejmě se spíše jedná o nevhodné slovo pro ma. Jako je například slovo . (tečka).
+                    logging.info("\tMa neodpověděl na slovo: " + batch[0] + ". Slovo bude vynecháno.")
+                    answered = 1
+                else:
+                    maxBatchSize = max(1, len(batch) // 2)
+                    retriedWords += len(batch) - answered
+                    logging.info("\tPři komunikaci s ma došlo ke ztrátě slov (odesláno: " + str(len(batch)) +
+                                 ", přijato: " + str(answered) + "). Chybějící slova pošlu znovu s menší dávkou: " +
+                                 str(maxBatchSize) + ".")
+            else:
+                maxBatchSize = min(len(words), maxBatchSize * 2)
+
+            offset += answered
+
+        return invocations, retriedWords
+
+    def __runMA(self, words, database):
+        """
+        Spustí ma nad danými slovy.
+
         :param words: Slova pro analýzu
         :type words:List[str]
+        :param database: Databáze, do které se mají ukládat analýzy.
+        :type database: Dict[str, MorphoAnalyzerLibma.MAWord]
+        :return: Počet slov, na která ma odpověděl (jedná se vždy o prefix words), a velikost výstupu ve znacích.
+        :rtype: Tuple[int, int]
         :raise MorphoAnalyzerException: Chyba analyzátoru.
         """
 
-        p = Popen([self._pathToMa, "-F", "-m", "-n"], stdin=PIPE, stdout=PIPE, stderr=None)
+        p = Popen([self._pathToMa] + self._maArgs, stdin=PIPE, stdout=PIPE, stderr=None)
+
+        # Slova zapisujeme v samostatném vlákně, abychom mohli současně číst výstup a nedošlo k uváznutí na plných
+        # rourách. Výstup je zpracováván průběžně, takže jej nikdy nemáme v paměti celý.
+        feeder = threading.Thread(target=self._feedMA, args=(p.stdin, words), daemon=True)
+        feeder.start()
+
+        outputSize = 0
 
-        output, _ = p.communicate(str.encode(("\n".join(words)) + "\n"))  # vrací stdout a stderr
+        def lines(output):
+            nonlocal outputSize
+            for line in output:
+                outputSize += len(line)
+                yield line.rstrip("\r\n")
+
+        try:
+            with io.TextIOWrapper(p.stdout, encoding="utf-8") as output:
+                retWords = self._parseMaOutput(lines(output), database)
+        except MorphoAnalyzerException:
+            p.kill()
+            raise
+
+        feeder.join()
+        p.wait()
 
         # zkontrolujeme návratový kód
         if p.returncode != 0:
             # selhání analyzátoru
             raise MorphoAnalyzerException(ErrorMessenger.CODE_MA_FAILURE)
 
-        retWords = self._parseMaOutput(output.decode())
-
-        if retWords != len(words):
+        return retWords, outputSize
 
-            # nemáme všechna slova
-            # zřejmě byl pro komunikaci výstup příliš velký pokusíme se poslat méně slov
-            if len(words) == 1:
-                # Níž nelze. Vynecháme toto slovo. Není pravděpodobné, že by jedno slovo mělo tak příliš velký výstup
-                # zřejmě se spíše jedná o nevhodné slovo pro ma. Jako je například slovo . (tečka).
-                return
-
-            origCnt = len(words)
-            words = words[retWords:]  # zbavíme se již zpracovaných
+    @staticmethod
+    def _feedMA(stdin, words):
+        """
+        Zapíše slova na vstup analyzátoru a poté vstup uzavře.
 
-            partSize = math.ceil(len(words) / 2)
-            logging.info("\tPři komunikaci s ma došlo ke ztrátě slov (odesláno: " + str(origCnt) + ", přijato: " + str(
-                retWords) + "). Pokusím se o komunikaci znovu s menším počtem slov: " +
-                         str(origCnt) + " -> " + str(partSize) + ".")
-            for offset in range(0, len(words), partSize):
-                self.__commWithMA(words[offset:offset + partSize])
+        :param stdin: Vstup analyzátoru.
+        :type stdin: BinaryIO
+        :param words: Slova pro analýzu.
+        :type words: List[str]
+        """
+        try:
+            for w in words:
+                stdin.write(str.encode(w + "\n"))
+            stdin.close()
+        except BrokenPipeError:
+            # Analyzátor skončil dříve, než přečetl celý vstup. Chybu zjistíme z návratového kódu.
+            pass
 
-    def _parseMaOutput(self, output):
+    def _parseMaOutput(self, output, database: Optional[Dict[str, "MorphoAnalyzerLibma.MAWord"]] = None):
         """
         Provede analýzu výstupu z ma a uloží získané informace do databáze.
 
-        :param output: Výstup z analyzátoru.
-        :type output: str
-        :return: Počet získaných slov. (i nezpracovaných ma>--not found)
+        :param output: Výstup z analyzátoru. Buď celý jako řetězec, nebo jako iterovatelný objekt s jednotlivými
+            řádky (bez znaku konce řádku), který je zpracováván průběžně.
+        :type output: str | Iterable[str]
+        :param database: Databáze, do které se mají ukládat analýzy. Pokud je None, použije se databáze tohoto
+            analyzátoru.
+        :type database: Optional[Dict[str, MorphoAnalyzerLibma.MAWord]]
+        :return: Počet slov, na která ma odpověděl. (i nezpracovaných ma>--not found)
+            Pro každé slovo je na výstupu právě jedno ma>.
         :rtype: int
         :raise MorphoAnalyzerException: Pokud se nepodaří analyzovat vstup.
         """
 
-        actWordGroup = None  # obsahuje data k aktuálně parsované skupině
-        cntUnWords = 0
-        wordsInDBAtStart = len(self._wordDatabase)
-        for lineNumber, line in enumerate(output.splitlines()):
-            try:
-                if line == "ma>--not found":
-                    # máme další slovo, ale nezpracované
-                    cntUnWords += 1
-                    continue
+        if database is None:
+            database = self._wordDatabase
 
-                # rozdělení řádku
-                parts = line.strip().split()
-                if parts[0][-3:] == "<s>":
-                    # začínáme číst novou skupinu slova
-                    # <s> vstupní slovo (vzor 1)
+        reader = MAOutputReader(output)
+        for record in reader:
+            self._addGroupRecord(record, database)
 
-                    # byla předešlá skupina k něčemu dobrá?
-                    if actWordGroup is not None and len(actWordGroup.rules) == 0:
-                        # ne nebyla, tak ji odstraníme
-                        self._wordDatabase[actWordGroup.word].delGroup(actWordGroup)
+        return reader.answered
 
-                    # vytvoříme skupinu
-                    actWordGroup = self.MAWordGroup(parts[1])
-
-                    try:
-                        # vložíme skupinu do analýzy slova
-                        self._wordDatabase[parts[1]].addGroup(actWordGroup)
-                    except KeyError:
-                        # nové slovo
-                        # vytvoříme objekt pro uložení morfologické analýzy slova
-                        self._wordDatabase[parts[1]] = self.MAWord()
-                        # a znovu vložíme
-                        self._wordDatabase[parts[1]].addGroup(actWordGroup)
-
-                elif parts[0][:3] == "<c>":
-                    # značko pravidlo, které sedí pro dané slovo
-
-                    if isinstance(self._hint, dict) or isinstance(self._hint, set):
-                        # aplikujeme nápovědu
-                        convRule = self.MAWordGroup.convTagRule(parts[0][3:])
-
-                        hint = self._hint[actWordGroup.word] if isinstance(self._hint, dict) else self._hint
-                        if all(f.category() not in convRule or convRule[f.category()] == f for f in hint):
-                            actWordGroup.addTagRuleConv(convRule)
-                    else:
-                        actWordGroup.addTagRule(parts[0][3:])
-                elif parts[0][:3] == "<l>":
-                    # lemma slova
-                    if parts[0][3:][0].islower():
-                        # malé první písmeno u lematu
-                        # nastavujeme jako obecné slovo
-                        # pokud se dále ukáže, že má tato skupina poznámku, pak bude
-                        # tento flag odstraněn samotným objektem třídy MAWordGroup.
-                        actWordGroup.addFlag(Flag.GENERAL_WORD)
+    def _addGroupRecord(self, record: MAGroupRecord, database: Dict[str, "MorphoAnalyzerLibma.MAWord"]):
+        """
+        Vytvoří z nezpracované skupiny z výstupu ma skupinu a vloží ji do databáze.
+        Aplikuje přitom nápovědu a projekci. Skupina, které nezůstane žádné značko pravidlo, je vynechána,
+        ale slovo je i tak v databázi uvedeno.
+
+        :param record: Nezpracovaná skupina.
+        :type record: MAGroupRecord
+        :param database: Databáze, do které se má skupina uložit.
+        :type database: Dict[str, MorphoAnalyzerLibma.MAWord]
+        """
 
-                elif parts[0][:3] == "<f>":
-                    # Přidání tvaru slova
-                    # pouze pokud je relevantní k znočko pravidlům, které sedí na dané slovo.
-                    # Tento požadavek si můžeme dovolit, jelikoř v tuto dobu by měly být zpracovány
-                    # všechny <c> řádky.
+        try:
+            wordAnalyze = database[record.word]
+        except KeyError:
+            # nové slovo
+            # vytvoříme objekt pro uložení morfologické analýzy slova
+            wordAnalyze = self.MAWord()
+            database[record.word] = wordAnalyze
+
+        group = self.MAWordGroup(record.word, self._morphsPool)
+
+        if record.generalWord:
+            # malé první písmeno u lematu
+            # nastavujeme jako obecné slovo
+            # pokud se dále ukáže, že má tato skupina poznámku, pak bude
+            # tento flag odstraněn samotným objektem třídy MAWordGroup.
+            group.addFlag(Flag.GENERAL_WORD)
+
+        if isinstance(self._hint, dict) or isinstance(self._hint, set):
+            # aplikujeme nápovědu
+            hint = self._hint[record.word] if isinstance(self._hint, dict) else self._hint
+            for tagRule in record.tags:
+                convRule = self.MAWordGroup.convTagRule(tagRule)
+                if all(f.category() not in convRule or convRule[f.category()] == f for f in hint):
+                    group.addTagRuleConv(convRule)
+        else:
+            for tagRule in record.tags:
+                group.addTagRule(tagRule)
 
-                    actWordGroup.addMorph((parts[0][3:])[1:-1], parts[1], True)
+        projection = None if self._projection is None else self._projection.forWord(record.word)
 
-            except IndexError:
-                raise MorphoAnalyzerException(ErrorMessenger.CODE_MA_CAN_NOT_READ_OUTPUT,
-                                              ErrorMessenger.getMessage(ErrorMessenger.CODE_MA_CAN_NOT_READ_OUTPUT)
-                                              .format(lineNumber) + "\n\t" + line)
+        # Přidání tvarů slova
+        # pouze pokud jsou relevantní k značko pravidlům, které sedí na dané slovo.
+        for tagRule, form in record.forms:
+            if projection is None or projection.formRuleFits(self.MAWordGroup.convTagRule(tagRule)):
+                group.addMorph(tagRule, form, True)
 
-        # byla předešlá skupina k něčemu dobrá?
-        if actWordGroup is not None and len(actWordGroup.rules) == 0:
-            # nebyla
-            self._wordDatabase[actWordGroup.word].delGroup(actWordGroup)
+        if projection is not None:
+            # Pravidla promítáme až po načtení celé skupiny, aby byla relevance tvarů posuzována
+            # vůči všem jejím pravidlům.
+            group.retainTagRules(projection.tagRuleFits)
 
-        return cntUnWords + len(self._wordDatabase) - wordsInDBAtStart
+        # je skupina k něčemu dobrá?
+        if len(group.rules) > 0:
+            wordAnalyze.addGroup(group)
 
     def isNameDependant(self, word: str, name) -> bool:
         """
@@ -1268,9 +2272,98 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
         :rtype: bool
         """
 
-        return EQRelationForPrepAndItsAbbre(name) in self._prepAbberEqClasses and \
+        return self._prepAbberClassOf(name) is not None and \
             POS.ABBREVIATION in self._wordDatabase[word].getAllForCategory(MorphCategories.POS)
 
+    def analysisKey(self, word: str, name=None, wordPos: Optional[int] = None) -> Optional[Hashable]:
+        """
+        Získání klíče analýzy slova. Analýza nezávislá na jméně je určena samotným slovem, analýza závislá
+        na jméně navíc třídou ekvivalence jména a pozicí slova (viz analyze).
+
+        :param word: slovo pro analýzu
+        :type word: str
+        :param name: Pokud je tento parametr neprázdný pak vrací klíč analýzy slova závislé na předaném jménu.
+        :type name: Optional[Name]
+        :param wordPos: Pozice slova ve jméně.
+        :type wordPos: Optional[int]
+        :return: Klíč analýzy slova. None pokud slovo nemá analýzu.
+        :rtype: Optional[Hashable]
+        :raise MorphoAnalyzerException: Chyba běžícího analyzátoru při dotazu na neznámé slovo.
+        """
+
+        if self.analyze(word, name, wordPos) is None:
+            return None
+
+        if name is not None and self.isNameDependant(word, name):
+            return word, self._prepAbberClassOf(name), wordPos
+
+        return word,
+
+    def close(self):
+        """
+        Ukončí běžící procesy analyzátoru (viz coprocess a formsCoprocess).
+        """
+        for coprocess in {id(c): c for c in (self._coprocess, self._formsCoprocess) if c is not None}.values():
+            coprocess.close()
+
+        self._coprocess = None
+        self._formsCoprocess = None
+
+    def lookup(self, word: str):
+        """
+        Dotáže se běžícího analyzátoru na slovo, které není v databázi, a jeho analýzu do ní uloží.
+
+        :param word: Slovo pro analýzu.
+        :type word: str
+        :return: Analýza slova. None pokud ji analyzátor nezná nebo analyzátor nemá k dispozici běžící proces.
+        :rtype: Optional[MAWord]
+        :raise MorphoAnalyzerException: Chyba analyzátoru.
+        """
+
+        if self._coprocess is None:
+            return None
+
+        self._parseMaOutput(self._coprocess.request([word]))
+        self._adjustAnalyses([word])
+
+        try:
+            return self._wordDatabase[word]
+        except KeyError:
+            self._notFound.add(word)
+            return None
+
+    def loadForms(self, words: Iterable[str]):
+        """
+        Při dvoufázové analýze dotáže běžící analyzátor na tvary daných slov, pokud je ještě nemají.
+        Jejich dosavadní analýzy (pouze se značkami) jsou nahrazeny úplnými.
+
+        :param words: Slova, pro která budou potřeba tvary.
+        :type words: Iterable[str]
+        :raise MorphoAnalyzerException: Chyba analyzátoru.
+        """
+
+        if self._formsCoprocess is None:
+            return
+
+        words = set(w for w in words if w in self._withoutForms)
+        if len(words) == 0:
+            return
+
+        database = {}
+        self._parseMaOutput(self._formsCoprocess.request(sorted(words)), database)
+        self._withoutForms -= words
+
+        for w, wordAnalyze in database.items():
+            if w in words:
+                self._wordDatabase[w] = wordAnalyze
+
+        for w in words:
+            # na jméně závislé analýzy vychází z nahrazených analýz
+            self._nameDependentAnalyses.pop(w, None)
+
+        self._addPrepositions(words)
+        self._adjustAnalyses(words)
+
     def analyze(self, word, name=None, wordPos: Optional[int] = None):
         """
         Získání kompletních znalostí o slově. Slovo by mělo být
@@ -1286,26 +2379,35 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
         :rtype: MAWord
         :raise ValueError: Může někdy hodit tuto vyjímku pokud není dané slovo v poskytnutém jméně, je-li ovšem jméno
             vůbec poskytnuto.
+        :raise MorphoAnalyzerException: Chyba běžícího analyzátoru při dotazu na neznámé slovo.
         """
 
         try:
             wordAnalyze = self._wordDatabase[word]
         except KeyError:
-            return None
+            if word in self._notFound:
+                return None
+            wordAnalyze = self.lookup(word)
+            if wordAnalyze is None:
+                return None
 
         if name is not None:
-            eqR = EQRelationForPrepAndItsAbbre(name)
+            classId = self._prepAbberClassOf(name)
 
-            if eqR in self._prepAbberEqClasses and \
+            if classId is not None and \
                     POS.ABBREVIATION in self._wordDatabase[word].getAllForCategory(MorphCategories.POS):
                 # Máme na jménu závislou analýzu pro toto slovo.
 
+                # Analýza závisí pouze na třídě a pozici slova, takže ji pro ně vytváříme jen jednou.
+                try:
+                    return self._nameDependentAnalyses[word][(classId, wordPos)]
+                except KeyError:
+                    pass
+
                 # Budeme zkoušet zdali neexistuje prvek v ekv. třídě,
                 # který má slovo na stejné pozici a je předložkou.
 
-                if wordPos is not None and \
-                        any((POS.PREPOSITION in self._wordDatabase[str(n[wordPos])].getAllForCategory(MorphCategories.POS))
-                            for n in self._prepAbberEqClasses[eqR]):
+                if wordPos is not None and self._prepAbberPrepositionAt(classId, wordPos):
                     # Vytvoříme se prázdnou novou analýzu slova, protože jsme si na základě získaného kontextu
                     # jistější o tom, že je to zkratka předložky a jiné možnosti tedy zamítneme.
                     wordAnalyze = self.MAWord()
@@ -1314,7 +2416,7 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
                     wordAnalyze = copy(wordAnalyze)
 
                 # Přidáme možnost ke zkratkám, že se může jednat o zkratku předložky.
-                g = self.MAWordGroup(word)
+                g = self.MAWordGroup(word, self._morphsPool)
                 g.lemma = word
 
                 g.addTagRule(POS.PREPOSITION_ABBREVIATION.lntrf)
@@ -1322,4 +2424,119 @@ class MorphoAnalyzerLibma(MorphoAnalyzer):
 
                 wordAnalyze.addGroup(g)
 
+                try:
+                    self._nameDependentAnalyses[word][(classId, wordPos)] = wordAnalyze
+                except KeyError:
+                    self._nameDependentAnalyses[word] = {(classId, wordPos): wordAnalyze}
+
         return wordAnalyze
+
+
+class MorphoAnalyzerInProcess(MorphoAnalyzerLibma):
+    """
+    Morfologický analyzátor, který nespouští ma, ale skupiny analýz slov získává přímo v rámci procesu
+    (viz :func:`~MorphoAnalyzerInProcess._records`). Skupiny jsou zpracovány stejně jako výstup z ma
+    (nápověda, projekce, úpravy pro namegen).
+
+    Zdroj je dotazován i na slova, která nebyla předána při inicializaci.
+    """
+
+    def __init__(self, words, hint=None, projection: Optional[MAProjection] = None):
+        """
+        Provede vytvoření objektu Morfologického analyzátoru a načte analýzy daných slov.
+
+        :param words: Slova, jejichž analýzy mají být načteny hned.
+        :type words: set(str)
+        :param hint: Nápověda k hodnotě morfologické kategorie slova.
+            Viz :func:`~MorphoAnalyzerLibma.__init__`.
+        :type hint: :Set[MorphCategory] | Dict[MorphCategory]
+        :param projection: Volitelná projekce analýz.
+        :type projection: Optional[MAProjection]
+        """
+        words = list(words)
+
+        super().__init__(None, words, hint=hint, projection=projection)
+
+        # slova, o kterých již víme, že je zdroj nezná
+        self._notFound = set(w for w in words if w not in self._wordDatabase)
+
+    @abstractmethod
+    def _records(self, word: str) -> Optional[List[MAGroupRecord]]:
+        """
+        Získá nezpracované skupiny analýzy slova.
+
+        :param word: Slovo pro analýzu.
+        :type word: str
+        :return: Skupiny analýzy slova. None pokud slovo není známo.
+        :rtype: Optional[List[MAGroupRecord]]
+        """
+        pass
+
+    def _loadAnalyses(self, words: List[str], cache: Optional[MACache]):
+        """
+        Načte analýzy počátečních slov a uloží je do databáze.
+
+        :param words: Slova pro analýzu.
+        :type words: List[str]
+        :param cache: Nepoužívá se, analýzy jsou dostupné přímo.
+        :type cache: Optional[MACache]
+        """
+
+        for w in words:
+            for record in self._records(w) or []:
+                self._addGroupRecord(record, self._wordDatabase)
+
+    def lookup(self, word: str):
+        """
+        Načte analýzu slova, které není v databázi, a uloží ji do ní.
+
+        :param word: Slovo pro analýzu.
+        :type word: str
+        :return: Analýza slova. None pokud ji zdroj nezná.
+        :rtype: Optional[MAWord]
+        """
+
+        for record in self._records(word) or []:
+            self._addGroupRecord(record, self._wordDatabase)
+        self._adjustAnalyses([word])
+
+        try:
+            return self._wordDatabase[word]
+        except KeyError:
+            self._notFound.add(word)
+            return None
+
+
+class MorphoAnalyzerPython(MorphoAnalyzerInProcess):
+    """
+    Morfologický analyzátor dostupný jako python modul, který běží přímo v procesu namegenu.
+
+    Modul musí poskytovat funkci:
+        analyze(word: str) -> Optional[List[Tuple[str, str, List[str], List[Tuple[str, str]]]]]
+    která pro slovo vrací skupiny jako čtveřice (slovo, lemma, značko pravidla, tvary), kde tvary jsou dvojice
+    (značko pravidlo, tvar), nebo None pokud slovo nezná. Odpovídá tedy výstupu ma -F -m -n.
+    """
+
+    def __init__(self, module, words, hint=None, projection: Optional[MAProjection] = None):
+        """
+        Provede vytvoření objektu Morfologického analyzátoru a načte analýzy daných slov.
+
+        :param module: Modul s analyzátorem.
+        :type module: ModuleType
+        :param words: Slova, jejichž analýzy mají být načteny hned.
+        :type words: set(str)
+        :param hint: Nápověda k hodnotě morfologické kategorie slova.
+            Viz :func:`~MorphoAnalyzerLibma.__init__`.
+        :type hint: :Set[MorphCategory] | Dict[MorphCategory]
+        :param projection: Volitelná projekce analýz.
+        :type projection: Optional[MAProjection]
+        """
+        self._module = module
+        super().__init__(words, hint=hint, projection=projection)
+
+    def _records(self, word: str) -> Optional[List[MAGroupRecord]]:
+        groups = self._module.analyze(word)
+        if groups is None:
+            return None
+
+        return [MAGroupRecord(w, lemma[:1].islower(), list(tags), list(forms)) for w, lemma, tags, forms in groups]